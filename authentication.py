@@ -10,7 +10,7 @@ creator of this message.
 @contact: dispersy@frayja.com
 """
 
-from abc import ABCMeta, abstractproperty
+from abc import ABCMeta, abstractmethod, abstractproperty
 from .meta import MetaObject
 
 
@@ -36,10 +36,38 @@ class Authentication(MetaObject):
             """
             pass
 
+        @property
+        def empty_signature(self):
+            """
+            The \\x00 bytes that take the place of the signature(s) in a packet that is not yet signed.
+            @rtype: string
+            """
+            return ""
+
         def setup(self, message_impl):
             from .message import Message
             assert isinstance(message_impl, Message.Implementation)
 
+        @abstractmethod
+        def get_signature_checks(self, packet, allow_empty_signature=False):
+            """
+            Returns the signatures that must be verified to accept PACKET.
+
+            Unlike has_valid_signature_for, the signatures are not verified.  This allows the caller
+            to verify them elsewhere, i.e. on a VerificationPool.
+
+            @param packet: The binary packet that this authentication was decoded from.
+            @type packet: string
+
+            @param allow_empty_signature: When True, empty signatures are accepted without verification.
+            @type allow_empty_signature: bool
+
+            @return: A list with (Member, data, signature) tuples, or None when the packet can never
+                     have a valid signature.
+            @rtype: list or None
+            """
+            pass
+
     def setup(self, message):
         """
         Setup the Authentication meta part.
@@ -79,6 +107,9 @@ class NoAuthentication(Authentication):
         def has_valid_signature_for(self, placeholder, payload):
             return True
 
+        def get_signature_checks(self, packet, allow_empty_signature=False):
+            return []
+
 
 class MemberAuthentication(Authentication):
 
@@ -146,16 +177,33 @@ class MemberAuthentication(Authentication):
         def is_signed(self):
             return bool(self._signature)
 
+        @property
+        def empty_signature(self):
+            return "\x00" * self._member.signature_length
+
         def sign(self, payload):
             if self._is_sig_empty():
                 self._signature = self._member.sign(payload)
             return self._signature
 
+        def set_signature(self, signature):
+            """
+            Sets the signature that was made elsewhere, i.e. by the SigningService.
+            """
+            assert isinstance(signature, str), type(signature)
+            assert len(signature) == self._member.signature_length, len(signature)
+            self._signature = signature
+
         def has_valid_signature_for(self, placeholder, payload):
             if placeholder.allow_empty_signature and self._is_sig_empty():
                 return True
             return self._member.verify(payload, self._signature)
 
+        def get_signature_checks(self, packet, allow_empty_signature=False):
+            if allow_empty_signature and self._is_sig_empty():
+                return []
+            return [(self._member, packet[:len(packet) - self._member.signature_length], self._signature)]
+
         def _is_sig_empty(self):
             return self._signature == "" or self._signature == "\x00" * self._member.signature_length
 
@@ -314,6 +362,10 @@ class DoubleMemberAuthentication(Authentication):
         def is_signed(self):
             return all(not self._is_sig_empty(signature, member) for signature, member in zip(self._signatures, self._members))
 
+        @property
+        def empty_signature(self):
+            return "".join("\x00" * member.signature_length for member in self._members)
+
         def sign(self, payload):
             payloads = self._meta.split_payload_func(payload)
             for i, signature in enumerate(self._signatures):
@@ -325,7 +377,8 @@ class DoubleMemberAuthentication(Authentication):
             return "".join(self._signatures)
 
         def has_valid_signature_for(self, placeholder, payload):
-            payloads = self._meta.split_payload_func(payload)
+            # split_payload_func expects a str, while PAYLOAD may be a buffer
+            payloads = self._meta.split_payload_func(str(payload))
             for signature, member, payload in zip(self._signatures, self._members, payloads):
                 if self._is_sig_empty(signature, member):
                     if not placeholder.allow_empty_signature:
@@ -334,6 +387,18 @@ class DoubleMemberAuthentication(Authentication):
                     return False
             return True
 
+        def get_signature_checks(self, packet, allow_empty_signature=False):
+            first_signature_offset = len(packet) - sum(member.signature_length for member in self._members)
+            payloads = self._meta.split_payload_func(packet[:first_signature_offset])
+            checks = []
+            for signature, member, payload in zip(self._signatures, self._members, payloads):
+                if self._is_sig_empty(signature, member):
+                    if not allow_empty_signature:
+                        return None
+                else:
+                    checks.append((member, payload, signature))
+            return checks
+
         def _is_sig_empty(self, signature, member):
             return signature == "" or signature == "\x00" * member.signature_length
 
@@ -24,15 +24,32 @@ assert isinstance(CANDIDATE_INTRO_LIFETIME, float)
 assert isinstance(CANDIDATE_LIFETIME, float)
 
 
+def intern_address(address, *others):
+    """
+    Returns an address equal to ADDRESS, using the host string from the interned strings.
+
+    When one of OTHERS is equal to ADDRESS it is returned instead, allowing candidates to share a single tuple for
+    their sock_addr, lan_address, and wan_address.
+    """
+    for other in others:
+        if other == address:
+            return other
+    host, port = address
+    return (intern(host), port) if type(host) is str else address
+
+
 class Candidate(object):
 
+    # trackers keep tens of thousands of candidates, slots avoid a __dict__ for each of them
+    __slots__ = ("_logger", "_sock_addr", "_tunnel", "_association")
+
     def __init__(self, sock_addr, tunnel):
         assert self.is_valid_address(sock_addr), sock_addr
         assert isinstance(tunnel, bool), type(tunnel)
         super(Candidate, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
 
-        self._sock_addr = sock_addr
+        self._sock_addr = intern_address(sock_addr)
         self._tunnel = tunnel
 
         # Member instances that this Candidate is associated with
@@ -122,6 +139,9 @@ class WalkCandidate(Candidate):
       after the introduction-response message (talking about the candidate) was received.
     """
 
+    __slots__ = ("_lan_address", "_wan_address", "_connection_type", "_last_walk_reply", "_last_walk",
+                 "_last_stumble", "_last_intro", "_last_discovered", "_global_time", "_candidate_store")
+
     def __init__(self, sock_addr, tunnel, lan_address, wan_address, connection_type):
         assert is_valid_address(sock_addr), sock_addr
         assert isinstance(tunnel, bool), type(tunnel)
@@ -130,8 +150,8 @@ class WalkCandidate(Candidate):
         assert isinstance(connection_type, unicode) and connection_type in (u"unknown", u"public", u"symmetric-NAT")
 
         super(WalkCandidate, self).__init__(sock_addr, tunnel)
-        self._lan_address = lan_address
-        self._wan_address = wan_address
+        self._lan_address = intern_address(lan_address, self._sock_addr)
+        self._wan_address = intern_address(wan_address, self._sock_addr, self._lan_address)
         self._connection_type = connection_type
 
         # properties to determine the category
@@ -144,6 +164,9 @@ class WalkCandidate(Candidate):
         # the highest global time that one of the walks reported from this Candidate
         self._global_time = 0
 
+        # the CandidateStore that must be notified when the timestamps change
+        self._candidate_store = None
+
         if __debug__:
             if not (self.sock_addr == self._lan_address or self.sock_addr == self._wan_address):
                 self._logger.error("Either LAN %s or the WAN %s should be SOCK_ADDR %s",
@@ -172,6 +195,11 @@ class WalkCandidate(Candidate):
             self._last_stumble = max(self._last_stumble, other._last_stumble)
             self._last_intro = max(self._last_intro, other._last_intro)
             self._global_time = max(self._global_time, other._global_time)
+            self._timestamps_changed()
+
+    def _timestamps_changed(self):
+        if self._candidate_store is not None:
+            self._candidate_store.candidate_changed(self)
 
     @property
     def global_time(self):
@@ -259,12 +287,26 @@ class WalkCandidate(Candidate):
 
         return None
 
+    def get_category_deadline(self, category):
+        """
+        Returns the time at which CATEGORY, as returned by get_category, ends.
+        """
+        if category == u"walk":
+            return self._last_walk_reply + CANDIDATE_WALK_LIFETIME
+        if category == u"stumble":
+            return self._last_stumble + CANDIDATE_STUMBLE_LIFETIME
+        if category == u"intro":
+            return self._last_intro + CANDIDATE_INTRO_LIFETIME
+        assert category == u"discovered", category
+        return self._last_discovered + CANDIDATE_DISCOVERED_LIFETIME
+
     def walk(self, now):
         """
         Called when we are about to send an introduction-request to this candidate.
         """
         assert isinstance(now, float), type(now)
         self._last_walk = now
+        self._timestamps_changed()
 
     def walk_response(self, now):
         """
@@ -273,6 +315,7 @@ class WalkCandidate(Candidate):
         assert isinstance(now, float), type(now)
         assert now == -1.0 or self._last_walk_reply <= now, self._last_walk_reply
         self._last_walk_reply = now
+        self._timestamps_changed()
 
     def stumble(self, now):
         """
@@ -280,6 +323,7 @@ class WalkCandidate(Candidate):
         """
         assert isinstance(now, float), type(now)
         self._last_stumble = now
+        self._timestamps_changed()
 
     def intro(self, now):
         """
@@ -287,6 +331,7 @@ class WalkCandidate(Candidate):
         """
         assert isinstance(now, float), type(now)
         self._last_intro = now
+        self._timestamps_changed()
 
     def discovered(self, now):
         """
@@ -294,6 +339,7 @@ class WalkCandidate(Candidate):
         """
         assert isinstance(now, float), type(now)
         self._last_discovered = now
+        self._timestamps_changed()
 
     def update(self, tunnel, lan_address, wan_address, connection_type):
         assert isinstance(tunnel, bool), tunnel
@@ -303,9 +349,9 @@ class WalkCandidate(Candidate):
         assert connection_type in (u"unknown", u"public", "symmetric-NAT"), connection_type
         self._tunnel = tunnel
         if lan_address != ("0.0.0.0", 0):
-            self._lan_address = lan_address
+            self._lan_address = intern_address(lan_address, self._sock_addr, self._lan_address)
         if wan_address != ("0.0.0.0", 0):
-            self._wan_address = wan_address
+            self._wan_address = intern_address(wan_address, self._sock_addr, self._lan_address, self._wan_address)
         # someone can also reset from a known connection_type to unknown (i.e. it now believes it is
         # no longer public nor symmetric NAT)
         self._connection_type = u"public" if connection_type == u"unknown" and lan_address == wan_address else connection_type
@@ -326,6 +372,7 @@ class WalkCandidate(Candidate):
 
 
 class LoopbackCandidate(Candidate):
+    __slots__ = ()
     __loopback_sock_addr = ("localhost", 0)
 
     def __init__(self):
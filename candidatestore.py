@@ -0,0 +1,260 @@
+"""
+This module provides the CandidateStore, the sock_addr:WalkCandidate dictionary that a Community uses to keep track of
+its candidates.
+
+The walker frequently needs the candidates in certain categories, or the least recently used candidate of each
+category.  Instead of calling WalkCandidate.get_category on every candidate, the store keeps the candidates grouped by
+category.  A WalkCandidate notifies its store when its timestamps change, its category is recomputed the next time the
+store is used.  Every category ends at a known deadline, these deadlines are kept in a heap such that a candidate is
+only moved to another category once its current category has expired.
+
+Walk candidates are selected using two heaps for each category: candidates that are not yet eligible for a walk,
+ordered by the time at which they become eligible, and eligible candidates, ordered by the timestamp of their category.
+Heap entries are invalidated by giving the candidate a new version when its category is recomputed, invalid entries
+are discarded once they reach the top of the heap.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from heapq import heapify, heappop, heappush
+from itertools import count
+from operator import attrgetter
+from time import time
+
+from .candidate import CANDIDATE_ELIGIBLE_DELAY, WalkCandidate
+
+
+# the categories in which a candidate can be selected, in the order used by get_walk_candidates
+CATEGORIES = (u"walk", u"stumble", u"intro", u"discovered")
+
+# the timestamp that orders the candidates within each category, the least recent candidate is walked first
+_CATEGORY_TIMESTAMPS = {u"walk": attrgetter("last_walk"),
+                        u"stumble": attrgetter("last_stumble"),
+                        u"intro": attrgetter("last_intro"),
+                        u"discovered": attrgetter("last_discovered")}
+
+
+def _iter_heap(heap, limit):
+    """
+    Yields the entries of HEAP that are smaller than or equal to LIMIT, without modifying HEAP.
+
+    Only the entries that are yielded and their direct children are visited.
+    """
+    indexes = [0]
+    while indexes:
+        index = indexes.pop()
+        if index < len(heap) and heap[index][0] <= limit:
+            yield heap[index]
+            indexes.extend((2 * index + 1, 2 * index + 2))
+
+
+class CandidateStore(OrderedDict):
+
+    def __init__(self, *args, **kargs):
+        self._reset()
+        super(CandidateStore, self).__init__(*args, **kargs)
+
+    def _reset(self):
+        # sock_addr:sequence-number and sequence-number:sock_addr pairs, the sequence numbers follow the insertion order
+        self._sequence_numbers = {}
+        self._sock_addrs = {}
+        self._next_sequence_number = count()
+        # sock_addrs of the candidates whose timestamps changed since their category was determined
+        self._dirty = set()
+        # sock_addr:(category, version) pairs
+        self._categories = {}
+        self._next_version = count()
+        # category:[sequence-number] sorted lists, the None category contains the obsolete candidates
+        self._members = dict((category, []) for category in CATEGORIES + (None,))
+        # (deadline, version, sock_addr) heap
+        self._deadlines = []
+        # category:[(eligible-at, version, sock_addr)] and category:[(timestamp, version, sock_addr)] heaps
+        self._waiting = dict((category, []) for category in CATEGORIES)
+        self._eligible = dict((category, []) for category in CATEGORIES)
+
+    def __setitem__(self, sock_addr, candidate, *args, **kargs):
+        assert isinstance(candidate, WalkCandidate), type(candidate)
+        previous = self.get(sock_addr)
+        if previous is not None and previous is not candidate:
+            self._detach(previous)
+
+        OrderedDict.__setitem__(self, sock_addr, candidate, *args, **kargs)
+        if sock_addr not in self._sequence_numbers:
+            sequence_number = next(self._next_sequence_number)
+            self._sequence_numbers[sock_addr] = sequence_number
+            self._sock_addrs[sequence_number] = sock_addr
+
+        candidate._candidate_store = self
+        self._dirty.add(sock_addr)
+
+    def __delitem__(self, sock_addr, *args, **kargs):
+        candidate = self[sock_addr]
+        OrderedDict.__delitem__(self, sock_addr, *args, **kargs)
+        self._detach(candidate)
+        self._unindex(sock_addr)
+        self._dirty.discard(sock_addr)
+        del self._sock_addrs[self._sequence_numbers.pop(sock_addr)]
+
+    def clear(self):
+        for candidate in self.itervalues():
+            self._detach(candidate)
+        OrderedDict.clear(self)
+        self._reset()
+
+    def _detach(self, candidate):
+        if candidate._candidate_store is self:
+            candidate._candidate_store = None
+
+    def candidate_changed(self, candidate):
+        """
+        Called by CANDIDATE when its timestamps changed.
+        """
+        if self.get(candidate.sock_addr) is candidate:
+            self._dirty.add(candidate.sock_addr)
+
+    def _is_valid(self, entry):
+        return self._categories.get(entry[2], (None, None))[1] == entry[1]
+
+    def _push(self, heap, entry):
+        heappush(heap, entry)
+
+        # discard the invalid entries once they outnumber the candidates
+        if len(heap) > 2 * len(self) + 64:
+            heap[:] = [entry for entry in heap if self._is_valid(entry)]
+            heapify(heap)
+
+    def _unindex(self, sock_addr):
+        category, _ = self._categories.pop(sock_addr, (None, None))
+        if sock_addr in self._sequence_numbers:
+            members = self._members[category]
+            index = bisect_left(members, self._sequence_numbers[sock_addr])
+            if index < len(members) and members[index] == self._sequence_numbers[sock_addr]:
+                del members[index]
+
+    def _index(self, sock_addr, now):
+        candidate = self[sock_addr]
+        category = candidate.get_category(now)
+
+        previous = self._categories.get(sock_addr)
+        if previous is None or previous[0] != category:
+            self._unindex(sock_addr)
+            insort(self._members[category], self._sequence_numbers[sock_addr])
+
+        version = next(self._next_version)
+        self._categories[sock_addr] = (category, version)
+
+        if category is not None:
+            self._push(self._deadlines, (candidate.get_category_deadline(category), version, sock_addr))
+
+            eligible_at = candidate.last_walk + CANDIDATE_ELIGIBLE_DELAY
+            if eligible_at <= now:
+                self._push(self._eligible[category], (_CATEGORY_TIMESTAMPS[category](candidate), version, sock_addr))
+            else:
+                self._push(self._waiting[category], (eligible_at, version, sock_addr))
+
+    def refresh(self, now):
+        """
+        Recompute the categories of the candidates that changed or whose category expired before NOW.
+        """
+        if self._dirty:
+            for sock_addr in self._dirty:
+                self._index(sock_addr, now)
+            self._dirty.clear()
+
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            entry = heappop(deadlines)
+            if self._is_valid(entry):
+                self._index(entry[2], now)
+
+    def get_candidates(self, categories, now):
+        """
+        Returns the candidates that are in one of CATEGORIES at NOW, in insertion order per category.
+
+        The None category contains the obsolete candidates.
+        """
+        self.refresh(now)
+        return [self[self._sock_addrs[sequence_number]]
+                for category in categories
+                for sequence_number in self._members[category]]
+
+    def get_category_size(self, category, now):
+        """
+        Returns the number of candidates in CATEGORY at NOW.
+        """
+        self.refresh(now)
+        return len(self._members[category])
+
+    def get_walk_candidates(self, now):
+        """
+        Returns the least recently walked, stumbled, introduced, and discovered candidates that are eligible for a walk
+        at NOW.  Each is None when its category has no eligible candidates.
+        """
+        self.refresh(now)
+        walk_candidates = []
+        for category in CATEGORIES:
+            waiting = self._waiting[category]
+            eligible = self._eligible[category]
+
+            while waiting and waiting[0][0] <= now:
+                entry = heappop(waiting)
+                if self._is_valid(entry):
+                    candidate = self[entry[2]]
+                    heappush(eligible, (_CATEGORY_TIMESTAMPS[category](candidate), entry[1], entry[2]))
+
+            while eligible and not self._is_valid(eligible[0]):
+                heappop(eligible)
+
+            walk_candidates.append(self[eligible[0][2]] if eligible else None)
+
+        return walk_candidates
+
+    def get_eligible_candidates(self, now, eligible_at):
+        """
+        Returns the candidates that are in one of the categories at NOW and that are eligible for a walk at
+        ELIGIBLE_AT, in insertion order.
+        """
+        self.refresh(now)
+        sock_addrs = set()
+        for category in CATEGORIES:
+            sock_addrs.update(entry[2] for entry in self._eligible[category] if self._is_valid(entry))
+            sock_addrs.update(entry[2] for entry in _iter_heap(self._waiting[category], eligible_at) if self._is_valid(entry))
+        return [self[sock_addr] for sock_addr in sorted(sock_addrs, key=self._sequence_numbers.__getitem__)]
+
+    def iter_categories(self, categories, predicate=None, once=False):
+        """
+        Yields the candidates in CATEGORIES, in round robin fashion, for as long as the generator is used.
+
+        Each pass over the candidates follows the insertion order, taking into account the candidates that are
+        added, removed, or change category while the generator is suspended.  None is yielded after a pass that did
+        not yield any candidates.
+
+        @param predicate: When given, only the candidates for which PREDICATE(candidate) is True are yielded.
+        @param once: When True the generator stops after one pass.
+        """
+        while True:
+            has_result = False
+            cursor = -1
+
+            while True:
+                self.refresh(time())
+
+                sequence_numbers = []
+                for category in categories:
+                    members = self._members[category]
+                    index = bisect_right(members, cursor)
+                    if index < len(members):
+                        sequence_numbers.append(members[index])
+                if not sequence_numbers:
+                    break
+
+                cursor = min(sequence_numbers)
+                candidate = self[self._sock_addrs[cursor]]
+                if predicate is None or predicate(candidate):
+                    yield candidate
+                    has_result = True
+
+            if once:
+                break
+            elif not has_result:
+                yield None
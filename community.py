@@ -8,25 +8,30 @@ Community instance.
 @contact: dispersy@frayja.com
 """
 from abc import ABCMeta, abstractmethod
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
+from functools import partial
 from itertools import islice, groupby
+import json
 import logging
 from math import ceil
 from random import random, Random, randint, shuffle, uniform
 from time import time
 
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
 from twisted.internet.task import LoopingCall, deferLater
 from twisted.python.threadable import isInIOThread
 
 from .authentication import NoAuthentication, MemberAuthentication, DoubleMemberAuthentication
-from .bloomfilter import BloomFilter
+from .bloomfilter import BloomFilter, get_key_digest
 from .candidate import Candidate, WalkCandidate
+from .candidatestore import CandidateStore
 from .conversion import BinaryConversion, DefaultConversion, Conversion
+from .delayregistry import DelayRegistry
 from .destination import CommunityDestination, CandidateDestination
 from .distribution import (SyncDistribution, GlobalTimePruning, LastSyncDistribution, DirectDistribution,
                            FullSyncDistribution)
+from .duplicatefilter import DuplicateFilter
 from .exception import ConversionNotFoundException, MetaNotFoundException
 from .member import DummyMember, Member
 from .message import (BatchConfiguration, Message, Packet, DropMessage, DelayMessageByProof,
@@ -38,9 +43,12 @@ from .payload import (AuthorizePayload, RevokePayload, UndoPayload, DestroyCommu
 from .requestcache import RequestCache, SignatureRequestCache, IntroductionRequestCache
 from .resolution import PublicResolution, LinearResolution, DynamicResolution
 from .statistics import CommunityStatistics
+from .syncindex import SyncIndex
+from .syncresponsecache import SyncResponseCache
 from .taskmanager import TaskManager
 from .timeline import Timeline
-from .util import runtime_duration_warning, attach_runtime_statistics, deprecated, is_valid_address
+from .util import (runtime_duration_warning, attach_runtime_statistics, deprecated, is_valid_address,
+                   call_on_reactor_thread)
 
 
 DOWNLOAD_MM_PK_INTERVAL = 15.0
@@ -50,6 +58,10 @@ FAST_WALKER_STEPS = 15
 FAST_WALKER_STEP_INTERVAL = 2.0
 PERIODIC_CLEANUP_INTERVAL = 5.0
 TAKE_STEP_INTERVAL = 5
+# the number of packets that are given to the endpoint at once while streaming a sync response
+SYNC_RESPONSE_CHUNK_SIZE = 8
+# the meta messages that are replayed into the timeline when the community is loaded
+TIMELINE_META_MESSAGES = (u"dispersy-authorize", u"dispersy-revoke", u"dispersy-dynamic-settings")
 
 logger = logging.getLogger(__name__)
 
@@ -266,7 +278,7 @@ class Community(TaskManager):
         self._my_member = my_member
 
         self._global_time = 0
-        self._candidates = OrderedDict()
+        self._candidates = CandidateStore()
 
         self._statistics = CommunityStatistics(self)
 
@@ -275,10 +287,8 @@ class Community(TaskManager):
         # batch caching incoming packets
         self._batch_cache = {}
 
-        # delayed list for incoming packet/messages which are delayed
-        self._delayed_key = defaultdict(list)
-
-        self._delayed_value = defaultdict(list)
+        # incoming packets/messages which are delayed
+        self._delay_registry = DelayRegistry()
 
         self.meta_message_cache = {}
         self._meta_messages = {}
@@ -295,6 +305,11 @@ class Community(TaskManager):
 
         self._request_cache = None
         self._timeline = None
+        # True while complete_initialization has not been called
+        self._initialization_pending = False
+        # the highest sync id of the permission messages in the persisted timeline snapshot, 0 when no snapshot is
+        # loaded, or None when the timeline must not be persisted
+        self._timeline_snapshot_id = 0
         self._random = None
         self._walked_candidates = None
         self._stumbled_candidates = None
@@ -302,6 +317,12 @@ class Community(TaskManager):
         self._walk_candidates = None
         self._fast_steps_taken = 0
         self._sync_cache = None
+        self._sync_bloom_filter_claim = None
+        self._sync_bloom_filter_claimed = None
+        self._sync_index = None
+        self._duplicate_filter = None
+        self._sync_response_cache = None
+        self._highest_sequence_numbers = None
 
     def initialize(self):
         assert isInIOThread()
@@ -346,37 +367,6 @@ class Community(TaskManager):
         # define all available messages
         self._initialize_meta_messages()
 
-        # we're only interrested in the meta_message, filter the meta_message_cache
-        for name in self.meta_message_cache.keys():
-            if name not in self._meta_messages:
-                del self.meta_message_cache[name]
-
-        # batched insert
-        update_list = []
-        for database_id, name, priority, direction in self._dispersy.database.execute(u"SELECT id, name, priority, direction FROM meta_message WHERE community = ?", (self._database_id,)):
-            meta_message_info = self.meta_message_cache.get(name)
-            if meta_message_info:
-                if priority != meta_message_info["priority"] or direction != meta_message_info["direction"]:
-                    update_list.append((priority, direction, database_id))
-
-                self._meta_messages[name]._database_id = database_id
-                del self.meta_message_cache[name]
-
-        if update_list:
-            self._dispersy.database.executemany(u"UPDATE meta_message SET priority = ?, direction = ? WHERE id = ?",
-                update_list)
-
-        if self.meta_message_cache:
-            insert_list = []
-            for name, data in self.meta_message_cache.iteritems():
-                insert_list.append((self.database_id, name, data["priority"], data["direction"]))
-            self._dispersy.database.executemany(u"INSERT INTO meta_message (community, name, priority, direction) VALUES (?, ?, ?, ?)",
-                insert_list)
-
-            for database_id, name in self._dispersy.database.execute(u"SELECT id, name FROM meta_message WHERE community = ?", (self._database_id,)):
-                self._meta_messages[name]._database_id = database_id  # cleanup pre-fetched values
-        self.meta_message_cache = None
-
         # define all available conversions
         self._conversions = self.initiate_conversions()
         if __debug__:
@@ -400,6 +390,20 @@ class Community(TaskManager):
         # sync range bloom filters
         self._sync_cache = None
         self._sync_cache_skip_count = 0
+        # the Deferred of the running dispersy_sync_bloom_filter_strategy call, and the bloom filter that it claimed
+        self._sync_bloom_filter_claim = None
+        self._sync_bloom_filter_claimed = None
+        self._sync_index = SyncIndex(self) if self.dispersy_sync_index_enable else None
+
+        # drops incoming packets that we already have before verifying them
+        self._duplicate_filter = DuplicateFilter(self) if self.dispersy_duplicate_filter_enable else None
+
+        # recent responses to the bloom filters in incoming introduction requests
+        self._sync_response_cache = SyncResponseCache() if self.dispersy_sync_response_cache_enable else None
+
+        # meta_id:{member_id:(global_time, sequence_number)} with the most recent stored message of each member, only
+        # for meta messages that use sequence numbers.  filled on demand by get_highest_sequence_numbers
+        self._highest_sequence_numbers = defaultdict(dict)
         if __debug__:
             b = BloomFilter(self.dispersy_sync_bloom_filter_bits, self.dispersy_sync_bloom_filter_error_rate)
             self._logger.debug("sync bloom:    size: %d;  capacity: %d;  error-rate: %f",
@@ -408,11 +412,7 @@ class Community(TaskManager):
                                self.dispersy_sync_bloom_filter_error_rate)
 
         # assigns temporary cache objects to unique identifiers
-        self._request_cache = RequestCache()
-
-        # initial timeline.  the timeline will keep track of member permissions
-        self._timeline = Timeline(self)
-        self._initialize_timeline()
+        self._request_cache = RequestCache(self._dispersy.timer_wheel)
 
         # random seed, used for sync range
         self._random = Random()
@@ -431,6 +431,64 @@ class Community(TaskManager):
                                isinstance(meta.distribution.pruning, GlobalTimePruning)
                                for meta in self._meta_messages.itervalues())
 
+        # the meta message database ids, the timeline, and the identity are initialized by complete_initialization,
+        # either now or when the community is first used
+        self._initialization_pending = True
+        if not self.dispersy_lazy_initialization_enable:
+            self.complete_initialization()
+
+        # start walker, if needed
+        if self.dispersy_enable_candidate_walker:
+            self.register_task("start_walking",
+                               reactor.callLater(self.database_id % 3, self.start_walking))
+
+    def complete_initialization(self):
+        """
+        Performs the part of the initialization that is deferred when dispersy_lazy_initialization_enable is True.
+
+        Stores the meta messages in the database, replays the timeline, and creates our dispersy-identity message when
+        it does not exist yet.  It is called when the community is first used, i.e. when a meta message database_id or
+        the timeline is needed, when a packet is received, or when the walker starts.  Calling it again does nothing.
+        """
+        if not self._initialization_pending:
+            return
+        self._initialization_pending = False
+
+        # we're only interrested in the meta_message, filter the meta_message_cache
+        for name in self.meta_message_cache.keys():
+            if name not in self._meta_messages:
+                del self.meta_message_cache[name]
+
+        # batched insert
+        update_list = []
+        for database_id, name, priority, direction in self._dispersy.database.execute(u"SELECT id, name, priority, direction FROM meta_message WHERE community = ?", (self._database_id,)):
+            meta_message_info = self.meta_message_cache.get(name)
+            if meta_message_info:
+                if priority != meta_message_info["priority"] or direction != meta_message_info["direction"]:
+                    update_list.append((priority, direction, database_id))
+
+                self._meta_messages[name]._database_id = database_id
+                del self.meta_message_cache[name]
+
+        if update_list:
+            self._dispersy.database.executemany(u"UPDATE meta_message SET priority = ?, direction = ? WHERE id = ?",
+                update_list)
+
+        if self.meta_message_cache:
+            insert_list = []
+            for name, data in self.meta_message_cache.iteritems():
+                insert_list.append((self.database_id, name, data["priority"], data["direction"]))
+            self._dispersy.database.executemany(u"INSERT INTO meta_message (community, name, priority, direction) VALUES (?, ?, ?, ?)",
+                insert_list)
+
+            for database_id, name in self._dispersy.database.execute(u"SELECT id, name FROM meta_message WHERE community = ?", (self._database_id,)):
+                self._meta_messages[name]._database_id = database_id  # cleanup pre-fetched values
+        self.meta_message_cache = None
+
+        # initial timeline.  the timeline will keep track of member permissions
+        self._timeline = Timeline(self)
+        self._initialize_timeline()
+
         try:
             # check if we have already created the identity message
             self.dispersy._database.execute(u"SELECT 1 FROM sync WHERE member = ? AND meta_message = ? LIMIT 1",
@@ -450,11 +508,6 @@ class Community(TaskManager):
             except ValueError:
                 self._logger.exception("sanity check fail for %s", self)
 
-        # start walker, if needed
-        if self.dispersy_enable_candidate_walker:
-            self.register_task("start_walking",
-                               reactor.callLater(self.database_id % 3, self.start_walking))
-
     @property
     def candidates(self):
         """
@@ -516,7 +569,7 @@ class Community(TaskManager):
 
     def _initialize_timeline(self):
         mapping = {}
-        for name in [u"dispersy-authorize", u"dispersy-revoke", u"dispersy-dynamic-settings"]:
+        for name in TIMELINE_META_MESSAGES:
             try:
                 meta = self.get_meta_message(name)
                 mapping[meta.database_id] = meta.handle_callback
@@ -524,18 +577,117 @@ class Community(TaskManager):
                 self._logger.warning("unable to load permissions from database [could not obtain %s]", name)
 
         if mapping:
-            for packet, in list(self._dispersy.database.execute(u"SELECT packet FROM sync WHERE meta_message IN (" + ", ".join("?" for _ in mapping) + ") ORDER BY global_time, packet",
-                                                                mapping.keys())):
+            # only the messages that are newer than the snapshot are replayed
+            snapshot_id = self._load_timeline_snapshot(mapping.keys()) if self.dispersy_timeline_snapshot_enable else 0
+
+            replayed = 0
+            for packet_id, packet in list(self._dispersy.database.execute(u"SELECT id, packet FROM sync WHERE meta_message IN (" + ", ".join("?" for _ in mapping) + ") AND id > ? ORDER BY global_time, packet",
+                                                                           mapping.keys() + [snapshot_id])):
                 message = self._dispersy.convert_packet_to_message(str(packet), self, verify=False)
                 if message:
                     self._logger.debug("processing %s", message.name)
+                    message.packet_id = packet_id
                     mapping[message.database_id]([message], initializing=True)
+                    replayed += 1
                 else:
                     # TODO: when a packet conversion fails we must drop something, and preferably check
                     # all messages in the database again...
                     self._logger.error("invalid message in database [%s; %s]\n%s",
                                        self.get_classification(), self.cid.encode("HEX"), str(packet).encode("HEX"))
 
+            if replayed and self.dispersy_timeline_snapshot_enable:
+                self._save_timeline_snapshot()
+
+    def _load_timeline_snapshot(self, meta_ids):
+        """
+        Restores the timeline from the persisted snapshot, when it is still valid.
+
+        Returns the highest sync id of the permission messages that are in the snapshot, or 0 when there is no valid
+        snapshot.
+        """
+        try:
+            sync_id, messages, snapshot = self._dispersy.database.execute(
+                u"SELECT sync_id, messages, snapshot FROM timeline_snapshot WHERE community = ?",
+                (self._database_id,)).next()
+        except StopIteration:
+            return 0
+
+        # permission messages are never removed from the sync table, unless the community is destroyed
+        count, = self._dispersy.database.execute(u"SELECT COUNT(*) FROM sync WHERE meta_message IN (" + ", ".join("?" for _ in meta_ids) + ") AND id <= ?",
+                                                 meta_ids + [sync_id]).next()
+        if count != messages:
+            self._logger.warning("discarding timeline snapshot [expected %d permission messages, found %d]",
+                                 messages, count)
+            return 0
+
+        try:
+            self._timeline.load_snapshot(json.loads(snapshot))
+        except (ValueError, KeyError, IndexError, MetaNotFoundException):
+            self._logger.exception("discarding invalid timeline snapshot")
+            self._timeline = Timeline(self)
+            return 0
+
+        self._logger.debug("restored timeline snapshot up to sync id %d", sync_id)
+        self._timeline_snapshot_id = sync_id
+        return sync_id
+
+    def _save_timeline_snapshot(self):
+        """
+        Persists the timeline, such that the next time the community is loaded only the permission messages that are
+        received afterwards need to be replayed.
+        """
+        meta_ids = [meta.database_id for meta in self._meta_messages.itervalues() if meta.name in TIMELINE_META_MESSAGES]
+        if not meta_ids or self._timeline_snapshot_id is None:
+            return
+
+        sync_id, messages = self._dispersy.database.execute(u"SELECT MAX(id), COUNT(*) FROM sync WHERE meta_message IN (" + ", ".join("?" for _ in meta_ids) + ")",
+                                                            meta_ids).next()
+        if not messages or sync_id == self._timeline_snapshot_id:
+            # nothing to save or the persisted snapshot is up to date
+            return
+
+        snapshot = self._timeline.get_snapshot()
+        if snapshot is None:
+            self._logger.debug("unable to save the timeline snapshot, not all proofs are stored")
+            return
+
+        self._dispersy.database.execute(
+            u"INSERT OR REPLACE INTO timeline_snapshot(community, sync_id, messages, snapshot) VALUES(?, ?, ?, ?)",
+            (self._database_id, sync_id, messages, unicode(json.dumps(snapshot))))
+        self._timeline_snapshot_id = sync_id
+
+    def discard_timeline_snapshot(self):
+        """
+        Removes the persisted timeline snapshot and stops persisting the timeline, the timeline is replayed from the
+        database the next time the community is loaded.
+        """
+        self._dispersy.database.execute(u"DELETE FROM timeline_snapshot WHERE community = ?", (self._database_id,))
+        self._timeline_snapshot_id = None
+
+    @property
+    def dispersy_lazy_initialization_enable(self):
+        """
+        Defer the expensive part of the initialization until the community is first used.
+
+        When True is returned, initialize does not store the meta messages in the database, replay the timeline, or
+        check the dispersy-identity message.  complete_initialization does this once the community receives a packet,
+        starts walking, or when a meta message database_id or the timeline is needed.  This makes loading many
+        communities at startup cheap.  By default Dispersy.lazy_community_initialization is returned.
+        """
+        return self._dispersy.lazy_community_initialization
+
+    @property
+    def dispersy_timeline_snapshot_enable(self):
+        """
+        Persist the timeline in the database.
+
+        When True is returned, the timeline is saved when the community is unloaded and after replaying new
+        permission messages.  The next time that the community is loaded the snapshot is restored and only the
+        permission messages that are not in the snapshot are replayed.  The proofs in the snapshot are loaded from the
+        database when they are first needed.
+        """
+        return True
+
     @property
     def dispersy_auto_load(self):
         """
@@ -553,6 +705,7 @@ class Community(TaskManager):
         assert isinstance(auto_load, bool)
         self._dispersy.database.execute(u"UPDATE community SET auto_load = ? WHERE master = ?",
                                         (1 if auto_load else 0, self._master_member.database_id))
+        self._dispersy._invalidate_community_cache(self.cid)
 
     @property
     def dispersy_auto_download_master_member(self):
@@ -634,6 +787,23 @@ class Community(TaskManager):
         """
         return 0.01
 
+    @property
+    def dispersy_sync_bloom_filter_digest(self):
+        """
+        Add the packet digests to the sync bloom filters instead of the packets.
+
+        When True is returned, the sync bloom filters contain get_key_digest(packet), as stored in the digest column
+        of the sync table, instead of the full packets.  Building and testing a bloom filter then no longer requires
+        hashing (and selecting) all the packets, and the SyncIndex can keep the digests in memory.
+
+        Note that the bloom filters are not compatible with peers that add the full packets.  Syncing with such a peer
+        still works, but every packet in the requested range is sent back, including the packets the peer already
+        has.  A community that must sync efficiently with older peers can return False.
+
+        @rtype: bool
+        """
+        return True
+
     @property
     def dispersy_sync_bloom_filter_bits(self):
         """
@@ -667,6 +837,13 @@ class Community(TaskManager):
 
     @property
     def dispersy_sync_bloom_filter_strategy(self):
+        """
+        Returns the method that claims a new sync bloom filter.
+
+        The method is called with the IntroductionRequestCache and returns a (time_low, time_high, modulo, offset,
+        bloom_filter) tuple or None, or a Deferred that fires with either.  The default strategies select the packets
+        using the database executor when there is no SyncIndex.
+        """
         return self._dispersy_claim_sync_bloom_filter_largest
 
     @property
@@ -677,6 +854,83 @@ class Community(TaskManager):
     def dispersy_sync_cache_enable(self):
         return True  # _cache_enable_
 
+    @property
+    def dispersy_sync_index_enable(self):
+        """
+        Keep an index of the syncable packets in memory to build the sync bloom filters.
+
+        When True is returned, the sync bloom filters are build from an in-memory SyncIndex that is updated whenever
+        packets are stored, undone, or pruned.  This avoids selecting and hashing all packets in the sync range from
+        the database for each new bloom filter, at the cost of keeping the id and the digest of every syncable packet
+        in memory.
+
+        Without digests the packets in the partially covered buckets must still be selected from the database, hence
+        by default the index is only used when dispersy_sync_bloom_filter_digest is True, which it is unless a
+        community overrides it.
+        """
+        return self.dispersy_sync_bloom_filter_digest
+
+    @property
+    def sync_index(self):
+        """
+        The SyncIndex instance, or None when dispersy_sync_index_enable is False.
+        @rtype: SyncIndex or None
+        """
+        return self._sync_index
+
+    @property
+    def delay_registry(self):
+        """
+        The DelayRegistry instance containing the packets and messages that are delayed.
+        @rtype: DelayRegistry
+        """
+        return self._delay_registry
+
+    @property
+    def dispersy_sync_response_cache_enable(self):
+        """
+        Remember the responses to incoming bloom filters for a few seconds.
+
+        When True is returned, a bloom filter request that is received again, while the sync table did not change, is
+        answered without selecting the packets from the database.  By default this is only enabled when no syncable
+        meta message uses the RANDOM synchronization direction, since repeating a random response would prevent the
+        requester from receiving the other packets.
+        """
+        return not any(meta.distribution.synchronization_direction == u"RANDOM"
+                       for meta in self.get_meta_messages()
+                       if isinstance(meta.distribution, SyncDistribution))
+
+    @property
+    def sync_response_cache(self):
+        """
+        The SyncResponseCache instance, or None when dispersy_sync_response_cache_enable is False.
+        @rtype: SyncResponseCache or None
+        """
+        return self._sync_response_cache
+
+    @property
+    def dispersy_duplicate_filter_enable(self):
+        """
+        Keep the (member, global time) pairs of the stored FullSyncDistribution packets in memory.
+
+        When True is returned, incoming packets that are binary identical to a stored packet are dropped before their
+        signatures are verified.
+        """
+        return True
+
+    @property
+    def duplicate_filter(self):
+        """
+        The DuplicateFilter instance, or None when dispersy_duplicate_filter_enable is False.
+        @rtype: DuplicateFilter or None
+        """
+        return self._duplicate_filter
+
+    @property
+    def _bloom_key_column(self):
+        # the sync table column that is added to the sync bloom filters
+        return u"sync.digest" if self.dispersy_sync_bloom_filter_digest else u"sync.packet"
+
     def dispersy_store(self, messages):
         """
         Called after new MESSAGES have been stored in the database.
@@ -745,7 +999,29 @@ class Community(TaskManager):
                 self._sync_cache = None
                 return None
 
-        sync = self.dispersy_sync_bloom_filter_strategy(request_cache)
+        if self._sync_index and not self._sync_index.is_loaded:
+            # the index is loaded by the database executor, possibly on another thread.  we can not include a sync
+            # bloom filter until it is available
+            self._sync_index.load_async()
+            if not self._sync_index.is_loaded:
+                self._logger.debug("%s sync index is not loaded yet", self._cid.encode("HEX"))
+                return None
+
+        if self._sync_bloom_filter_claim:
+            # the queries of the previous claim are still running on the database executor
+            self._logger.debug("%s sync bloom filter is not claimed yet", self._cid.encode("HEX"))
+            return None
+
+        sync, self._sync_bloom_filter_claimed = self._sync_bloom_filter_claimed, None
+        if sync is None:
+            sync = self.dispersy_sync_bloom_filter_strategy(request_cache)
+            if isinstance(sync, Deferred):
+                # the strategy selects the packets using the database executor, possibly on another thread.  the bloom
+                # filter is included in this request when the Deferred has already fired, otherwise in the next one
+                self._sync_bloom_filter_claim = sync
+                sync.addCallbacks(self._on_sync_bloom_filter_claimed, self._on_sync_bloom_filter_claim_error)
+                sync, self._sync_bloom_filter_claimed = self._sync_bloom_filter_claimed, None
+
         if sync:
             self._sync_cache = SyncCache(*sync)
             self._sync_cache.candidate = request_cache.helper_candidate
@@ -757,9 +1033,18 @@ class Community(TaskManager):
 
         return sync
 
+    def _on_sync_bloom_filter_claimed(self, sync):
+        self._sync_bloom_filter_claim = None
+        self._sync_bloom_filter_claimed = sync
+
+    def _on_sync_bloom_filter_claim_error(self, failure):
+        self._sync_bloom_filter_claim = None
+        self._logger.error("%s unable to claim a sync bloom filter: %s", self._cid.encode("HEX"), failure.getErrorMessage())
+
     # instead of pivot + capacity, compare pivot - capacity and pivot + capacity to see which globaltime range is largest
     @runtime_duration_warning(0.5)
     @attach_runtime_statistics(u"{0.__class__.__name__}.{function_name}")
+    @inlineCallbacks
     def _dispersy_claim_sync_bloom_filter_largest(self, request_cache):
         if __debug__:
             t1 = time()
@@ -781,12 +1066,12 @@ class Community(TaskManager):
 
             if from_gbtime > 1 and self._nrsyncpackets >= capacity:
                 # use from_gbtime -1/+1 to include from_gbtime
-                right, rightdata = self._select_bloomfilter_range(request_cache, syncable_messages, from_gbtime - 1, capacity, True)
+                right, rightdata = yield self._select_bloomfilter_range(request_cache, syncable_messages, from_gbtime - 1, capacity, True)
 
                 # if right did not get to capacity, then we have less than capacity items in the database
                 # skip left
                 if right[2] == capacity:
-                    left, leftdata = self._select_bloomfilter_range(request_cache, syncable_messages, from_gbtime + 1, capacity, False)
+                    left, leftdata = yield self._select_bloomfilter_range(request_cache, syncable_messages, from_gbtime + 1, capacity, False)
                     left_range = (left[1] or self.global_time) - left[0]
                     right_range = (right[1] or self.global_time) - right[0]
 
@@ -809,7 +1094,7 @@ class Community(TaskManager):
 
                 bloomfilter_range = [1, acceptable_global_time]
 
-                data, fixed = self._select_and_fix(request_cache, syncable_messages, 0, capacity, True)
+                data, fixed = yield self._select_and_fix(request_cache, syncable_messages, 0, capacity, True)
                 if len(data) > 0 and fixed:
                     bloomfilter_range[1] = data[-1][0]
                     self._nrsyncpackets = capacity + 1
@@ -818,7 +1103,12 @@ class Community(TaskManager):
                 t4 = time()
 
             if len(data) > 0:
-                bloom.add_keys(str(packet) for _, packet in data)
+                if self._sync_index:
+                    # DATA contains all syncable packets between its lowest and highest global time
+                    self._sync_index.fill_bloom_filter(bloom, data[0][0], data[-1][0])
+                else:
+                    # DATA contains the packets or their digests
+                    bloom.add_keys(str(key) for _, key in data)
 
                 if __debug__:
                     self._logger.debug("%s syncing %d-%d, nr_packets = %d, capacity = %d, packets %d-%d, pivot = %d",
@@ -827,17 +1117,18 @@ class Community(TaskManager):
                     self._logger.debug("%s took %f (fakejoin %f, rangeselect %f, dataselect %f, bloomfill, %f",
                                  self.cid.encode("HEX"), time() - t1, t2 - t1, t3 - t2, t4 - t3, time() - t4)
 
-                return (min(bloomfilter_range[0], acceptable_global_time), min(bloomfilter_range[1], acceptable_global_time), 1, 0, bloom)
+                returnValue((min(bloomfilter_range[0], acceptable_global_time), min(bloomfilter_range[1], acceptable_global_time), 1, 0, bloom))
 
             if __debug__:
                 self._logger.debug("%s no messages to sync", self.cid.encode("HEX"))
 
         elif __debug__:
             self._logger.debug("%s NOT syncing no syncable messages", self.cid.encode("HEX"))
-        return (1, acceptable_global_time, 1, 0, BloomFilter(8, 0.1, prefix='\x00'))
+        returnValue((1, self.acceptable_global_time, 1, 0, BloomFilter(8, 0.1, prefix='\x00')))
 
+    @inlineCallbacks
     def _select_bloomfilter_range(self, request_cache, syncable_messages, global_time, to_select, higher=True):
-        data, fixed = self._select_and_fix(request_cache, syncable_messages, global_time, to_select, higher)
+        data, fixed = yield self._select_and_fix(request_cache, syncable_messages, global_time, to_select, higher)
 
         lowerfixed = True
         higherfixed = True
@@ -848,10 +1139,10 @@ class Community(TaskManager):
             to_select = to_select - len(data)
             if to_select > 25:
                 if higher:
-                    lowerdata, lowerfixed = self._select_and_fix(request_cache, syncable_messages, global_time + 1, to_select, False)
+                    lowerdata, lowerfixed = yield self._select_and_fix(request_cache, syncable_messages, global_time + 1, to_select, False)
                     data = lowerdata + data
                 else:
-                    higherdata, higherfixed = self._select_and_fix(request_cache, syncable_messages, global_time - 1, to_select, True)
+                    higherdata, higherfixed = yield self._select_and_fix(request_cache, syncable_messages, global_time - 1, to_select, True)
                     data = data + higherdata
 
         bloomfilter_range = [data[0][0], data[-1][0], len(data)]
@@ -876,16 +1167,19 @@ class Community(TaskManager):
             if not higherfixed:
                 bloomfilter_range[1] = self.acceptable_global_time
 
-        return bloomfilter_range, data
+        returnValue((bloomfilter_range, data))
 
+    @inlineCallbacks
     def _select_and_fix(self, request_cache, syncable_messages, global_time, to_select, higher=True):
         assert isinstance(syncable_messages, unicode)
-        if higher:
-            data = list(self._dispersy.database.execute(u"SELECT global_time, packet FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time > ? ORDER BY global_time ASC LIMIT ?" % (syncable_messages),
-                       (global_time, to_select + 1)))
+        if self._sync_index:
+            data = self._sync_index.select(global_time, to_select + 1, higher)
+        elif higher:
+            data = yield self._dispersy.database.execute_async(u"SELECT global_time, %s FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time > ? ORDER BY global_time ASC LIMIT ?" % (self._bloom_key_column, syncable_messages),
+                                                               (global_time, to_select + 1), read_only=True)
         else:
-            data = list(self._dispersy.database.execute(u"SELECT global_time, packet FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time < ? ORDER BY global_time DESC LIMIT ?" % (syncable_messages),
-                       (global_time, to_select + 1)))
+            data = yield self._dispersy.database.execute_async(u"SELECT global_time, %s FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time < ? ORDER BY global_time DESC LIMIT ?" % (self._bloom_key_column, syncable_messages),
+                                                               (global_time, to_select + 1), read_only=True)
 
         fixed = False
         if len(data) > to_select:
@@ -900,37 +1194,49 @@ class Community(TaskManager):
         if not higher:
             data.reverse()
 
-        return data, fixed
+        returnValue((data, fixed))
 
     # instead of pivot + capacity, compare pivot - capacity and pivot + capacity to see which globaltime range is largest
     @runtime_duration_warning(0.5)
     @attach_runtime_statistics(u"{0.__class__.__name__}.{function_name}")
+    @inlineCallbacks
     def _dispersy_claim_sync_bloom_filter_modulo(self, request_cache):
         syncable_messages = u", ".join(unicode(meta.database_id) for meta in self._meta_messages.itervalues() if isinstance(meta.distribution, SyncDistribution) and meta.distribution.priority > 32)
         if syncable_messages:
             bloom = BloomFilter(self.dispersy_sync_bloom_filter_bits, self.dispersy_sync_bloom_filter_error_rate, prefix=chr(int(random() * 256)))
             capacity = bloom.get_capacity(self.dispersy_sync_bloom_filter_error_rate)
 
-            self._nrsyncpackets = list(self._dispersy.database.execute(u"SELECT count(*) FROM sync WHERE meta_message IN (%s) AND undone = 0 LIMIT 1" % (syncable_messages)))[0][0]
+            if self._sync_index:
+                self._nrsyncpackets = self._sync_index.count()
+            else:
+                rows = yield self._dispersy.database.execute_async(u"SELECT count(*) FROM sync WHERE meta_message IN (%s) AND undone = 0 LIMIT 1" % (syncable_messages), read_only=True)
+                self._nrsyncpackets = rows[0][0]
             modulo = int(ceil(self._nrsyncpackets / float(capacity)))
             if modulo > 1:
                 offset = randint(0, modulo - 1)
-                packets = list(str(packet) for packet, in self._dispersy.database.execute(u"SELECT sync.packet FROM sync WHERE meta_message IN (%s) AND sync.undone = 0 AND (sync.global_time + ?) %% ? = 0" % syncable_messages, (offset, modulo)))
             else:
                 offset = 0
                 modulo = 1
-                packets = list(str(packet) for packet, in self._dispersy.database.execute(u"SELECT sync.packet FROM sync WHERE meta_message IN (%s) AND sync.undone = 0" % syncable_messages))
 
-            bloom.add_keys(packets)
+            if self._sync_index:
+                keys = list(self._sync_index.iter_bloom_keys(modulo, offset))
+            elif modulo > 1:
+                rows = yield self._dispersy.database.execute_async(u"SELECT %s FROM sync WHERE meta_message IN (%s) AND sync.undone = 0 AND (sync.global_time + ?) %% ? = 0" % (self._bloom_key_column, syncable_messages), (offset, modulo), read_only=True)
+                keys = [str(key) for key, in rows]
+            else:
+                rows = yield self._dispersy.database.execute_async(u"SELECT %s FROM sync WHERE meta_message IN (%s) AND sync.undone = 0" % (self._bloom_key_column, syncable_messages), read_only=True)
+                keys = [str(key) for key, in rows]
+
+            bloom.add_keys(keys)
 
             self._logger.debug("%s syncing %d-%d, nr_packets = %d, capacity = %d, totalnr = %d",
                          self.cid.encode("HEX"), modulo, offset, self._nrsyncpackets, capacity, self._nrsyncpackets)
 
-            return (1, self.acceptable_global_time, modulo, offset, bloom)
+            returnValue((1, self.acceptable_global_time, modulo, offset, bloom))
 
         else:
             self._logger.debug("%s NOT syncing no syncable messages", self.cid.encode("HEX"))
-        return (1, self.acceptable_global_time, 1, 0, BloomFilter(8, 0.1, prefix='\x00'))
+        returnValue((1, self.acceptable_global_time, 1, 0, BloomFilter(8, 0.1, prefix='\x00')))
 
     @property
     def dispersy_sync_response_limit(self):
@@ -1002,6 +1308,8 @@ class Community(TaskManager):
         The Timeline instance.
         @rtype: Timeline
         """
+        if self._initialization_pending:
+            self.complete_initialization()
         return self._timeline
 
     @property
@@ -1068,6 +1376,9 @@ class Community(TaskManager):
 
         self._request_cache.clear()
 
+        if self._timeline is not None and self.dispersy_timeline_snapshot_enable:
+            self._save_timeline_snapshot()
+
         self.dispersy.detach_community(self)
 
     def claim_global_time(self):
@@ -1094,6 +1405,140 @@ class Community(TaskManager):
                          self._dispersy.database.execute(
                             u"DELETE FROM sync WHERE meta_message = ? AND global_time <= ?",
                             (meta.database_id, self._global_time - meta.distribution.pruning.prune_threshold))
+                         self.on_sync_table_changed(pruned=(meta, self._global_time - meta.distribution.pruning.prune_threshold))
+
+    def get_highest_sequence_numbers(self, meta, member_ids):
+        """
+        Returns the global time and sequence number of the most recent stored META message for each member.
+
+        The values are kept in memory, the members that are not yet known are selected from the database using a
+        single query.  Members without any stored META message have (0, 0).
+
+        @param meta: The meta message, must use sequence numbers.
+        @type meta: Message
+
+        @param member_ids: The database ids of the members.
+        @type member_ids: iterable
+
+        @rtype: {member_id: (global_time, sequence_number)}
+        """
+        assert isinstance(meta, Message), type(meta)
+        assert isinstance(meta.distribution, FullSyncDistribution) and meta.distribution.enable_sequence_number
+        member_ids = set(member_ids)
+        cache = self._highest_sequence_numbers[meta.database_id]
+
+        missing = member_ids.difference(cache)
+        if missing:
+            for member_id in missing:
+                cache[member_id] = (0, 0)
+            for member_id, global_time, sequence_number in self._dispersy.database.execute_in(
+                    u"SELECT member, MAX(global_time), MAX(sequence) FROM sync WHERE meta_message = ? AND member IN (%s) GROUP BY member",
+                    (meta.database_id,), missing):
+                cache[member_id] = (global_time or 0, sequence_number or 0)
+
+        return dict((member_id, cache[member_id]) for member_id in member_ids)
+
+    def update_highest_sequence_number(self, meta, member_id, global_time, sequence_number):
+        """
+        Remember that the META message with SEQUENCE_NUMBER, created by MEMBER_ID at GLOBAL_TIME, is the most recent
+        stored message of this member.
+        """
+        assert isinstance(meta, Message), type(meta)
+        self._highest_sequence_numbers[meta.database_id][member_id] = (global_time, sequence_number)
+
+    def forget_highest_sequence_numbers(self, meta=None, member_ids=None):
+        """
+        Forget the in-memory sequence numbers of MEMBER_IDS for META, i.e. because their messages were deleted.  They
+        are selected from the database again the next time they are needed.
+
+        When META is None all sequence numbers are forgotten, when MEMBER_IDS is None all sequence numbers of META
+        are forgotten.
+        """
+        if meta is None:
+            self._highest_sequence_numbers.clear()
+
+        elif member_ids is None:
+            self._highest_sequence_numbers.pop(meta.database_id, None)
+
+        else:
+            cache = self._highest_sequence_numbers.get(meta.database_id)
+            if cache:
+                for member_id in member_ids:
+                    cache.pop(member_id, None)
+
+    def on_sync_table_changed(self, stored=(), removed=(), undone=(), redone=(), replaced=(), pruned=None, deleted=None):
+        """
+        Must be called after the sync table changed.  Updates the sync index, the duplicate filter, the sync response
+        cache, and the in-memory sequence numbers.
+
+        @param stored: the messages that have just been stored.
+        @param removed: (packet_id, global_time) pairs of the packets that were deleted because they became obsolete.
+        @param undone: (member_id, global_time) pairs of the packets that were marked as undone.
+        @param redone: the messages that are no longer marked as undone.
+        @param replaced: the messages whose packet replaced the stored packet with the same global time.
+        @param pruned: a (meta, global_time) tuple when all META packets at or below GLOBAL_TIME were deleted.
+        @param deleted: a (meta, member_ids) tuple when any other packets were deleted.  META is None when packets of
+         any meta message were deleted, MEMBER_IDS is None when packets of any member were deleted.
+        """
+        sync_index = self._sync_index
+        duplicate_filter = self._duplicate_filter
+        global_times = set()
+
+        if stored:
+            if sync_index:
+                sync_index.store(stored)
+            if duplicate_filter:
+                duplicate_filter.store(stored)
+            global_times.update(message.distribution.global_time for message in stored)
+
+        if removed:
+            if sync_index:
+                sync_index.remove_packet_ids(packet_id for packet_id, _ in removed)
+            global_times.update(global_time for _, global_time in removed)
+
+        if undone:
+            for member_id, global_time in undone:
+                if sync_index:
+                    sync_index.undo(member_id, global_time)
+                if duplicate_filter:
+                    duplicate_filter.undo(member_id, global_time)
+            global_times.update(global_time for _, global_time in undone)
+
+        if redone:
+            if sync_index:
+                sync_index.redo(redone)
+            if duplicate_filter:
+                duplicate_filter.redo(redone)
+            global_times.update(message.distribution.global_time for message in redone)
+
+        if replaced:
+            if sync_index:
+                # the index may contain the digest of the replaced packet
+                sync_index.invalidate()
+            if duplicate_filter:
+                duplicate_filter.store(replaced)
+            global_times.update(message.distribution.global_time for message in replaced)
+
+        if pruned:
+            meta, global_time = pruned
+            if sync_index:
+                sync_index.prune(meta.database_id, global_time)
+            if duplicate_filter:
+                duplicate_filter.prune(meta.database_id, global_time)
+            self.forget_highest_sequence_numbers(meta)
+
+        if deleted:
+            if sync_index:
+                sync_index.invalidate()
+            if duplicate_filter:
+                duplicate_filter.invalidate()
+            self.forget_highest_sequence_numbers(*deleted)
+
+        if self._sync_response_cache:
+            if pruned or deleted:
+                self._sync_response_cache.invalidate()
+            elif global_times:
+                self._sync_response_cache.invalidate(global_times)
 
     def dispersy_check_database(self):
         """
@@ -1158,9 +1603,12 @@ class Community(TaskManager):
         self._conversions.append(conversion)
 
     def start_walking(self):
+        self.complete_initialization()
+
         def get_eligible_candidates(now):
             # pretending that we're already in the future to make candidates eligible for walking sooner, add some randomness to load balance
-            return [candidate for candidate in self._candidates.itervalues() if candidate.is_eligible_for_walk(now + uniform(20, 27.5))]
+            return [candidate for candidate in self._candidates.get_eligible_candidates(now, now + 27.5)
+                    if candidate.is_eligible_for_walk(now + uniform(20, 27.5))]
 
         def switch_to_normal_walking():
             """
@@ -1223,67 +1671,13 @@ class Community(TaskManager):
     def _iter_category(self, category, strict=True):
         # strict=True will ensure both candidate.lan_address and candidate.wan_address are not
         # 0.0.0.0:0
-        while True:
-            index = 0
-            has_result = False
-            keys = self._candidates.keys()
+        def predicate(candidate):
+            return not (candidate.lan_address == ("0.0.0.0", 0) or candidate.wan_address == ("0.0.0.0", 0))
 
-            while index < len(keys):
-                now = time()
-                key = keys[index]
-                candidate = self._candidates.get(key)
-
-                if (candidate and
-                    candidate.get_category(now) == category and
-                        not (strict and (candidate.lan_address == ("0.0.0.0", 0) or candidate.wan_address == ("0.0.0.0", 0)))):
-
-                    yield candidate
-                    has_result = True
-
-                    keys = self._candidates.keys()
-                    try:
-                        if keys[index] != key:
-                            # a key has been removed from self._candidates
-                            index = keys.index(key)
-                    except (IndexError, ValueError):
-                        index -= 1
-
-                index += 1
-
-            if not has_result:
-                yield None
+        return self._candidates.iter_categories([category], predicate if strict else None)
 
     def _iter_categories(self, categories, once=False):
-        while True:
-            index = 0
-            has_result = False
-            keys = self._candidates.keys()
-
-            while index < len(keys):
-                now = time()
-                key = keys[index]
-                candidate = self._candidates.get(key)
-
-                if (candidate and
-                        candidate.get_category(now) in categories):
-
-                    yield candidate
-                    has_result = True
-
-                    keys = self._candidates.keys()
-                    try:
-                        if keys[index] != key:
-                            # a key has been removed from self._candidates
-                            index = keys.index(key)
-                    except (IndexError, ValueError):
-                        index -= 1
-
-                index += 1
-
-            if once:
-                break
-            elif not has_result:
-                yield None
+        return self._candidates.iter_categories(categories, once=once)
 
     def dispersy_yield_candidates(self):
         """
@@ -1292,8 +1686,7 @@ class Community(TaskManager):
         The returned 'walk', 'stumble', and 'intro' candidates are randomised on every call and
         returned only once each.
         """
-        now = time()
-        candidates = [candidate for candidate in self._candidates.itervalues() if candidate.get_category(now) in (u"walk", u"stumble", u"intro")]
+        candidates = self._candidates.get_candidates((u"walk", u"stumble", u"intro"), time())
         shuffle(candidates)
         return iter(candidates)
 
@@ -1304,8 +1697,7 @@ class Community(TaskManager):
         The returned 'walk' and 'stumble' candidates are randomised on every call and returned only
         once each.
         """
-        now = time()
-        candidates = [candidate for candidate in self._candidates.itervalues() if candidate.get_category(now) in (u"walk", u"stumble")]
+        candidates = self._candidates.get_candidates((u"walk", u"stumble"), time())
         shuffle(candidates)
         return iter(candidates)
 
@@ -1367,35 +1759,15 @@ class Community(TaskManager):
         """
         # 13/02/12 Boudewijn: normal peers can not be visited multiple times within 30 seconds,
         # bootstrap peers can not be visited multiple times within 55 seconds.  this is handled by
-        # the Candidate.is_eligible_for_walk(...) method
-
-        from sys import maxsize
+        # the Candidate.is_eligible_for_walk(...) method.  the CandidateStore keeps the eligible candidates of each
+        # category ordered by the time they were last walked, stumbled, introduced, or discovered
 
         now = time()
 
         # cleanup obsolete candidates
         self.cleanup_candidates()
 
-        categories = [(maxsize, None), (maxsize, None), (maxsize, None), (maxsize, None)]
-        category_sizes = [0, 0, 0, 0]
-
-        for candidate in self._candidates.itervalues():
-            if candidate.is_eligible_for_walk(now):
-                category = candidate.get_category(now)
-                if category == u"walk":
-                    categories[0] = min(categories[0], (candidate.last_walk, candidate))
-                    category_sizes[0] += 1
-                elif category == u"stumble":
-                    categories[1] = min(categories[1], (candidate.last_stumble, candidate))
-                    category_sizes[1] += 1
-                elif category == u"intro":
-                    categories[2] = min(categories[2], (candidate.last_intro, candidate))
-                    category_sizes[2] += 1
-                elif category == u"discovered":
-                    categories[3] = min(categories[3], (candidate.last_discovered, candidate))
-                    category_sizes[3] += 1
-
-        walk, stumble, intro, discovered = [candidate for _, candidate in categories]
+        walk, stumble, intro, discovered = self._candidates.get_walk_candidates(now)
 
         candidate = None
         while (walk or stumble or intro or discovered) and not candidate:
@@ -1413,9 +1785,10 @@ class Community(TaskManager):
             else:
                 candidate = discovered
 
-        self._logger.debug("returning [%2d:%2d:%2d:%2d] %s",
-                           category_sizes[0], category_sizes[1],
-                           category_sizes[2], category_sizes[3], candidate)
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug("returning [%2d:%2d:%2d:%2d] %s",
+                               *[self._candidates.get_category_size(category, now)
+                                 for category in (u"walk", u"stumble", u"intro", u"discovered")] + [candidate])
         return candidate
 
     def create_candidate(self, sock_addr, tunnel, lan_address, wan_address, connection_type):
@@ -1564,11 +1937,10 @@ class Community(TaskManager):
 
         Returns the number of candidates that were removed.
         """
-        now = time()
-        obsolete_candidates = [(key, candidate) for key, candidate in self._candidates.iteritems() if candidate.get_category(now) is None]
-        for key, candidate in obsolete_candidates:
+        obsolete_candidates = self._candidates.get_candidates([None], time())
+        for candidate in obsolete_candidates:
             self._logger.debug("removing obsolete candidate %s", candidate)
-            del self._candidates[key]
+            del self._candidates[candidate.sock_addr]
             self._dispersy.wan_address_unvote(candidate)
 
         return len(obsolete_candidates)
@@ -1911,12 +2283,9 @@ class Community(TaskManager):
 
             # if we find a new key, then we need to send a request
             # if we did send a delay for this message that is
-            if (unwrapped_key not in self._delayed_key) and (delay not in self._delayed_value):
+            if self._delay_registry.add(unwrapped_key, delay):
                 send_request = True
 
-            self._delayed_key[unwrapped_key].append(delay)
-            self._delayed_value[delay].append(unwrapped_key)
-
         if send_request:
             delay.send_request(self, candidate)
             self._statistics.increase_delay_msg_count(u"send")
@@ -1943,21 +2312,14 @@ class Community(TaskManager):
         new_messages = defaultdict(set)
         new_packets = set()
         for received_key in received_keys:
-            for key in self._delayed_key.keys():
-                if all(k is None or k == rk for k, rk in zip(key, received_key)):
-                    for delayed in self._delayed_key.pop(key):
-                        delayed_keys = self._delayed_value[delayed]
-                        delayed_keys.remove(key)
-
-                        if len(delayed_keys) == 0 or delayed.resume_immediately:
-                            self._statistics.increase_delay_msg_count(u"success")
-                            self._remove_delayed(delayed)
-
-                            if isinstance(delayed, DelayMessage):
-                                delayed_message = delayed.on_success()
-                                new_messages[delayed_message.meta].add(delayed_message)
-                            else:
-                                new_packets.add(delayed.on_success())
+            for delayed in self._delay_registry.resume(received_key):
+                self._statistics.increase_delay_msg_count(u"success")
+
+                if isinstance(delayed, DelayMessage):
+                    delayed_message = delayed.on_success()
+                    new_messages[delayed_message.meta].add(delayed_message)
+                else:
+                    new_packets.add(delayed.on_success())
 
         if new_messages:
             for new_messages_meta in new_messages.itervalues():
@@ -1968,22 +2330,11 @@ class Community(TaskManager):
             self._logger.debug("resuming %d packets", len(new_packets))
             self.on_incoming_packets(list(new_packets), timestamp=time(), source=u"resumed")
 
-    def _remove_delayed(self, delayed):
-        for key in self._delayed_value[delayed]:
-            self._delayed_key[key].remove(delayed)
-            if len(self._delayed_key[key]) == 0:
-                del self._delayed_key[key]
-
-        del self._delayed_value[delayed]
-
     def _periodically_clean_delayed(self):
-        now = time()
-        for delayed in self._delayed_value.keys():
-            if now > delayed.timestamp + 10:
-                self._remove_delayed(delayed)
-                delayed.on_timeout()
-                self._statistics.increase_delay_msg_count(u"timeout")
-                self._statistics.increase_msg_count(u"drop", u"delay_timeout:%s" % delayed)
+        for delayed in self._delay_registry.expire(time()):
+            delayed.on_timeout()
+            self._statistics.increase_delay_msg_count(u"timeout")
+            self._statistics.increase_msg_count(u"drop", u"delay_timeout:%s" % delayed)
 
     def on_incoming_packets(self, packets, cache=True, timestamp=0.0, source=u"unknown"):
         """
@@ -1997,6 +2348,8 @@ class Community(TaskManager):
         assert all(isinstance(packet[1], str) for packet in packets), packets
         assert isinstance(cache, bool), cache
         assert isinstance(timestamp, float), timestamp
+        if self._initialization_pending:
+            self.complete_initialization()
 
         self._logger.debug("got %d incoming packets", len(packets))
 
@@ -2062,6 +2415,10 @@ class Community(TaskManager):
             are dropped or delayed at this stage.
 
          3. All remaining messages are passed to on_message_batch.
+
+        When Dispersy has a verification pool, the packets are converted without verifying their
+        signatures.  The signatures of the entire batch are verified on the pool and only the
+        messages with valid signatures are passed to on_message_batch.
         """
         # convert binary packets into Message.Implementation instances
         messages = []
@@ -2071,13 +2428,27 @@ class Community(TaskManager):
         assert all(isinstance(x, tuple) for x in batch)
         assert all(len(x) == 4 for x in batch)
 
+        verification_pool = self._dispersy.verification_pool
+        verify = verification_pool is None
+        duplicate_filter = self._duplicate_filter if isinstance(meta.distribution, FullSyncDistribution) else None
+
         for candidate, packet, conversion, source in batch:
             assert isinstance(candidate, Candidate)
             assert isinstance(packet, str)
             assert isinstance(conversion, Conversion)
+
+            if duplicate_filter:
+                # drop packets that we already have without decoding them completely or verifying their signatures
+                decoded = conversion.decode_member_and_global_time(candidate, packet)
+                if decoded:
+                    member, global_time = decoded
+                    if duplicate_filter.is_duplicate(meta.database_id, member.database_id, global_time, packet):
+                        self._drop(DropPacket("Duplicate packet"), packet, candidate)
+                        continue
+
             try:
                 # convert binary data to internal Message
-                messages.append(conversion.decode_message(candidate, packet, source=source))
+                messages.append(conversion.decode_message(candidate, packet, verify=verify, source=source))
 
             except DropPacket as drop:
                 self._drop(drop, packet, candidate)
@@ -2090,7 +2461,59 @@ class Community(TaskManager):
 
         # handle the incoming messages
         if messages:
-            self.on_messages(messages)
+            if verify:
+                self.on_messages(messages)
+            else:
+                self._verify_batch(verification_pool, messages)
+
+    def _verify_batch(self, verification_pool, messages):
+        """
+        Verifies the signatures of MESSAGES on VERIFICATION_POOL and handles the messages with valid
+        signatures once the results are in.  When the pool fails the signatures are verified on the
+        reactor thread instead.
+        """
+        # (member, data, signature) tuples
+        checks = []
+        # (message, first_check, last_check) tuples, the checks of each message are checks[first_check:last_check]
+        ranges = []
+        for message in messages:
+            message_checks = message.authentication.get_signature_checks(message.packet)
+            if message_checks is None:
+                self._drop(DropPacket("Invalid signature"), message.packet, message.candidate)
+                continue
+            if message_checks and self._dispersy.has_verified_signature(message.packet):
+                message_checks = []
+            ranges.append((message, len(checks), len(checks) + len(message_checks)))
+            checks.extend(message_checks)
+
+        if not checks:
+            if ranges:
+                self.on_messages([message for message, _, _ in ranges])
+            return
+
+        def on_verified(results):
+            valid = []
+            for message, first, last in ranges:
+                if all(results[first:last]):
+                    if first < last:
+                        self._dispersy.add_verified_signature(message.packet)
+                    valid.append(message)
+                else:
+                    self._drop(DropPacket("Invalid signature"), message.packet, message.candidate)
+
+            # the community may have been unloaded while the signatures were being verified
+            if valid and self._dispersy.running and self._dispersy._communities.get(self._cid) is self:
+                self.on_messages(valid)
+
+        def on_error(failure):
+            # the pool is stopped when Dispersy stops
+            if verification_pool.is_running:
+                self._logger.warning("unable to verify %d signatures on the verification pool: %s",
+                                     len(checks), failure.getErrorMessage())
+                on_verified([member.verify(data, signature) for member, data, signature in checks])
+
+        verification_pool.verify([(member.public_key, data, signature)
+                                  for member, data, signature in checks]).addCallbacks(on_verified, on_error)
 
     def purge_batch_cache(self):
         """
@@ -2501,8 +2924,8 @@ class Community(TaskManager):
                     introduction_args_list += extra_payload
                 introduction_args_list = tuple(introduction_args_list)
 
-                # create introduction response
-                responses.append(meta_introduction_response.impl(authentication=(self.my_member,), distribution=(self.global_time,), destination=(candidate,), payload=introduction_args_list))
+                # create introduction response, it is signed by the signing service
+                responses.append(meta_introduction_response.impl(authentication=(self.my_member,), distribution=(self.global_time,), destination=(candidate,), payload=introduction_args_list, empty_signature=True))
 
                 # create puncture request
                 requests.append(meta_puncture_request.impl(distribution=(self.global_time,), destination=(introduced,), payload=(payload.source_lan_address, payload.source_wan_address, payload.identifier)))
@@ -2517,10 +2940,10 @@ class Community(TaskManager):
                     introduction_args_list += extra_payload
                 introduction_args_list = tuple(introduction_args_list)
 
-                responses.append(meta_introduction_response.impl(authentication=(self.my_member,), distribution=(self.global_time,), destination=(candidate,), payload=introduction_args_list))
+                responses.append(meta_introduction_response.impl(authentication=(self.my_member,), distribution=(self.global_time,), destination=(candidate,), payload=introduction_args_list, empty_signature=True))
 
         if responses:
-            self._dispersy._forward(responses)
+            self._dispersy._sign_and_forward(responses)
         if requests:
             self._dispersy._forward(requests)
 
@@ -2548,24 +2971,145 @@ class Community(TaskManager):
 
                 messages_with_sync.append((message, time_low, time_high, offset, modulo))
 
-        if messages_with_sync:
-            for message, generator in self._get_packets_for_bloomfilters(messages_with_sync, include_inactive=False):
+        # message:key pairs for the requests whose response will be cached
+        sync_response_keys = {}
+        if messages_with_sync and self._sync_response_cache:
+            # a request that was answered recently, while no packet in its range changed, is answered from the cache.
+            # the key contains the requested time_high, 0 when the range ends at the current global time
+            cache = self._sync_response_cache
+            uncached = []
+            for request in messages_with_sync:
+                message, time_low, _, offset, modulo = request
                 payload = message.payload
-                # we limit the response by byte_limit bytes
-                byte_limit = self.dispersy_sync_response_limit
-
-                packets = []
-                for packet, in payload.bloom_filter.not_filter(generator):
-                    packets.append(packet)
-                    byte_limit -= len(packet)
-                    if byte_limit <= 0:
-                        self._logger.debug("bandwidth throttle")
-                        break
+                key = cache.get_key(payload.bloom_filter, time_low, payload.time_high if payload.has_time_high else 0,
+                                    offset, modulo)
+                packets = cache.get(key)
+                if packets is None:
+                    uncached.append(request)
+                    sync_response_keys[message] = key
+                else:
+                    for index in xrange(0, len(packets), SYNC_RESPONSE_CHUNK_SIZE):
+                        self._send_sync_response(packets[index:index + SYNC_RESPONSE_CHUNK_SIZE], message)
+                    self._on_sync_response_sent(packets, message)
+            messages_with_sync = uncached
 
-                if packets:
-                    self._logger.debug("syncing %d packets (%d bytes) to %s",
-                                       len(packets), sum(len(packet) for packet in packets), message.candidate)
-                    self._dispersy._send_packets([message.candidate], packets, self, "-caused by sync-")
+        if messages_with_sync:
+            # the packets are selected by the database executor or one of the read connections, possibly on another
+            # thread
+            if self.dispersy_sync_bloom_filter_digest:
+                # only the packets that are not in the bloom filter are read from the database
+                columns = u"sync.id, sync.digest, length(sync.packet)"
+                iter_sync_response = self._iter_sync_response_by_digest
+            else:
+                columns = u"sync.packet"
+                iter_sync_response = self._iter_sync_response
+
+            for message, sql, sql_arguments in self._get_queries_for_bloomfilters(messages_with_sync, include_inactive=False, columns=columns):
+                deferred = self._dispersy.database.execute_async(
+                    sql, sql_arguments,
+                    fetch=partial(self._stream_sync_response, iter_sync_response, message.payload.bloom_filter, message),
+                    read_only=True)
+                if message in sync_response_keys:
+                    deferred.addCallback(self._cache_sync_response, sync_response_keys[message],
+                                         self._sync_response_cache.generation)
+                deferred.addCallback(self._on_sync_response_sent, message)
+                deferred.addErrback(self._on_sync_response_error, message)
+
+    def _iter_sync_response(self, bloom_filter, cursor):
+        """
+        Yields the packets from CURSOR that are not in BLOOM_FILTER.
+
+        Stops iterating CURSOR, i.e. no more rows are fetched, once dispersy_sync_response_limit bytes have been
+        yielded.
+        """
+        # we limit the response by byte_limit bytes
+        byte_limit = self.dispersy_sync_response_limit
+
+        for packet, in bloom_filter.not_filter((str(packet),) for packet, in cursor):
+            yield packet
+            byte_limit -= len(packet)
+            if byte_limit <= 0:
+                self._logger.debug("bandwidth throttle")
+                break
+
+    def _iter_sync_response_by_digest(self, bloom_filter, cursor):
+        """
+        Yields the packets for the (id, digest, length) rows from CURSOR that are not in BLOOM_FILTER.
+
+        The byte limit is checked using the length column, hence only the packets that are sent are read from the
+        database.  These are read in chunks of SYNC_RESPONSE_CHUNK_SIZE packets using a second cursor.
+        """
+        # we limit the response by byte_limit bytes
+        byte_limit = self.dispersy_sync_response_limit
+        packet_cursor = cursor.connection.cursor()
+
+        def fetch(packet_ids):
+            packets = dict((packet_id, str(packet))
+                           for packet_id, packet
+                           in packet_cursor.execute(u"SELECT id, packet FROM sync WHERE id IN (%s)" % u", ".join(u"?" * len(packet_ids)), packet_ids))
+            return [packets[packet_id] for packet_id in packet_ids if packet_id in packets]
+
+        try:
+            packet_ids = []
+            for _, packet_id, length in bloom_filter.not_filter((str(digest), packet_id, length) for packet_id, digest, length in cursor):
+                packet_ids.append(packet_id)
+                byte_limit -= length
+                if byte_limit <= 0:
+                    self._logger.debug("bandwidth throttle")
+                    break
+
+                if len(packet_ids) >= SYNC_RESPONSE_CHUNK_SIZE:
+                    for packet in fetch(packet_ids):
+                        yield packet
+                    packet_ids = []
+
+            if packet_ids:
+                for packet in fetch(packet_ids):
+                    yield packet
+
+        finally:
+            packet_cursor.close()
+
+    def _stream_sync_response(self, iter_sync_response, bloom_filter, message, cursor):
+        """
+        Sends the packets yielded by ITER_SYNC_RESPONSE(BLOOM_FILTER, CURSOR) to the candidate of MESSAGE in chunks of
+        SYNC_RESPONSE_CHUNK_SIZE packets, as they are produced.
+
+        This may be called on the database executor thread, the chunks are always sent on the reactor thread.
+
+        @return: the packets that were sent
+        """
+        packets = []
+        chunk = []
+        for packet in iter_sync_response(bloom_filter, cursor):
+            chunk.append(packet)
+            if len(chunk) >= SYNC_RESPONSE_CHUNK_SIZE:
+                self._send_sync_response(chunk, message)
+                packets.extend(chunk)
+                chunk = []
+
+        if chunk:
+            self._send_sync_response(chunk, message)
+            packets.extend(chunk)
+
+        return packets
+
+    @call_on_reactor_thread
+    def _send_sync_response(self, packets, message):
+        if self._dispersy.running:
+            self._dispersy._send_packets([message.candidate], packets, self, "-caused by sync-")
+
+    def _cache_sync_response(self, packets, key, generation):
+        self._sync_response_cache.put(key, packets, generation)
+        return packets
+
+    def _on_sync_response_sent(self, packets, message):
+        if packets:
+            self._logger.debug("synced %d packets (%d bytes) to %s",
+                               len(packets), sum(len(packet) for packet in packets), message.candidate)
+
+    def _on_sync_response_error(self, failure, message):
+        self._logger.error("unable to select the sync response for %s: %s", message.candidate, failure.getErrorMessage())
 
     def check_introduction_response(self, messages):
         identifiers_seen = {}
@@ -2688,6 +3232,8 @@ class Community(TaskManager):
                     try:
                         _, packets = self._get_packets_for_bloomfilters([[None, time_low, self.global_time if time_high == 0 else time_high, offset, modulo]], include_inactive=True).next()
                         packets = [packet for packet, in packets]
+                        if self.dispersy_sync_bloom_filter_digest:
+                            packets = [get_key_digest(packet) for packet in packets]
 
                     except OverflowError:
                         self._logger.error("time_low:  %d", time_low)
@@ -2719,11 +3265,14 @@ class Community(TaskManager):
             args_list += extra_payload
         args_list = tuple(args_list)
 
+        # a forwarded request is signed by the signing service, i.e. its packet may not yet be signed when it is
+        # returned
         meta_request = self.get_meta_message(u"dispersy-introduction-request")
         request = meta_request.impl(authentication=(self.my_member,),
                                     distribution=(self.global_time,),
                                     destination=(destination,),
-                                    payload=args_list)
+                                    payload=args_list,
+                                    empty_signature=forward)
 
         if forward:
             if sync:
@@ -2735,7 +3284,7 @@ class Community(TaskManager):
                 self._logger.debug("%s %s sending introduction request to %s",
                                    self.cid.encode("HEX"), type(self), destination)
 
-            self._dispersy._forward([request])
+            self._dispersy._sign_and_forward([request])
 
         return request
 
@@ -2752,6 +3301,25 @@ class Community(TaskManager):
 
         @return: An generator yielding the original request and a generator consisting of the packets matching the request
         """
+        for message, sql, sql_arguments in self._get_queries_for_bloomfilters(requests, include_inactive):
+            yield message, ((str(packet),) for packet, in self._dispersy._database.execute(sql, sql_arguments))
+
+    def _get_queries_for_bloomfilters(self, requests, include_inactive=True, columns=u"sync.packet"):
+        """
+        Return the SQL queries that select the packets matching a Bloomfilter request
+
+        @param requests: A list of requests, each of them being a tuple consisting of the request,
+         time_low, time_high, offset, and modulo
+        @type requests: list
+
+        @param include_inactive: When False only active packets (due to pruning) are returned
+        @type include_inactive: bool
+
+        @param columns: The columns that are selected from the sync table
+        @type columns: unicode
+
+        @return: An generator yielding the original request, the SQL statement, and its arguments
+        """
 
         assert isinstance(requests, list)
         assert all(isinstance(request, (list, tuple)) for request in requests)
@@ -2762,21 +3330,21 @@ class Community(TaskManager):
             if direction == u"ASC":
                 return u"""
  SELECT * FROM
-  (SELECT sync.packet FROM sync    -- """ + meta.name + """
+  (SELECT """ + columns + """ FROM sync    -- """ + meta.name + """
    WHERE sync.meta_message = ? AND sync.undone = 0 AND sync.global_time BETWEEN ? AND ? AND (sync.global_time + ?) % ? = 0
    ORDER BY sync.global_time ASC)"""
 
             if direction == u"DESC":
                 return u"""
  SELECT * FROM
-  (SELECT sync.packet FROM sync    -- """ + meta.name + """
+  (SELECT """ + columns + """ FROM sync    -- """ + meta.name + """
    WHERE sync.meta_message = ? AND sync.undone = 0 AND sync.global_time BETWEEN ? AND ? AND (sync.global_time + ?) % ? = 0
    ORDER BY sync.global_time DESC)"""
 
             if direction == u"RANDOM":
                 return u"""
  SELECT * FROM
-  (SELECT sync.packet FROM sync    -- """ + meta.name + """
+  (SELECT """ + columns + """ FROM sync    -- """ + meta.name + """
    WHERE sync.meta_message = ? AND sync.undone = 0 AND sync.global_time BETWEEN ? AND ? AND (sync.global_time + ?) % ? = 0
    ORDER BY RANDOM())"""
 
@@ -2804,7 +3372,7 @@ class Community(TaskManager):
                 sql_arguments.extend((meta.database_id, _time_low, time_high, offset, modulo))
             self._logger.debug("%s", sql_arguments)
 
-            yield message, ((str(packet),) for packet, in self._dispersy._database.execute(sql, sql_arguments))
+            yield message, sql, sql_arguments
 
     def check_puncture_request(self, messages):
         for message in messages:
@@ -2893,23 +3461,28 @@ class Community(TaskManager):
 
     def on_missing_message(self, messages):
         for message in messages:
+            # the packets are selected by the database executor or one of the read connections, possibly on another
+            # thread
+            deferred = self._dispersy.database.execute_in_async(
+                u"SELECT packet FROM sync WHERE community = ? AND member = ? AND global_time IN (%s)",
+                (self.database_id, message.payload.member.database_id),
+                sorted(set(message.payload.global_times)),
+                fetch=lambda cursor: [str(packet) for packet, in cursor],
+                read_only=True)
+            deferred.addCallback(self._send_missing_message_response, message)
+            deferred.addErrback(self._on_missing_message_response_error, message)
+
+    def _send_missing_message_response(self, packets, message):
+        if packets:
+            if self._dispersy.running:
+                self._dispersy._send_packets([message.candidate], packets, self, "-caused by missing-message-")
+        else:
+            self._logger.warning('could not find missing messages for candidate %s, global_times %s',
+                                 message.candidate, message.payload.global_times)
 
-            responses = []
-            candidate = message.candidate
-            member_database_id = message.payload.member.database_id
-            for global_time in message.payload.global_times:
-                try:
-                    packet, = self._dispersy._database.execute(u"SELECT packet FROM sync WHERE community = ? AND member = ? AND global_time = ?",
-                                                              (self.database_id, member_database_id, global_time)).next()
-                    responses.append(str(packet))
-                except StopIteration:
-                    pass
-
-            if responses:
-                self._dispersy._send_packets([candidate], responses, self, "-caused by missing-message-")
-            else:
-                self._logger.warning('could not find missing messages for candidate %s, global_times %s',
-                                     candidate, message.payload.global_times)
+    def _on_missing_message_response_error(self, failure, message):
+        self._logger.error("unable to select the missing messages for %s: %s",
+                           message.candidate, failure.getErrorMessage())
 
     def create_identity(self, sign_with_master=False, store=True, update=True):
         """
@@ -3474,6 +4047,7 @@ class Community(TaskManager):
 
         self._dispersy._database.executemany(u"UPDATE sync SET undone = ? "
                                              u"WHERE community = ? AND member = ? AND global_time = ?", parameters)
+        self.on_sync_table_changed(undone=[(member_id, global_time) for _, _, member_id, global_time in parameters])
 
         for meta, sub_messages in groupby(real_messages, key=lambda x: x.payload.packet.meta):
             meta.undo_callback([(message.payload.member, message.payload.global_time, message.payload.packet) for message in sub_messages])
@@ -3563,7 +4137,7 @@ class Community(TaskManager):
                                 packet_ids.add(packet_id)
 
                         # get proofs required for ITEM
-                        _, proofs = self._timeline.check(item)
+                        _, proofs = self.timeline.check(item)
                         todo.extend(proofs)
 
                 # 1. cleanup the double_signed_sync table.
@@ -3572,6 +4146,10 @@ class Community(TaskManager):
                 # 2. cleanup sync table.  everything except what we need to tell others this
                 # community is no longer available
                 self._dispersy._database.execute(u"DELETE FROM sync WHERE community = ? AND id NOT IN (" + u", ".join(u"?" for _ in packet_ids) + ")", [self.database_id] + list(packet_ids))
+                self.on_sync_table_changed(deleted=(None, None))
+
+                # 3. the timeline no longer matches the sync table, it must not be persisted
+                self.discard_timeline_snapshot()
 
             self._dispersy.reclassify_community(self, new_classification)
 
@@ -3629,6 +4207,8 @@ class Community(TaskManager):
 
         if undo:
             executemany(u"UPDATE sync SET undone = 1 WHERE id = ?", ((message.packet_id,) for message in undo))
+            self.on_sync_table_changed(undone=[(message.authentication.member.database_id, message.distribution.global_time)
+                                               for message in undo])
             meta.undo_callback([(message.authentication.member, message.distribution.global_time, message) for message in undo])
 
             # notify that global times have changed
@@ -3636,6 +4216,7 @@ class Community(TaskManager):
 
         if redo:
             executemany(u"UPDATE sync SET undone = 0 WHERE id = ?", ((message.packet_id,) for message in redo))
+            self.on_sync_table_changed(redone=redo)
             meta.handle_callback(redo)
 
     def _claim_master_member_sequence_number(self, meta):
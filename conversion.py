@@ -1,16 +1,16 @@
 from abc import ABCMeta, abstractmethod
 from math import ceil
 from socket import inet_ntoa, inet_aton
-from struct import pack, unpack_from, Struct
+from struct import pack, unpack_from, Struct, error as StructError
 import logging
 
 from .authentication import Authentication, NoAuthentication, MemberAuthentication, DoubleMemberAuthentication
-from .bloomfilter import BloomFilter
+from .bloomfilter import BytearrayBloomFilter
 from .candidate import Candidate
 from .destination import Destination, CommunityDestination, CandidateDestination
 from .distribution import Distribution, FullSyncDistribution, LastSyncDistribution, DirectDistribution
 from .exception import MetaNotFoundException
-from .message import DelayPacketByMissingMember, DropPacket, Message
+from .message import DelayPacket, DelayPacketByMissingMember, DropPacket, Message
 from .payload import Payload
 from .resolution import Resolution, PublicResolution, LinearResolution, DynamicResolution
 from .util import attach_runtime_statistics
@@ -94,6 +94,17 @@ class Conversion(object):
         """
         assert self.can_decode_message(data)
 
+    def decode_member_and_global_time(self, candidate, data):
+        """
+        Obtain the creator and global time from DATA without decoding the entire message.
+
+        The signature is not verified, hence the result may only be used to recognise packets that we
+        already have.
+
+        Returns a (Member, global_time) tuple or None when this is not possible.
+        """
+        return None
+
     @abstractmethod
     def decode_message(self, address, data, verify=True, source=u"unknown"):
         """
@@ -113,16 +124,33 @@ class Conversion(object):
         assert isinstance(message, (Message, Message.Implementation)), type(message)
 
     @abstractmethod
-    def encode_message(self, message, sign=True):
+    def encode_message(self, message, sign=True, empty_signature=False):
         """
         Encode a Message instance into a binary string where the first byte is the on-the-wire
         Dispersy version, the second byte is the on-the-wire Community version and the following 20
         bytes is the Community Identifier.  The rest is the message payload.
 
+        When EMPTY_SIGNATURE is True the signature(s) are left empty, i.e. \\x00 bytes, such that they
+        can be made later, e.g. by the SigningService.
+
         Returns a binary string.
         """
         assert self.can_encode_message(message)
         assert isinstance(sign, bool), type(sign)
+        assert isinstance(empty_signature, bool), type(empty_signature)
+
+    def encode_unsigned_message(self, message):
+        """
+        Encode a Message instance into a binary string without its signature(s).
+
+        The signature(s) are made over this string and appended to it.  By default the message is encoded with an
+        empty signature, which is then removed.
+
+        Returns a binary string.
+        """
+        assert self.can_encode_message(message)
+        packet = self.encode_message(message, empty_signature=True)
+        return packet[:len(packet) - len(message.authentication.empty_signature)]
 
     def __str__(self):
         return "<%s %s%s>" % (self.__class__.__name__, self.dispersy_version.encode("HEX"), self.community_version.encode("HEX"))
@@ -788,7 +816,7 @@ class NoDefBinaryConversion(Conversion):
             if not length == len(data) - offset:
                 raise DropPacket("Invalid number of bytes available")
 
-            bloom_filter = BloomFilter(data[offset:offset + length], functions, prefix=prefix)
+            bloom_filter = BytearrayBloomFilter(data[offset:offset + length], functions, prefix=prefix)
             offset += length
 
             sync = (time_low, time_high, modulo, modulo_offset, bloom_filter)
@@ -973,7 +1001,13 @@ class NoDefBinaryConversion(Conversion):
         return message.name in self._encode_message_map
 
     @attach_runtime_statistics(u"{0.__class__.__name__}.{function_name} {1.name}")
-    def encode_message(self, message, sign=True):
+    def encode_message(self, message, sign=True, empty_signature=False):
+        packet = self.encode_unsigned_message(message)
+        if empty_signature:
+            return packet + message.authentication.empty_signature
+        return packet + message.authentication.sign(packet)
+
+    def encode_unsigned_message(self, message):
         assert isinstance(message, Message.Implementation), message
         assert message.name in self._encode_message_map, message.name
         encode_functions = self._encode_message_map[message.name]
@@ -996,9 +1030,7 @@ class NoDefBinaryConversion(Conversion):
         assert all(isinstance(x, str) for x in payload)
         container.extend(payload)
 
-        # sign
-        packet = "".join(container)
-        return packet + message.authentication.sign(packet)
+        return "".join(container)
 
     #
     # Decoding
@@ -1173,6 +1205,32 @@ class NoDefBinaryConversion(Conversion):
 
         return self._decode_message_map[data[22]].meta
 
+    def decode_member_and_global_time(self, candidate, data):
+        """
+        Decode only the authentication, resolution, and distribution of DATA.
+
+        Returns a (Member, global_time) tuple, or None when the message has no member or when
+        DATA can not be decoded this far.
+        """
+        assert isinstance(candidate, Candidate), candidate
+        assert isinstance(data, str), type(data)
+        if not self.can_decode_message(data):
+            return None
+
+        decode_functions = self._decode_message_map[data[22]]
+        if isinstance(decode_functions.meta.authentication, NoAuthentication):
+            return None
+
+        placeholder = self.Placeholder(candidate, decode_functions.meta, 23, data, False, False)
+        try:
+            decode_functions.authentication(placeholder)
+            decode_functions.resolution(placeholder)
+            decode_functions.distribution(placeholder)
+        except (DropPacket, DelayPacket, StructError):
+            return None
+
+        return placeholder.authentication.member, placeholder.distribution.global_time
+
     @attach_runtime_statistics(u"{0.__class__.__name__}.{function_name} {return_value}")
     def decode_message(self, candidate, data, verify=True, allow_empty_signature=False, source="unknown"):
         """
@@ -1180,7 +1238,8 @@ class NoDefBinaryConversion(Conversion):
         Dispersy specific parameters.
 
         When VERIFY is True the signature(s), if applicable, are verified.  Otherwise the
-        signature(s) are ignored.
+        signature(s) are ignored.  Packets whose signatures were verified before are found in the
+        verified signature cache of Dispersy and are not verified again.
         
         Invalid signature(s) will cause DropPacket to be raised, except when ALLOW_EMPTY_SIGNATURE
         is True and the failed signature consist of \x00 bytes.
@@ -1214,8 +1273,11 @@ class NoDefBinaryConversion(Conversion):
         decode_functions.distribution(placeholder)
         assert isinstance(placeholder.distribution, Distribution.Implementation)
 
-        # payload
-        payload = placeholder.data[:placeholder.first_signature_offset]
+        # payload.  the payload decoder is given a read-only buffer that refers to the packet instead of
+        # a copy.  a buffer supports len, indexing, and struct.unpack_from, while slicing it returns a
+        # str, hence decoders work on it without changes.  the same buffer is used to verify the
+        # signature(s)
+        payload = buffer(placeholder.data, 0, placeholder.first_signature_offset)
         placeholder.offset, placeholder.payload = decode_functions.payload(placeholder, placeholder.offset, payload)
         if placeholder.offset != placeholder.first_signature_offset:
             self._logger.warning("invalid packet size for %s data:%d; offset:%d",
@@ -1226,8 +1288,15 @@ class NoDefBinaryConversion(Conversion):
         assert isinstance(placeholder.offset, (int, long))
 
         # verify payload
-        if placeholder.verify and not placeholder.authentication.has_valid_signature_for(placeholder, payload):
-            raise DropPacket("Invalid signature")
+        if placeholder.verify and not isinstance(placeholder.authentication, NoAuthentication.Implementation):
+            dispersy = self._community.dispersy
+            if not dispersy.has_verified_signature(placeholder.data):
+                if not placeholder.authentication.has_valid_signature_for(placeholder, payload):
+                    raise DropPacket("Invalid signature")
+
+                # an empty signature is only accepted when it is allowed, hence it must not be cached
+                if not placeholder.allow_empty_signature:
+                    dispersy.add_verified_signature(placeholder.data)
 
         return placeholder.meta.Implementation(placeholder.meta, placeholder.authentication, placeholder.resolution, placeholder.distribution, placeholder.destination, placeholder.payload, conversion=self, candidate=candidate, source=source, packet=placeholder.data)
 
@@ -203,7 +203,7 @@ class ECCrypto(DispersyCrypto):
         Returns True when SIGNATURE matches the DIGEST made using EC.
         """
         assert isinstance(ec, DispersyKey), ec
-        assert isinstance(data, str), type(data)
+        assert isinstance(data, (str, buffer)), type(data)
         assert isinstance(signature, str), type(signature)
         assert len(signature) == self.get_signature_length(ec), [len(signature), self.get_signature_length(ec)]
 
@@ -388,7 +388,8 @@ class LibNaCLPK(DispersyKey):
 
     @attach_runtime_statistics(u"{0.__class__.__name__}.{function_name}")
     def verify(self, signature, msg):
-        return self.veri.verify(signature + msg)
+        # libnacl expects the signature and message as a single str, str(msg) does not copy a str
+        return self.veri.verify(signature + str(msg))
 
     def key_to_bin(self):
         return "LibNaCLPK:" + self.key.pk + self.veri.vk
@@ -10,10 +10,19 @@ import sys
 import thread
 from abc import ABCMeta, abstractmethod
 from sqlite3 import Connection
+from threading import RLock, local
+
+from twisted.internet import reactor
+from twisted.internet.defer import FirstError, gatherResults, maybeDeferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
 
 from .util import attach_runtime_statistics
 
 
+# the default SQLITE_MAX_VARIABLE_NUMBER, i.e. the maximum number of ? placeholders in a single statement
+SQLITE_MAX_VARIABLE_NUMBER = 999
+
 if "--explain-query-plan" in getattr(sys, "argv", []):
     _explain_query_plan_logger = logging.getLogger("explain-query-plan")
     _explain_query_plan = set()
@@ -53,18 +62,159 @@ class IgnoreCommits(Exception):
         super(IgnoreCommits, self).__init__("Ignore all commits made within __enter__ and __exit__")
 
 
+class DatabaseExecutor(object):
+
+    """
+    Runs the asynchronous database calls, i.e. Database.execute_async, on the calling thread.
+
+    The returned Deferred has already fired.  This is the default executor, it keeps the behaviour identical to the
+    synchronous Database.execute calls.
+    """
+
+    # when True, the database connection is used from another thread than the one that opened it
+    threaded = False
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def run(self, func, *args, **kargs):
+        """
+        Returns a Deferred that fires with the result of FUNC(*ARGS, **KARGS).
+        """
+        return maybeDeferred(func, *args, **kargs)
+
+
+class ThreadDatabaseExecutor(DatabaseExecutor):
+
+    """
+    Runs the asynchronous database calls on a dedicated worker thread.
+
+    The calls are performed in order, one at a time.  The resulting Deferred fires on the reactor thread.
+    """
+
+    threaded = True
+
+    def __init__(self):
+        super(ThreadDatabaseExecutor, self).__init__()
+        self._threadpool = None
+
+    def start(self):
+        assert self._threadpool is None, "ThreadDatabaseExecutor.start() has already been called"
+        self._threadpool = ThreadPool(1, 1, name="DatabaseExecutor")
+        self._threadpool.start()
+
+    def stop(self):
+        if self._threadpool:
+            # waits for the currently running call to finish
+            self._threadpool.stop()
+            self._threadpool = None
+
+    def run(self, func, *args, **kargs):
+        assert self._threadpool, "ThreadDatabaseExecutor.start() has not been called"
+        return deferToThreadPool(reactor, self._threadpool, func, *args, **kargs)
+
+
+class ReadConnectionPool(object):
+
+    """
+    A pool of worker threads where each thread owns one read-only connection to the database.
+
+    The database must use WAL journaling, this allows the readers to run in parallel to each other and to the single
+    writer.  Note that the readers only see the data that has been committed by the writer.
+    """
+
+    def __init__(self, file_path, size):
+        assert isinstance(file_path, unicode), type(file_path)
+        assert file_path != u":memory:", "a memory database can not be shared between connections"
+        assert isinstance(size, int), type(size)
+        assert size > 0, size
+        super(ReadConnectionPool, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._file_path = file_path
+        self._size = size
+        self._threadpool = None
+        self._local = local()
+        self._connections = []
+        self._connections_lock = RLock()
+
+    @property
+    def size(self):
+        return self._size
+
+    def start(self):
+        assert self._threadpool is None, "ReadConnectionPool.start() has already been called"
+        self._threadpool = ThreadPool(self._size, self._size, name="ReadConnectionPool")
+        self._threadpool.start()
+
+    def stop(self):
+        if self._threadpool:
+            # waits for the currently running queries to finish
+            self._threadpool.stop()
+            self._threadpool = None
+
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+    def _get_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self._logger.debug("open read connection [%s]", self._file_path)
+            # the connection is closed from the reactor thread in stop()
+            connection = Connection(self._file_path, check_same_thread=False)
+            try:
+                connection.execute(u"PRAGMA query_only = 1")
+            except Exception:
+                # query_only is available since SQLite 3.8.0
+                self._logger.debug("PRAGMA query_only is not supported [%s]", self._file_path)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _execute(self, statement, bindings, fetch):
+        cursor = self._get_connection().cursor()
+        try:
+            return fetch(cursor.execute(statement, bindings))
+        finally:
+            cursor.close()
+
+    def execute(self, statement, bindings, fetch):
+        """
+        Returns a Deferred that fires with FETCH(cursor) on the reactor thread, the STATEMENT is executed on one of
+        the read connections.
+        """
+        assert self._threadpool, "ReadConnectionPool.start() has not been called"
+        return deferToThreadPool(reactor, self._threadpool, self._execute, statement, bindings, fetch)
+
+
 class Database(object):
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, executor=None, read_connections=0):
         """
         Initialize a new Database instance.
 
         @param file_path: the path to the database file.
         @type file_path: unicode
+
+        @param executor: the executor that runs the execute_async and executemany_async calls, the default
+                         DatabaseExecutor runs them immediately on the calling thread.
+        @type executor: DatabaseExecutor or None
+
+        @param read_connections: the number of additional read-only connections that run the
+                                 execute_async(..., read_only=True) calls in parallel.  Ignored for memory databases.
+        @type read_connections: int
         """
         assert isinstance(file_path, unicode)
+        assert executor is None or isinstance(executor, DatabaseExecutor), type(executor)
+        assert isinstance(read_connections, int), type(read_connections)
+        assert read_connections >= 0, read_connections
 
         super(Database, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
@@ -77,6 +227,22 @@ class Database(object):
         self._cursor = None
         self._database_version = 0
 
+        # the executor runs the asynchronous calls.  _LOCK ensures that the executor and the synchronous calls do
+        # not use the connection at the same time, sqlite3 resets all running statements on commit
+        self._executor = executor or DatabaseExecutor()
+        self._lock = RLock()
+        # a threaded executor runs execute_async on its own connection, opened on the executor thread, to avoid
+        # holding _LOCK while the query runs.  memory databases can not be shared between connections
+        self._use_executor_connection = self._executor.threaded and file_path != u":memory:"
+        self._executor_connection = None
+
+        # _READ_POOL is created during open(...) when read connections are requested
+        if read_connections and file_path == u":memory:":
+            self._logger.warning("ignoring %d read connections for a memory database", read_connections)
+            read_connections = 0
+        self._read_connections = read_connections
+        self._read_pool = None
+
         # _commit_callbacks contains a list with functions that are called on each database commit
         self._commit_callbacks = []
 
@@ -98,11 +264,22 @@ class Database(object):
             self._initial_statements()
         if prepare_visioning:
             self._prepare_version()
+        self._executor.start()
+        if self._read_connections:
+            self._read_pool = ReadConnectionPool(self._file_path, self._read_connections)
+            self._read_pool.start()
         return True
 
     def close(self, commit=True):
         assert self._cursor is not None, "Database.close() has been called or Database.open() has not been called"
         assert self._connection is not None, "Database.close() has been called or Database.open() has not been called"
+        if self._read_pool:
+            self._read_pool.stop()
+            self._read_pool = None
+        self._executor.stop()
+        if self._executor_connection:
+            self._executor_connection.close()
+            self._executor_connection = None
         if commit:
             self.commit(exiting=True)
         self._logger.debug("close database [%s]", self._file_path)
@@ -113,7 +290,7 @@ class Database(object):
         return True
 
     def _connect(self):
-        self._connection = Connection(self._file_path)
+        self._connection = Connection(self._file_path, check_same_thread=not self._executor.threaded)
         self._cursor = self._connection.cursor()
 
     def _initial_statements(self):
@@ -152,7 +329,9 @@ class Database(object):
         #
         if not (journal_mode == u"WAL" or self._file_path == u":memory:"):
             self._logger.debug("PRAGMA journal_mode = WAL (previously: %s) [%s]", journal_mode, self._file_path)
-            self._cursor.execute(u"PRAGMA locking_mode = EXCLUSIVE")
+            # the read and executor connections can not access the database while the writer holds an exclusive lock
+            if not (self._read_connections or self._use_executor_connection):
+                self._cursor.execute(u"PRAGMA locking_mode = EXCLUSIVE")
             self._cursor.execute(u"PRAGMA journal_mode = WAL")
 
         else:
@@ -197,6 +376,20 @@ class Database(object):
     def database_version(self):
         return self._database_version
 
+    @property
+    def executor(self):
+        """
+        The DatabaseExecutor that runs the asynchronous calls.
+        """
+        return self._executor
+
+    @property
+    def read_pool(self):
+        """
+        The ReadConnectionPool that runs the read-only asynchronous calls, or None when there are no read connections.
+        """
+        return self._read_pool
+
     @property
     def file_path(self):
         """
@@ -290,9 +483,10 @@ class Database(object):
             assert all(tests), "Bindings may not be strings.  Provide unicode for TEXT and buffer(...) for BLOB\n%s" % (statement,)
 
         self._logger.log(logging.NOTSET, "%s <-- %s [%s]", statement, bindings, self._file_path)
-        result = self._cursor.execute(statement, bindings)
-        if get_lastrowid:
-            result = self._cursor.lastrowid
+        with self._lock:
+            result = self._cursor.execute(statement, bindings)
+            if get_lastrowid:
+                result = self._cursor.lastrowid
         return result
 
     @attach_runtime_statistics(u"{0.__class__.__name__}.{function_name} {1} [{0.file_path}]")
@@ -304,7 +498,8 @@ class Database(object):
         assert isinstance(statements, unicode), "The SQL statement must be given in unicode"
 
         self._logger.log(logging.NOTSET, "%s [%s]", statements, self._file_path)
-        return self._cursor.executescript(statements)
+        with self._lock:
+            return self._cursor.executescript(statements)
 
     @attach_explain_query_plan
     @attach_runtime_statistics(u"{0.__class__.__name__}.{function_name} {1} [{0.file_path}]")
@@ -364,7 +559,206 @@ class Database(object):
                 sequenceofbindings = iter(sequenceofbindings)
 
         self._logger.log(logging.NOTSET, "%s [%s]", statement, self._file_path)
-        return self._cursor.executemany(statement, sequenceofbindings)
+        with self._lock:
+            return self._cursor.executemany(statement, sequenceofbindings)
+
+    def executemany_lastrowid(self, statement, sequenceofbindings):
+        """
+        Execute one INSERT statement several times and return the rowid of the last inserted row.
+
+        The statement and bindings follow the same rules as Database.executemany.  The rowid is read while the lock
+        is still held, hence no statement from the executor can insert rows in between.  When the table has an
+        INTEGER PRIMARY KEY AUTOINCREMENT column the inserted rows therefore have consecutive ids ending at the
+        returned rowid.
+
+        @returns: the rowid of the last inserted row
+        """
+        with self._lock:
+            self.executemany(statement, sequenceofbindings)
+            rowid, = self._cursor.execute(u"SELECT last_insert_rowid()").next()
+            return rowid
+
+    def execute_async(self, statement, bindings=(), fetch=list, read_only=False):
+        """
+        Execute one SQL statement using the executor.
+
+        The statement and bindings follow the same rules as Database.execute.  FETCH is called with the resulting
+        cursor, on the executor thread, and its return value is the result of the Deferred.  The default FETCH
+        returns a list with all rows.  A FETCH that only consumes part of the cursor allows a query to stop early.
+
+        When READ_ONLY is True and the database has read connections, the statement runs on one of the read
+        connections instead, in parallel to the other queries.  These connections only see committed data.
+
+        A threaded executor runs the statement on its own connection, which also only sees committed data.  Unless
+        READ_ONLY is True the pending changes are therefore committed first, note that this is not possible within a
+        'with database:' clause.
+
+        @param statement: the SQL statement that is to be executed.
+        @type statement: unicode
+
+        @param bindings: the values that must be set to the placeholders in statement.
+        @type bindings: list, tuple, dict, or set
+
+        @param fetch: called with the cursor, its result is given to the Deferred.
+        @type fetch: callable
+
+        @param read_only: True when the statement does not modify the database.
+        @type read_only: bool
+
+        @returns: a Deferred that fires with the result of FETCH on the reactor thread
+        """
+        assert self._connection is not None, "Database.close() has been called or Database.open() has not been called"
+        assert isinstance(statement, unicode), "The SQL statement must be given in unicode"
+        assert isinstance(bindings, (tuple, list, dict, set)), "The bindings must be a tuple, list, dictionary, or set"
+        assert callable(fetch), type(fetch)
+        assert isinstance(read_only, bool), type(read_only)
+        self._logger.log(logging.NOTSET, "%s <-- %s [%s] (async)", statement, bindings, self._file_path)
+        if read_only and self._read_pool:
+            return self._read_pool.execute(statement, bindings, fetch)
+        if self._use_executor_connection and not read_only:
+            self.commit()
+        return self._executor.run(self._execute_on_executor, statement, bindings, fetch)
+
+    def executemany_async(self, statement, sequenceofbindings):
+        """
+        Execute one SQL statement several times using the executor.
+
+        The statement and bindings follow the same rules as Database.executemany.  Note that generators are
+        consumed on the executor thread.  The statements are part of the current transaction, hence they always use
+        the connection of the synchronous calls.
+
+        @returns: a Deferred that fires on the reactor thread once the statements have been executed
+        """
+        assert self._connection is not None, "Database.close() has been called or Database.open() has not been called"
+        assert isinstance(statement, unicode), "The SQL statement must be given in unicode"
+        self._logger.log(logging.NOTSET, "%s [%s] (async)", statement, self._file_path)
+        return self._executor.run(self._executemany_on_executor, statement, sequenceofbindings)
+
+    def _get_executor_connection(self):
+        # called on the executor thread, the connection is closed from the reactor thread in close()
+        if self._executor_connection is None:
+            self._logger.debug("open executor connection [%s]", self._file_path)
+            self._executor_connection = Connection(self._file_path, check_same_thread=False)
+            # never keep a transaction open on this connection, it would block the synchronous calls
+            self._executor_connection.isolation_level = None
+        return self._executor_connection
+
+    def _execute_on_executor(self, statement, bindings, fetch):
+        if self._use_executor_connection:
+            cursor = self._get_executor_connection().cursor()
+            try:
+                return fetch(cursor.execute(statement, bindings))
+            finally:
+                cursor.close()
+
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                return fetch(cursor.execute(statement, bindings))
+            finally:
+                cursor.close()
+
+    def _executemany_on_executor(self, statement, sequenceofbindings):
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                cursor.executemany(statement, sequenceofbindings)
+            finally:
+                cursor.close()
+
+    def execute_in(self, statement, bindings, values):
+        """
+        Execute one SQL statement that contains an 'IN (%s)' clause for VALUES and return all rows.
+
+        STATEMENT must contain a single %s that is replaced by one placeholder for every value.  BINDINGS are the
+        values for the placeholders that precede the IN clause.  When there are more values than SQLite allows
+        placeholders in a single statement, the values are split over multiple queries.
+
+        @param statement: the SQL statement that is to be executed.
+        @type statement: unicode
+
+        @param bindings: the values that must be set to the placeholders preceding the IN clause.
+        @type bindings: tuple
+
+        @param values: the values for the IN clause.
+        @type values: list, tuple, set, or generator
+
+        @returns: a list with all resulting rows
+        """
+        assert isinstance(statement, unicode), "The SQL statement must be given in unicode"
+        assert isinstance(bindings, tuple), type(bindings)
+        values = list(values)
+        chunk_size = SQLITE_MAX_VARIABLE_NUMBER - len(bindings)
+
+        rows = []
+        for index in xrange(0, len(values), chunk_size):
+            chunk = tuple(values[index:index + chunk_size])
+            rows.extend(self.execute(statement % u", ".join(u"?" * len(chunk)), bindings + chunk))
+        return rows
+
+    def execute_in_async(self, statement, bindings, values, fetch=list, read_only=False):
+        """
+        Execute one SQL statement that contains an 'IN (%s)' clause for VALUES using the executor.
+
+        STATEMENT, BINDINGS, and VALUES follow the same rules as Database.execute_in, FETCH and READ_ONLY follow the
+        same rules as Database.execute_async.  FETCH is called once for every chunk of VALUES and must return a list,
+        the lists are concatenated.
+
+        @returns: a Deferred that fires with the concatenated results of FETCH on the reactor thread
+        """
+        assert isinstance(statement, unicode), "The SQL statement must be given in unicode"
+        assert isinstance(bindings, tuple), type(bindings)
+        values = list(values)
+        chunk_size = SQLITE_MAX_VARIABLE_NUMBER - len(bindings)
+
+        deferreds = []
+        for index in xrange(0, len(values), chunk_size):
+            chunk = tuple(values[index:index + chunk_size])
+            deferreds.append(self.execute_async(statement % u", ".join(u"?" * len(chunk)), bindings + chunk,
+                                                fetch=fetch, read_only=read_only))
+
+        def concatenate(results):
+            return [row for result in results for row in result]
+
+        def unwrap(failure):
+            failure.trap(FirstError)
+            return failure.value.subFailure
+
+        return gatherResults(deferreds, consumeErrors=True).addCallbacks(concatenate, unwrap)
+
+    def execute_in_pairs(self, statement, bindings, pairs):
+        """
+        Execute one SQL statement that contains two 'IN (%s)' clauses for PAIRS and return all rows.
+
+        STATEMENT must contain two %s, the first is replaced by one placeholder for every distinct first value of
+        PAIRS and the second by one placeholder for every distinct second value.  The statement therefore selects
+        the cross product of the first and second values, the caller must discard the rows that do not match one of
+        PAIRS.  When there are more values than SQLite allows placeholders in a single statement, the pairs are split
+        over multiple queries.
+
+        @param statement: the SQL statement that is to be executed.
+        @type statement: unicode
+
+        @param bindings: the values that must be set to the placeholders preceding the IN clauses.
+        @type bindings: tuple
+
+        @param pairs: the (first, second) values for the IN clauses.
+        @type pairs: list, tuple, set, or generator
+
+        @returns: a list with all resulting rows
+        """
+        assert isinstance(statement, unicode), "The SQL statement must be given in unicode"
+        assert isinstance(bindings, tuple), type(bindings)
+        pairs = sorted(set(pairs))
+        chunk_size = (SQLITE_MAX_VARIABLE_NUMBER - len(bindings)) // 2
+
+        rows = []
+        for index in xrange(0, len(pairs), chunk_size):
+            firsts = tuple(set(first for first, _ in pairs[index:index + chunk_size]))
+            seconds = tuple(set(second for _, second in pairs[index:index + chunk_size]))
+            rows.extend(self.execute(statement % (u", ".join(u"?" * len(firsts)), u", ".join(u"?" * len(seconds))),
+                                     bindings + firsts + seconds))
+        return rows
 
     @attach_runtime_statistics(u"{0.__class__.__name__}.{function_name} [{0.file_path}]")
     def commit(self, exiting=False):
@@ -387,7 +781,8 @@ class Database(object):
                 except Exception as exception:
                     self._logger.exception("%s [%s]", exception, self._file_path)
 
-            return self._connection.commit()
+            with self._lock:
+                return self._connection.commit()
 
     @abstractmethod
     def check_database(self, database_version):
@@ -0,0 +1,158 @@
+"""
+This module provides the registry of delayed packets and messages that are waiting for a missing message.
+
+A DelayPacket or DelayMessage is registered under one or more (meta_name, mid, global_time, sequence_number) keys,
+where any element may be None to indicate a wildcard.  Every received message is matched against these keys to find
+the delays that can be resumed.  Instead of comparing each received message against every registered key, the
+registry remembers which wildcard shapes are in use.  For each shape the received message is projected onto that
+shape and looked up in a dictionary, making the cost of a match independent of the number of delays.
+
+The timeouts are kept in a heap ordered by deadline.  Delays that are resumed remain in the heap until their deadline
+has passed, at which point they are ignored.
+"""
+
+from collections import defaultdict
+from heapq import heappop, heappush
+from itertools import count
+
+
+# the number of seconds that a packet or message remains delayed before it times out
+DELAY_TIMEOUT = 10.0
+
+
+class DelayRegistry(object):
+
+    def __init__(self, timeout=DELAY_TIMEOUT):
+        """
+        Create an empty registry.
+
+        @param timeout: The number of seconds after which a delay times out.
+        @type timeout: float
+        """
+        assert isinstance(timeout, float), type(timeout)
+        super(DelayRegistry, self).__init__()
+        self._timeout = timeout
+
+        # key:[delay] pairs, where key is a (meta_name, mid, global_time, sequence_number) tuple
+        self._keys = {}
+        # delay:[key] pairs containing the keys that the delay is still waiting for
+        self._values = {}
+        # shape:count pairs, where shape is a tuple of four bools telling which key elements are not wildcards
+        self._shapes = defaultdict(int)
+        # (deadline, tie-breaker, delay) tuples
+        self._timeouts = []
+        self._tie_breaker = count()
+        # delay-class-name:count pairs for the registered delays
+        self._counts = defaultdict(int)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, delay):
+        return delay in self._values
+
+    def get_counts(self):
+        """
+        Returns a dictionary with the number of registered delays for each type of delay.
+        @rtype: {unicode:int}
+        """
+        return dict(self._counts)
+
+    def add(self, key, delay):
+        """
+        Register DELAY to wait for KEY.
+
+        Returns True when neither KEY nor DELAY were registered before, i.e. when the missing message must be
+        requested.
+        """
+        assert isinstance(key, tuple), type(key)
+        assert len(key) == 4, key
+        is_new = key not in self._keys and delay not in self._values
+
+        if key in self._keys:
+            self._keys[key].append(delay)
+        else:
+            self._keys[key] = [delay]
+            self._shapes[tuple(element is not None for element in key)] += 1
+
+        if delay in self._values:
+            self._values[delay].append(key)
+        else:
+            self._values[delay] = [key]
+            self._counts[unicode(type(delay).__name__)] += 1
+            heappush(self._timeouts, (delay.timestamp + self._timeout, next(self._tie_breaker), delay))
+
+        return is_new
+
+    def remove(self, delay):
+        """
+        Unregister DELAY, it will no longer be resumed or timed out.
+        """
+        for key in self._values.pop(delay):
+            delays = self._keys[key]
+            delays.remove(delay)
+            if not delays:
+                del self._keys[key]
+                self._forget_shape(key)
+
+        name = unicode(type(delay).__name__)
+        self._counts[name] -= 1
+        if not self._counts[name]:
+            del self._counts[name]
+
+    def _forget_shape(self, key):
+        shape = tuple(element is not None for element in key)
+        self._shapes[shape] -= 1
+        if not self._shapes[shape]:
+            del self._shapes[shape]
+
+    def resume(self, received_key):
+        """
+        Removes the keys that match RECEIVED_KEY and returns the delays that are no longer waiting for anything.
+
+        A key matches when each of its elements is either a wildcard or equal to the element in RECEIVED_KEY.  Delays
+        that are resumed are unregistered.
+
+        @param received_key: The (meta_name, mid, global_time, sequence_number) of a received message.
+        @type received_key: tuple
+
+        @rtype: [DelayPacket or DelayMessage]
+        """
+        assert isinstance(received_key, tuple), type(received_key)
+        assert len(received_key) == 4, received_key
+        resumed = []
+        for shape in self._shapes.keys():
+            # a key that is not a wildcard where RECEIVED_KEY has None can not match
+            if any(required and element is None for required, element in zip(shape, received_key)):
+                continue
+
+            key = tuple(element if required else None for required, element in zip(shape, received_key))
+            delays = self._keys.pop(key, None)
+            if delays is None:
+                continue
+            self._forget_shape(key)
+
+            for delay in delays:
+                if delay in self._values:
+                    delay_keys = self._values[delay]
+                    delay_keys.remove(key)
+
+                    if not delay_keys or delay.resume_immediately:
+                        self.remove(delay)
+                        resumed.append(delay)
+
+        return resumed
+
+    def expire(self, now):
+        """
+        Unregisters and returns the delays that were registered more than timeout seconds before NOW.
+        @rtype: [DelayPacket or DelayMessage]
+        """
+        expired = []
+        while self._timeouts and self._timeouts[0][0] < now:
+            _, _, delay = heappop(self._timeouts)
+            # resumed delays are not removed from the heap
+            if delay in self._values:
+                self.remove(delay)
+                expired.append(delay)
+        return expired
@@ -518,7 +518,7 @@ class DiscoveryCommunity(Community):
 
     def check_similarity_request(self, messages):
         for message in messages:
-            accepted, proof = self._timeline.check(message)
+            accepted, proof = self.timeline.check(message)
             if not accepted:
                 yield DelayMessageByProof(message)
                 continue
@@ -582,7 +582,7 @@ class DiscoveryCommunity(Community):
 
     def check_similarity_response(self, messages):
         for message in messages:
-            accepted, proof = self._timeline.check(message)
+            accepted, proof = self.timeline.check(message)
             if not accepted:
                 yield DelayMessageByProof(message)
                 continue
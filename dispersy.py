@@ -54,6 +54,7 @@ from twisted.python.failure import Failure
 from twisted.python.threadable import isInIOThread
 
 from .authentication import MemberAuthentication, DoubleMemberAuthentication
+from .bloomfilter import get_key_digest
 from .candidate import LoopbackCandidate, WalkCandidate, Candidate
 from .community import Community
 from .crypto import DispersyCrypto, ECCrypto
@@ -67,9 +68,12 @@ from .exception import CommunityNotFoundException, ConversionNotFoundException,
 from .member import DummyMember, Member
 from .message import (Message, DropMessage, DelayMessageBySequence,
                       DropPacket, DelayPacket)
+from .signingservice import SigningService
 from .statistics import DispersyStatistics, _runtime_statistics
 from .taskmanager import TaskManager
+from .timerwheel import TimerWheel
 from .util import attach_runtime_statistics, init_instrumentation, blocking_call_on_reactor_thread, is_valid_address
+from .verificationpool import VerificationPool
 
 
 # Set up the instrumentation utilities
@@ -77,6 +81,16 @@ init_instrumentation()
 
 FLUSH_DATABASE_INTERVAL = 60.0
 STATS_DETAILED_CANDIDATES_INTERVAL = 5.0
+# the maximum number of packet digests whose signatures are known to be valid
+VERIFIED_SIGNATURE_CACHE_SIZE = 4096
+
+# the default maximum number of members, parsed public keys, and unknown members that are cached
+MEMBER_CACHE_SIZE = 4096
+
+# the maximum number of known and unknown community ids whose database lookup is cached
+COMMUNITY_CACHE_SIZE = 4096
+# the number of seconds that a community id remains cached as unknown
+UNKNOWN_COMMUNITY_CACHE_TIMEOUT = 60.0
 
 
 class Dispersy(TaskManager):
@@ -86,7 +100,10 @@ class Dispersy(TaskManager):
     outgoing data for, possibly, multiple communities.
     """
 
-    def __init__(self, endpoint, working_directory, database_filename=u"dispersy.db", crypto=ECCrypto()):
+    def __init__(self, endpoint, working_directory, database_filename=u"dispersy.db", crypto=ECCrypto(), database_executor=None,
+                 database_read_connections=0, signature_verification_workers=0, signature_verification_processes=True,
+                 member_cache_size=MEMBER_CACHE_SIZE, signing_workers=0, signing_processes=True,
+                 signing_batch_window=0.0, lazy_community_initialization=False):
         """
         Initialise a Dispersy instance.
 
@@ -98,11 +115,56 @@ class Dispersy(TaskManager):
 
         @param database_filename: The database filename or u":memory:"
         @type database_filename: unicode
+
+        @param database_executor: Runs the asynchronous database queries, i.e. a ThreadDatabaseExecutor to perform
+                                  them off the reactor thread.  By default they are performed immediately.
+        @type database_executor: DatabaseExecutor or None
+
+        @param database_read_connections: The number of read-only database connections that serve the sync and
+                                          missing-message requests in parallel.  Requires a database file.
+        @type database_read_connections: int
+
+        @param signature_verification_workers: The number of workers that verify the signatures of incoming
+                                               batches.  When 0 the signatures are verified on the reactor thread.
+        @type signature_verification_workers: int
+
+        @param signature_verification_processes: When True the signatures are verified on worker processes,
+                                                 otherwise on worker threads.  Threads only scale when the crypto
+                                                 backend releases the GIL.
+        @type signature_verification_processes: bool
+
+        @param member_cache_size: The maximum number of members kept in memory.  The same limit applies to the
+                                  parsed public keys and to the members whose public key is unknown.
+        @type member_cache_size: int
+
+        @param signing_workers: The number of workers that sign the outgoing introduction requests and responses.
+                                When 0 they are signed on the reactor thread.
+        @type signing_workers: int
+
+        @param signing_processes: When True the messages are signed on worker processes, otherwise on worker threads.
+        @type signing_processes: bool
+
+        @param signing_batch_window: The number of seconds that outgoing introduction requests and responses are
+                                     collected before they are signed together.  When 0.0 they are signed immediately.
+        @type signing_batch_window: float
+
+        @param lazy_community_initialization: When True the communities defer replaying their timeline, storing
+                                              their meta messages, and checking their identity until they are first
+                                              used.  See Community.dispersy_lazy_initialization_enable.
+        @type lazy_community_initialization: bool
         """
         assert isinstance(endpoint, Endpoint), type(endpoint)
         assert isinstance(working_directory, unicode), type(working_directory)
         assert isinstance(database_filename, unicode), type(database_filename)
         assert isinstance(crypto, DispersyCrypto), type(crypto)
+        assert isinstance(signature_verification_workers, int), type(signature_verification_workers)
+        assert signature_verification_workers >= 0, signature_verification_workers
+        assert isinstance(member_cache_size, int), type(member_cache_size)
+        assert member_cache_size > 0, member_cache_size
+        assert isinstance(signing_workers, int), type(signing_workers)
+        assert signing_workers >= 0, signing_workers
+        assert isinstance(signing_batch_window, float), type(signing_batch_window)
+        assert isinstance(lazy_community_initialization, bool), type(lazy_community_initialization)
         super(Dispersy, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -116,7 +178,14 @@ class Dispersy(TaskManager):
 
         self._discovery_community = None
 
+        # mid:Member, public_key:DispersyKey, and mid:DummyMember pairs, in least recently used order
+        self._member_cache_size = member_cache_size
         self._member_cache_by_hash = OrderedDict()
+        self._public_key_cache = OrderedDict()
+        self._dummy_member_cache = OrderedDict()
+
+        # digests of packets whose signatures are valid, in least recently used order
+        self._verified_signature_cache = OrderedDict()
 
         # our data storage
         if not database_filename == u":memory:":
@@ -124,10 +193,26 @@ class Dispersy(TaskManager):
             if not os.path.isdir(database_directory):
                 os.makedirs(database_directory)
             database_filename = os.path.join(database_directory, database_filename)
-        self._database = DispersyDatabase(database_filename)
+        self._database = DispersyDatabase(database_filename, database_executor, database_read_connections)
 
         self._crypto = crypto
 
+        # verifies the signatures of incoming batches off the reactor thread
+        if signature_verification_workers:
+            self._verification_pool = VerificationPool(crypto, signature_verification_workers,
+                                                       signature_verification_processes)
+        else:
+            self._verification_pool = None
+
+        # signs the outgoing introduction requests and responses in batches, possibly off the reactor thread
+        self._signing_service = SigningService(crypto, signing_workers, signing_processes, signing_batch_window)
+
+        # schedules the timeouts of the request caches of all communities
+        self._timer_wheel = TimerWheel()
+
+        # the default for Community.dispersy_lazy_initialization_enable
+        self._lazy_community_initialization = lazy_community_initialization
+
         # indicates what our connection type is.  currently it can be u"unknown", u"public", or
         # u"symmetric-NAT"
         self._connection_type = u"unknown"
@@ -148,6 +233,11 @@ class Dispersy(TaskManager):
         # loaded communities.  cid:Community pairs.
         self._communities = {}
 
+        # cid:(classification, auto_load, master_public_key) pairs for communities in the database, and cid:expires
+        # pairs for community ids that are not in the database, both in least recently used order
+        self._community_metadata_cache = OrderedDict()
+        self._unknown_community_cache = OrderedDict()
+
         self._check_distribution_batch_map = {DirectDistribution: self._check_direct_distribution_batch,
                                               FullSyncDistribution: self._check_full_sync_distribution_batch,
                                               LastSyncDistribution: self._check_last_sync_distribution_batch}
@@ -347,6 +437,39 @@ class Dispersy(TaskManager):
         """
         return self._crypto
 
+    @property
+    def verification_pool(self):
+        """
+        The pool that verifies the signatures of incoming batches, or None when they are verified on the reactor
+        thread.
+        @rtype: VerificationPool or None
+        """
+        return self._verification_pool
+
+    @property
+    def signing_service(self):
+        """
+        The service that signs the outgoing introduction requests and responses.
+        @rtype: SigningService
+        """
+        return self._signing_service
+
+    @property
+    def timer_wheel(self):
+        """
+        The wheel that schedules the many short lived timeouts, i.e. those of the request caches.
+        @rtype: TimerWheel
+        """
+        return self._timer_wheel
+
+    @property
+    def lazy_community_initialization(self):
+        """
+        True when the communities defer most of their initialization until they are first used.
+        @rtype: bool
+        """
+        return self._lazy_community_initialization
+
     @property
     def statistics(self):
         """
@@ -380,6 +503,9 @@ class Dispersy(TaskManager):
             kargs = {}
         self._auto_load_communities[community_cls.get_classification()] = (community_cls, my_member, args, kargs)
 
+        # communities of this classification may have been added to the database while it was not defined
+        self._unknown_community_cache.clear()
+
         communities = []
         if load:
             for master in community_cls.get_master_members(self):
@@ -405,6 +531,7 @@ class Dispersy(TaskManager):
     def attach_community(self, community):
         # add community to communities dict
         self._communities[community.cid] = community
+        self._invalidate_community_cache(community.cid)
         self._statistics.dict_inc(u"attachment", community.cid)
 
         # let discovery community know
@@ -456,16 +583,32 @@ class Dispersy(TaskManager):
                 _key = self.crypto.key_from_private_bin(private_key)
                 mid = self.crypto.key_to_hash(_key.pub())
 
-        member = self._member_cache_by_hash.get(mid)
+        member = self._member_cache_by_hash.pop(mid, None)
         if member:
+            # move to the end, i.e. most recently used
+            self._member_cache_by_hash[mid] = member
+            self._statistics.member_cache_hits += 1
             return member
 
+        if public_key or private_key:
+            # the public key of this member is no longer unknown
+            self._dummy_member_cache.pop(mid, None)
+
+        else:
+            member = self._dummy_member_cache.pop(mid, None)
+            if member:
+                self._dummy_member_cache[mid] = member
+                self._statistics.dummy_member_cache_hits += 1
+                return member
+
+        self._statistics.member_cache_misses += 1
+
         if private_key:
             key = self.crypto.key_from_private_bin(private_key)
             public_key = self.crypto.key_to_bin(key.pub())
 
         elif public_key:
-            key = self.crypto.key_from_public_bin(public_key)
+            key = self._key_from_public_bin(public_key)
 
         # both public and private keys are valid at this point
 
@@ -497,10 +640,10 @@ class Dispersy(TaskManager):
 
                 # no priv/pubkey arguments passed, maybe use the public key from the database
                 elif public_key_from_db:
-                    key = self.crypto.key_from_public_bin(public_key_from_db)
+                    key = self._key_from_public_bin(public_key_from_db)
 
                 else:
-                    return DummyMember(self, database_id, mid)
+                    return self._cache_dummy_member(DummyMember(self, database_id, mid))
 
         # the member is not in the database, insert it
         elif public_key or private_key:
@@ -514,7 +657,7 @@ class Dispersy(TaskManager):
             # We could't find the key on the DB, nothing else to do
             database_id = self.database.execute(u"INSERT INTO member (mid) VALUES (?)",
                 (buffer(mid),), get_lastrowid=True)
-            return DummyMember(self, database_id, mid)
+            return self._cache_dummy_member(DummyMember(self, database_id, mid))
 
         member = Member(self, key, database_id, mid)
 
@@ -522,11 +665,75 @@ class Dispersy(TaskManager):
         self._member_cache_by_hash[member.mid] = member
 
         # limit cache length
-        if len(self._member_cache_by_hash) > 1024:
+        if len(self._member_cache_by_hash) > self._member_cache_size:
             self._member_cache_by_hash.popitem(False)
 
         return member
 
+    def _key_from_public_bin(self, public_key):
+        """
+        Returns the key parsed from PUBLIC_KEY, parsing it only when it is not in the public key cache.
+        """
+        key = self._public_key_cache.pop(public_key, None)
+        if key is None:
+            self._statistics.public_key_cache_misses += 1
+            key = self.crypto.key_from_public_bin(public_key)
+
+            # limit cache length
+            if len(self._public_key_cache) >= self._member_cache_size:
+                self._public_key_cache.popitem(False)
+
+        else:
+            self._statistics.public_key_cache_hits += 1
+
+        # (re)insert at the end, i.e. most recently used
+        self._public_key_cache[public_key] = key
+        return key
+
+    def _cache_dummy_member(self, member):
+        """
+        Remembers MEMBER, whose public key is unknown, until get_member is called with its public key.
+        """
+        assert type(member) is DummyMember, type(member)
+        self._dummy_member_cache[member.mid] = member
+
+        # limit cache length
+        if len(self._dummy_member_cache) > self._member_cache_size:
+            self._dummy_member_cache.popitem(False)
+
+        return member
+
+    def has_verified_signature(self, packet):
+        """
+        Returns True when the signatures of PACKET were verified before.
+
+        Both the hits and the misses are counted in the statistics.
+        """
+        assert isinstance(packet, str), type(packet)
+        digest = get_key_digest(packet)
+        if digest in self._verified_signature_cache:
+            # move to the end, i.e. most recently used
+            del self._verified_signature_cache[digest]
+            self._verified_signature_cache[digest] = None
+            self._statistics.verified_signature_cache_hits += 1
+            return True
+
+        self._statistics.verified_signature_cache_misses += 1
+        return False
+
+    def add_verified_signature(self, packet):
+        """
+        Remembers that the signatures of PACKET are valid.
+
+        Must only be called for packets with a complete set of valid signatures.
+        """
+        assert isinstance(packet, str), type(packet)
+        self._verified_signature_cache[get_key_digest(packet)] = None
+
+        # limit cache length
+        if len(self._verified_signature_cache) > VERIFIED_SIGNATURE_CACHE_SIZE:
+            self._verified_signature_cache.popitem(False)
+
     def get_new_member(self, securitylevel=u"medium"):
         """
         Returns a Member instance created from a newly generated public key.
@@ -587,6 +794,7 @@ class Dispersy(TaskManager):
 
         self._database.execute(u"UPDATE community SET classification = ? WHERE master = ?",
                                (destination_classification, master.database_id))
+        self._invalidate_community_cache(master.mid)
 
         if destination_classification in self._auto_load_communities:
             cls, my_member, args, kargs = self._auto_load_communities[destination_classification]
@@ -641,19 +849,14 @@ class Dispersy(TaskManager):
 
         except KeyError:
             if load or auto_load:
-                try:
-                    # have we joined this community
-                    classification, auto_load_flag, master_public_key = self._database.execute(u"SELECT community.classification, community.auto_load, member.public_key FROM community JOIN member ON member.id = community.master WHERE mid = ?",
-                                                                                               (buffer(cid),)).next()
-
-                except StopIteration:
-                    pass
-
-                else:
+                # have we joined this community
+                metadata = self._get_community_metadata(cid)
+                if metadata is not None:
+                    classification, auto_load_flag, master_public_key = metadata
                     if load or (auto_load and auto_load_flag):
 
                         if classification in self._auto_load_communities:
-                            master = self.get_member(public_key=str(master_public_key)) if master_public_key else self.get_member(mid=cid)
+                            master = self.get_member(public_key=master_public_key) if master_public_key else self.get_member(mid=cid)
                             cls, my_member, args, kargs = self._auto_load_communities[classification]
                             community = cls.init_community(self, master, my_member, *args, **kargs)
                             assert master.mid in self._communities
@@ -668,6 +871,52 @@ class Dispersy(TaskManager):
 
         raise CommunityNotFoundException(cid)
 
+    def _get_community_metadata(self, cid):
+        """
+        Returns the (classification, auto_load, master_public_key) tuple of community CID as stored in the database, or
+        None when CID is not in the database.
+
+        Both outcomes are cached, such that packets for communities that we did not join do not cause a database query
+        for every incoming batch.  Unknown community ids are cached for UNKNOWN_COMMUNITY_CACHE_TIMEOUT seconds.
+        """
+        metadata = self._community_metadata_cache.pop(cid, None)
+        if metadata is not None:
+            self._community_metadata_cache[cid] = metadata
+            self._statistics.community_cache_hits += 1
+            return metadata
+
+        expires = self._unknown_community_cache.get(cid)
+        if expires is not None:
+            if expires > time():
+                self._statistics.unknown_community_cache_hits += 1
+                return None
+            del self._unknown_community_cache[cid]
+
+        self._statistics.community_cache_misses += 1
+        try:
+            classification, auto_load, master_public_key = self._database.execute(u"SELECT community.classification, community.auto_load, member.public_key FROM community JOIN member ON member.id = community.master WHERE mid = ?",
+                                                                                  (buffer(cid),)).next()
+
+        except StopIteration:
+            # all entries use the same timeout, hence the least recently added entry expires first
+            self._unknown_community_cache[cid] = time() + UNKNOWN_COMMUNITY_CACHE_TIMEOUT
+            if len(self._unknown_community_cache) > COMMUNITY_CACHE_SIZE:
+                self._unknown_community_cache.popitem(False)
+            return None
+
+        metadata = (classification, bool(auto_load), str(master_public_key) if master_public_key else "")
+        self._community_metadata_cache[cid] = metadata
+        if len(self._community_metadata_cache) > COMMUNITY_CACHE_SIZE:
+            self._community_metadata_cache.popitem(False)
+        return metadata
+
+    def _invalidate_community_cache(self, cid):
+        """
+        Removes CID from the community caches.  Must be called whenever the community row of CID is added or changed.
+        """
+        self._community_metadata_cache.pop(cid, None)
+        self._unknown_community_cache.pop(cid, None)
+
     def get_communities(self):
         """
         Returns a list with all known Community instances.
@@ -828,10 +1077,31 @@ class Dispersy(TaskManager):
         else:
             set_connection_type(u"unknown")
 
-    def _is_duplicate_sync_message(self, message):
+    def _select_stored_sync_packets(self, community, messages):
+        """
+        Returns the stored packets that have the same creator and global time as one of MESSAGES.
+
+        The packets are selected using one query for every SQLITE_MAX_VARIABLE_NUMBER / 2 messages.
+
+        @rtype: {(member_id, global_time): (packet, undone)}
+        """
+        pairs = set((message.authentication.member.database_id, message.distribution.global_time) for message in messages)
+        stored = {}
+        for member_id, global_time, packet, undone in self._database.execute_in_pairs(
+                u"SELECT member, global_time, packet, undone FROM sync WHERE community = ? AND member IN (%s) AND global_time IN (%s)",
+                (community.database_id,), pairs):
+            key = (member_id, global_time)
+            if key in pairs:
+                stored[key] = (str(packet), undone)
+        return stored
+
+    def _is_duplicate_sync_message(self, message, stored=None):
         """
         Returns True when this message is a duplicate, otherwise the message must be processed.
 
+        STORED is the result of _select_stored_sync_packets for a batch of messages that includes
+        MESSAGE.  When given, the duplicate packet is not selected from the database.
+
         === Problem: duplicate message ===
         The simplest reason to drop an incoming message is when we already have it, based on the
         community, member, and global time.  No further action is performed.
@@ -864,11 +1134,18 @@ class Dispersy(TaskManager):
         until the bloom filter is synced with the database again.
         """
         community = message.community
-        # fetch the duplicate binary packet from the database
-        try:
-            have_packet, undone = self._database.execute(u"SELECT packet, undone FROM sync WHERE community = ? AND member = ? AND global_time = ?",
-                                                        (community.database_id, message.authentication.member.database_id, message.distribution.global_time)).next()
-        except StopIteration:
+        if stored is None:
+            # fetch the duplicate binary packet from the database
+            try:
+                have_packet, undone = self._database.execute(u"SELECT packet, undone FROM sync WHERE community = ? AND member = ? AND global_time = ?",
+                                                            (community.database_id, message.authentication.member.database_id, message.distribution.global_time)).next()
+            except StopIteration:
+                have_packet = None
+
+        else:
+            have_packet, undone = stored.get((message.authentication.member.database_id, message.distribution.global_time), (None, 0))
+
+        if have_packet is None:
             self._logger.debug("this message is not a duplicate")
             return False
 
@@ -904,8 +1181,9 @@ class Dispersy(TaskManager):
 
                     if have_packet < message.packet:
                         # replace our current message with the other one
-                        self._database.execute(u"UPDATE sync SET packet = ? WHERE community = ? AND member = ? AND global_time = ?",
-                                               (buffer(message.packet), community.database_id, message.authentication.member.database_id, message.distribution.global_time))
+                        self._database.execute(u"UPDATE sync SET packet = ?, digest = ? WHERE community = ? AND member = ? AND global_time = ?",
+                                               (buffer(message.packet), buffer(get_key_digest(message.packet)), community.database_id, message.authentication.member.database_id, message.distribution.global_time))
+                        community.on_sync_table_changed(replaced=[message])
 
                         # notify that global times have changed
                         # community.update_sync_range(message.meta, [message.distribution.global_time])
@@ -943,23 +1221,34 @@ class Dispersy(TaskManager):
         # i.e. (authentication.member.database_id, distribution.global_time), is unique.
         unique = set()
         execute = self._database.execute
-        enable_sequence_number = messages[0].meta.distribution.enable_sequence_number
+        community = messages[0].community
+        meta = messages[0].meta
+        enable_sequence_number = meta.distribution.enable_sequence_number
 
         # sort the messages by their (1) global_time and (2) binary packet
         messages = sorted(messages, lambda a, b: cmp(a.distribution.global_time, b.distribution.global_time) or cmp(a.packet, b.packet))
 
         # refuse messages where the global time is unreasonably high
-        acceptable_global_time = messages[0].community.acceptable_global_time
+        acceptable_global_time = community.acceptable_global_time
+
+        # the packets that we already have with the same (creator, global-time) as one of the messages
+        stored = self._select_stored_sync_packets(community, messages)
 
         if enable_sequence_number:
-            # obtain the highest sequence_number from the database
-            highest = {}
-            for message in messages:
-                if not message.authentication.member.database_id in highest:
-                    last_global_time, last_seq, count = execute(u"SELECT MAX(global_time), MAX(sequence), COUNT(*) FROM sync WHERE member = ? AND meta_message = ?",
-                                                    (message.authentication.member.database_id, message.database_id)).next()
-                    highest[message.authentication.member.database_id] = (last_global_time or 0, last_seq or 0)
-                    assert last_seq or 0 == count, [last_seq, count, message.name]
+            # obtain the highest sequence_number for each member, these are usually kept in memory by the community
+            highest = community.get_highest_sequence_numbers(meta, (message.authentication.member.database_id for message in messages))
+
+            # the packets that we already have with the same (creator, sequence-number) as one of the messages
+            pairs = set((message.authentication.member.database_id, message.distribution.sequence_number)
+                        for message in messages
+                        if message.distribution.sequence_number <= highest[message.authentication.member.database_id][1])
+            stored_by_sequence = {}
+            if pairs:
+                for member_id, sequence_number, global_time, packet in self._database.execute_in_pairs(
+                        u"SELECT member, sequence, global_time, packet FROM sync WHERE meta_message = ? AND member IN (%s) AND sequence IN (%s)",
+                        (meta.database_id,), pairs):
+                    if (member_id, sequence_number) in pairs:
+                        stored_by_sequence[(member_id, sequence_number)] = (global_time, str(packet))
 
             # all messages must follow the sequence_number order
             for message in messages:
@@ -971,21 +1260,26 @@ class Dispersy(TaskManager):
                     yield DropMessage(message, "message has been pruned")
                     continue
 
-                key = (message.authentication.member.database_id, message.distribution.global_time)
+                member_id = message.authentication.member.database_id
+                key = (member_id, message.distribution.global_time)
                 if key in unique:
                     yield DropMessage(message, "duplicate message by member^global_time (1)")
                     continue
 
                 unique.add(key)
-                last_global_time, seq = highest[message.authentication.member.database_id]
+                last_global_time, seq = highest[member_id]
 
                 if seq >= message.distribution.sequence_number:
                     # we already have this message (drop)
 
-                    # fetch the corresponding packet from the database (it should be binary identical)
-                    global_time, packet = execute(u"SELECT global_time, packet FROM sync WHERE member = ? AND meta_message = ? ORDER BY global_time, packet LIMIT 1 OFFSET ?",
-                                                  (message.authentication.member.database_id, message.database_id, message.distribution.sequence_number - 1)).next()
-                    packet = str(packet)
+                    # the corresponding packet from the database (it should be binary identical)
+                    try:
+                        global_time, packet = stored_by_sequence[(member_id, message.distribution.sequence_number)]
+                    except KeyError:
+                        global_time, packet = execute(u"SELECT global_time, packet FROM sync WHERE member = ? AND meta_message = ? ORDER BY global_time, packet LIMIT 1 OFFSET ?",
+                                                      (member_id, message.database_id, message.distribution.sequence_number - 1)).next()
+                        packet = str(packet)
+
                     if message.packet == packet:
                         yield DropMessage(message, "duplicate message by binary packet")
                         continue
@@ -1004,13 +1298,18 @@ class Dispersy(TaskManager):
                         else:
                             # TODO we should undo the messages that we are about to remove (when applicable)
                             execute(u"DELETE FROM sync WHERE member = ? AND meta_message = ? AND global_time >= ?",
-                                    (message.authentication.member.database_id, message.database_id, global_time))
-
+                                    (member_id, message.database_id, global_time))
                             # by deleting messages we changed SEQ and the HIGHEST cache
-                            last_global_time, last_seq, count = execute(u"SELECT MAX(global_time), MAX(sequence), COUNT(*) FROM sync WHERE member = ? AND meta_message = ?",
-                                                           (message.authentication.member.database_id, message.database_id)).next()
-                            highest[message.authentication.member.database_id] = (last_global_time or 0, last_seq or 0)
-                            assert last_seq or 0 == count, [last_seq, count, message.name]
+                            community.on_sync_table_changed(deleted=(meta, [member_id]))
+
+                            # the deleted packets are no longer stored
+                            for stored_key in [stored_key for stored_key in stored if stored_key[0] == member_id and stored_key[1] >= global_time]:
+                                del stored[stored_key]
+                            for stored_key in [stored_key for stored_key, (stored_global_time, _) in stored_by_sequence.iteritems() if stored_key[0] == member_id and stored_global_time >= global_time]:
+                                del stored_by_sequence[stored_key]
+
+                            highest.update(community.get_highest_sequence_numbers(meta, [member_id]))
+                            last_global_time, seq = highest[member_id]
                             # we can allow MESSAGE to be processed
 
                 elif seq + 1 != message.distribution.sequence_number:
@@ -1020,7 +1319,7 @@ class Dispersy(TaskManager):
 
                 # we have the previous message, check for duplicates based on community,
                 # member, and global_time
-                if self._is_duplicate_sync_message(message):
+                if self._is_duplicate_sync_message(message, stored):
                     # we have the previous message (drop)
                     yield DropMessage(message, "duplicate message by global_time (1)")
                     continue
@@ -1032,8 +1331,9 @@ class Dispersy(TaskManager):
                     yield DropMessage(message, "higher sequence number with lower global time than most recent message")
                     continue
 
-                # we accept this message
-                highest[message.authentication.member.database_id] = (message.distribution.global_time, seq + 1)
+                # we accept this message.  the in-memory sequence numbers of the community are only updated once the
+                # message is stored
+                highest[member_id] = (message.distribution.global_time, seq + 1)
                 yield message
 
         else:
@@ -1054,7 +1354,7 @@ class Dispersy(TaskManager):
                 unique.add(key)
 
                 # check for duplicates based on community, member, and global_time
-                if self._is_duplicate_sync_message(message):
+                if self._is_duplicate_sync_message(message, stored):
                     # we have the previous message (drop)
                     yield DropMessage(message, "duplicate message by global_time (2)")
                     continue
@@ -1099,12 +1399,13 @@ class Dispersy(TaskManager):
         assert all(message.meta == messages[0].meta for message in messages)
         assert all(isinstance(message.authentication, (MemberAuthentication.Implementation, DoubleMemberAuthentication.Implementation)) for message in messages)
 
-        def check_member_and_global_time(unique, times, message):
+        def check_member_and_global_time(unique, times, stored, message):
             """
             The member + global_time combination must always be unique in the database
             """
             assert isinstance(unique, set)
             assert isinstance(times, dict)
+            assert isinstance(stored, dict)
             assert isinstance(message, Message.Implementation)
             assert isinstance(message.distribution, LastSyncDistribution.Implementation)
 
@@ -1121,7 +1422,7 @@ class Dispersy(TaskManager):
                     assert len(times[message.authentication.member.database_id]) <= message.distribution.history_size, [message.packet_id, message.distribution.history_size, times[message.authentication.member.database_id]]
                 tim = times[message.authentication.member.database_id]
 
-                if message.distribution.global_time in tim and self._is_duplicate_sync_message(message):
+                if message.distribution.global_time in tim and self._is_duplicate_sync_message(message, stored):
                     return DropMessage(message, "duplicate message by member^global_time (3)")
 
                 elif len(tim) >= message.distribution.history_size and min(tim) > message.distribution.global_time:
@@ -1148,13 +1449,14 @@ class Dispersy(TaskManager):
                     tim.append(message.distribution.global_time)
                     return message
 
-        def check_double_member_and_global_time(unique, times, message):
+        def check_double_member_and_global_time(unique, times, stored, message):
             """
             No other message may exist with this message.authentication.members / global_time
             combination, regardless of the ordering of the members
             """
             assert isinstance(unique, set)
             assert isinstance(times, dict)
+            assert isinstance(stored, dict)
             assert isinstance(message, Message.Implementation)
             assert isinstance(message.authentication, DoubleMemberAuthentication.Implementation)
 
@@ -1178,7 +1480,7 @@ class Dispersy(TaskManager):
                 else:
                     unique.add(key)
 
-                    if self._is_duplicate_sync_message(message):
+                    if self._is_duplicate_sync_message(message, stored):
                         # we have the previous message (drop)
                         self._logger.debug("drop %s %s@%d (_is_duplicate_sync_message)",
                                            message.name, members, message.distribution.global_time)
@@ -1228,8 +1530,9 @@ WHERE sync.meta_message = ? AND double_signed_sync.member1 = ? AND double_signed
 
                                 if have_packet < message.packet:
                                     # replace our current message with the other one
-                                    self._database.execute(u"UPDATE sync SET member = ?, packet = ? WHERE id = ?",
-                                                           (message.authentication.member.database_id, buffer(message.packet), packet_id))
+                                    self._database.execute(u"UPDATE sync SET member = ?, packet = ?, digest = ? WHERE id = ?",
+                                                           (message.authentication.member.database_id, buffer(message.packet), buffer(get_key_digest(message.packet)), packet_id))
+                                    message.community.on_sync_table_changed(replaced=[message])
 
                                     return DropMessage(message, "replaced existing packet with other packet with the same payload")
 
@@ -1286,16 +1589,42 @@ WHERE sync.meta_message = ? AND double_signed_sync.member1 = ? AND double_signed
             # distribution.global_time), is unique.  UNIQUE is used in the check_member_and_global_time
             # function
             unique = set()
-            times = {}
-            messages = [message if isinstance(message, DropMessage) else check_member_and_global_time(unique, times, message) for message in messages]
+
+            # select the global times that we have for all members in the batch using one query
+            member_ids = set(message.authentication.member.database_id for message in messages if not isinstance(message, DropMessage))
+            times = dict((member_id, []) for member_id in member_ids)
+            for member_id, global_time in self._database.execute_in(u"SELECT member, global_time FROM sync WHERE community = ? AND meta_message = ? AND member IN (%s)",
+                                                                   (meta.community.database_id, meta.database_id), member_ids):
+                times[member_id].append(global_time)
+
+            # only messages with a global time that we already have can be duplicates
+            stored = self._select_stored_sync_packets(meta.community, [message
+                                                                       for message in messages
+                                                                       if not isinstance(message, DropMessage) and message.distribution.global_time in times[message.authentication.member.database_id]])
+
+            messages = [message if isinstance(message, DropMessage) else check_member_and_global_time(unique, times, stored, message) for message in messages]
 
         # instead of storing HISTORY_SIZE messages for each authentication.member, we will store
         # HISTORY_SIZE messages for each combination of authentication.members.
         else:
             assert isinstance(meta.authentication, DoubleMemberAuthentication)
             unique = set()
-            times = {}
-            messages = [message if isinstance(message, DropMessage) else check_double_member_and_global_time(unique, times, message) for message in messages]
+
+            # select the global times and packets that we have for all member pairs in the batch using one query
+            pairs = set(tuple(sorted(member.database_id for member in message.authentication.members))
+                        for message in messages if not isinstance(message, DropMessage))
+            times = dict((pair, {}) for pair in pairs)
+            for member1, member2, global_time, packet_id, packet in self._database.execute_in(u"""
+SELECT double_signed_sync.member1, double_signed_sync.member2, sync.global_time, sync.id, sync.packet
+FROM sync
+JOIN double_signed_sync ON double_signed_sync.sync = sync.id
+WHERE sync.meta_message = ? AND double_signed_sync.member1 IN (%s)""", (meta.database_id,), set(member1 for member1, _ in pairs)):
+                if (member1, member2) in times:
+                    times[(member1, member2)][global_time] = (packet_id, str(packet))
+
+            stored = self._select_stored_sync_packets(meta.community, [message for message in messages if not isinstance(message, DropMessage)])
+
+            messages = [message if isinstance(message, DropMessage) else check_double_member_and_global_time(unique, times, stored, message) for message in messages]
 
         return messages
 
@@ -1413,6 +1742,9 @@ WHERE sync.meta_message = ? AND double_signed_sync.member1 = ? AND double_signed
         """
         Returns a list with messages representing each packet or None when no conversion is
         possible.
+
+        When VERIFY is True, only the packets that are not in the verified signature cache are
+        verified.  Hence a packet that occurs multiple times is verified only once.
         """
         assert isinstance(packets, Iterable), type(packets)
         assert all(isinstance(packet, str) for packet in packets), [type(packet) for packet in packets]
@@ -1516,43 +1848,52 @@ WHERE sync.meta_message = ? AND double_signed_sync.member1 = ? AND double_signed
             self._logger.debug("%s %d@%d", message.name,
                                message.authentication.member.database_id, message.distribution.global_time)
 
-            # add packet to database
-            message.packet_id = self._database.execute(
-                u"INSERT INTO sync (community, member, global_time, meta_message, packet, sequence) "
-                u"VALUES (?, ?, ?, ?, ?, ?)",
-               (message.community.database_id,
-                message.authentication.member.database_id,
-                message.distribution.global_time,
-                message.database_id,
-                buffer(message.packet),
-                (message.distribution.sequence_number if
-                 isinstance(meta.distribution, FullSyncDistribution)
-                 and message.distribution.enable_sequence_number else None)
-                ), get_lastrowid=True)
-
-            # ensure that we can reference this packet
-            self._logger.debug("stored message %s in database at row %d", message.name, message.packet_id)
-
-            if is_double_member_authentication:
-                member1 = message.authentication.members[0].database_id
-                member2 = message.authentication.members[1].database_id
-                self._database.execute(u"INSERT INTO double_signed_sync (sync, member1, member2) VALUES (?, ?, ?)",
-                                       (message.packet_id, member1, member2) if member1 < member2 else (message.packet_id, member2, member1))
-
             # update global time
             highest_global_time = max(highest_global_time, message.distribution.global_time)
             if isinstance(meta.distribution, FullSyncDistribution) and message.distribution.enable_sequence_number:
                 highest_sequence_number[message.authentication.member.database_id] = max(highest_sequence_number[message.authentication.member.database_id], message.distribution.sequence_number)
 
+        # add packets to database
+        enable_sequence_number = isinstance(meta.distribution, FullSyncDistribution) and meta.distribution.enable_sequence_number
+        last_packet_id = self._database.executemany_lastrowid(
+            u"INSERT INTO sync (community, member, global_time, meta_message, packet, sequence, digest) "
+            u"VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(message.community.database_id,
+              message.authentication.member.database_id,
+              message.distribution.global_time,
+              message.database_id,
+              buffer(message.packet),
+              message.distribution.sequence_number if enable_sequence_number else None,
+              buffer(get_key_digest(message.packet)))
+             for message in messages])
+
+        # ensure that we can reference these packets.  sync.id is an AUTOINCREMENT column and no other rows can be
+        # inserted while executemany_lastrowid holds the lock, hence the rows received consecutive ids
+        for packet_id, message in enumerate(messages, last_packet_id - len(messages) + 1):
+            message.packet_id = packet_id
+
+        if __debug__:
+            rows = list(self._database.execute(u"SELECT id, member, global_time FROM sync WHERE id BETWEEN ? AND ? ORDER BY id",
+                                               (messages[0].packet_id, messages[-1].packet_id)))
+            assert rows == [(message.packet_id, message.authentication.member.database_id, message.distribution.global_time)
+                            for message in messages], [rows, [message.packet_id for message in messages]]
+        self._logger.debug("stored %d %s messages in database at rows %d-%d",
+                           len(messages), meta.name, messages[0].packet_id, messages[-1].packet_id)
+
+        if is_double_member_authentication:
+            order = lambda member1, member2: (member1, member2) if member1 < member2 else (member2, member1)
+            self._database.executemany(u"INSERT INTO double_signed_sync (sync, member1, member2) VALUES (?, ?, ?)",
+                                       [(message.packet_id,) + order(message.authentication.members[0].database_id, message.authentication.members[1].database_id)
+                                        for message in messages])
 
         if __debug__ and highest_sequence_number:
             # when sequence numbers are enabled, we must have exactly
             # message.distribution.sequence_number messages in the database
-            for member_id, max_sequence_number in highest_sequence_number.iteritems():
-                count_, = self._database.execute(u"SELECT COUNT(*) FROM sync "
-                                                u"WHERE meta_message = ? AND member = ? AND sequence BETWEEN 1 AND ?",
-                                                (message.database_id, member_id, max_sequence_number)).next()
-                assert count_ == max_sequence_number, [count_, max_sequence_number]
+            for member_id, count_, max_sequence_number in self._database.execute_in(
+                    u"SELECT member, COUNT(*), MAX(sequence) FROM sync WHERE meta_message = ? AND member IN (%s) AND sequence >= 1 GROUP BY member",
+                    (meta.database_id,), highest_sequence_number.keys()):
+                assert count_ == max_sequence_number >= highest_sequence_number[member_id], \
+                    [count_, max_sequence_number, highest_sequence_number[member_id]]
 
         if isinstance(meta.distribution, LastSyncDistribution):
             # delete packets that have become obsolete
@@ -1563,28 +1904,49 @@ WHERE sync.meta_message = ? AND double_signed_sync.member1 = ? AND double_signed
 
             # default behaviour
             else:
+                history_size = meta.distribution.history_size
                 if is_double_member_authentication:
-                    order = lambda member1, member2: (member1, member2) if member1 < member2 else (member2, member1)
-                    for member1, member2 in set(order(message.authentication.members[0].database_id, message.authentication.members[1].database_id) for message in messages):
-                        assert member1 < member2, [member1, member2]
-                        all_items = list(self._database.execute(u"""
-SELECT sync.id, sync.global_time
+                    pairs = set(order(message.authentication.members[0].database_id, message.authentication.members[1].database_id) for message in messages)
+                    rows = self._database.execute_in_pairs(u"""
+SELECT double_signed_sync.member1, double_signed_sync.member2, sync.id, sync.global_time
 FROM sync
 JOIN double_signed_sync ON double_signed_sync.sync = sync.id
-WHERE sync.meta_message = ? AND double_signed_sync.member1 = ? AND double_signed_sync.member2 = ?
-ORDER BY sync.global_time, sync.packet""", (meta.database_id, member1, member2)))
-                        if len(all_items) > meta.distribution.history_size:
-                            items.update(all_items[:len(all_items) - meta.distribution.history_size])
+WHERE sync.meta_message = ? AND double_signed_sync.member1 IN (%s) AND double_signed_sync.member2 IN (%s)""", (meta.database_id,), pairs)
+                    history = defaultdict(list)
+                    for member1, member2, packet_id, global_time in rows:
+                        if (member1, member2) in pairs:
+                            history[(member1, member2)].append((global_time, "", packet_id))
+
+                    # packets with the same global time are ordered by packet.  the packets are only selected when
+                    # the obsolete and the remaining packets share a global time
+                    tied = set()
+                    for all_items in history.itervalues():
+                        if len(all_items) > history_size:
+                            all_items.sort()
+                            global_time = all_items[len(all_items) - history_size][0]
+                            if all_items[len(all_items) - history_size - 1][0] == global_time:
+                                tied.update(packet_id for item_global_time, _, packet_id in all_items if item_global_time == global_time)
+                    if tied:
+                        packets = dict(self._database.execute_in(u"SELECT id, packet FROM sync WHERE id IN (%s)", (), tied))
+                        for all_items in history.itervalues():
+                            all_items[:] = [(global_time, str(packets[packet_id]), packet_id) if packet_id in packets else (global_time, packet, packet_id)
+                                            for global_time, packet, packet_id in all_items]
 
                 else:
-                    for member_database_id in set(message.authentication.member.database_id for message in messages):
-                        all_items = list(self._database.execute(u"""
-SELECT id, global_time
+                    rows = self._database.execute_in(u"""
+SELECT member, id, global_time
 FROM sync
-WHERE meta_message = ? AND member = ?
-ORDER BY global_time""", (meta.database_id, member_database_id)))
-                        if len(all_items) > meta.distribution.history_size:
-                            items.update(all_items[:len(all_items) - meta.distribution.history_size])
+WHERE meta_message = ? AND member IN (%s)""", (meta.database_id,), set(message.authentication.member.database_id for message in messages))
+                    history = defaultdict(list)
+                    for member_database_id, packet_id, global_time in rows:
+                        history[member_database_id].append((global_time, packet_id))
+
+                # everything except the HISTORY_SIZE most recent packets (ordered by global_time, and packet for
+                # double signed messages) is obsolete
+                for all_items in history.itervalues():
+                    if len(all_items) > history_size:
+                        all_items.sort()
+                        items.update((item[-1], item[0]) for item in all_items[:len(all_items) - history_size])
 
             if items:
                 self._database.executemany(u"DELETE FROM sync WHERE id = ?", [(syncid,) for syncid, _ in items])
@@ -1597,9 +1959,22 @@ ORDER BY global_time""", (meta.database_id, member_database_id)))
             # 12/10/11 Boudewijn: verify that we do not have to many packets in the database
             if __debug__:
                 if not is_double_member_authentication and meta.distribution.custom_callback is None:
-                    for message in messages:
-                        history_size, = self._database.execute(u"SELECT COUNT(*) FROM sync WHERE meta_message = ? AND member = ?", (message.database_id, message.authentication.member.database_id)).next()
-                        assert history_size <= message.distribution.history_size, [history_size, message.distribution.history_size, message.authentication.member.database_id]
+                    for member_id, history_size in self._database.execute_in(
+                            u"SELECT member, COUNT(*) FROM sync WHERE meta_message = ? AND member IN (%s) GROUP BY member",
+                            (meta.database_id,), set(message.authentication.member.database_id for message in messages)):
+                        assert history_size <= meta.distribution.history_size, [history_size, meta.distribution.history_size, member_id]
+
+        # update the in-memory sync index, the packets in ITEMS may include some of MESSAGES
+        meta.community.on_sync_table_changed(stored=messages,
+                                             removed=items if isinstance(meta.distribution, LastSyncDistribution) else ())
+
+        # update the in-memory sequence numbers
+        if enable_sequence_number:
+            for message in messages:
+                member_id = message.authentication.member.database_id
+                if message.distribution.sequence_number == highest_sequence_number[member_id]:
+                    meta.community.update_highest_sequence_number(meta, member_id, message.distribution.global_time,
+                                                                  message.distribution.sequence_number)
 
         # update the global time
         meta.community.update_global_time(highest_global_time)
@@ -1690,6 +2065,9 @@ ORDER BY global_time""", (meta.database_id, member_database_id)))
         assert all(message.community == messages[0].community for message in messages)
         assert all(message.meta == messages[0].meta for message in messages)
 
+        # messages that we create ourselves may be the first use of a lazily initialized community
+        messages[0].community.complete_initialization()
+
         store = store and isinstance(messages[0].meta.distribution, SyncDistribution)
         if store:
             self._store(messages)
@@ -1728,6 +2106,19 @@ ORDER BY global_time""", (meta.database_id, member_database_id)))
             self._logger.exception("exception during handle_callback for %s", messages[0].name)
             return False
 
+    def _sign_and_forward(self, messages):
+        """
+        Signs MESSAGES, which must have been created with empty_signature=True, using the SigningService and forwards
+        them once they are signed.
+        """
+        def on_error(failure):
+            self._logger.warning("unable to sign %d messages: %s", len(messages), failure.getErrorMessage())
+
+        deferred = self._signing_service.sign(messages)
+        deferred.addCallback(self._forward)
+        deferred.addErrback(on_error)
+        return deferred
+
     @attach_runtime_statistics(u"Dispersy.{function_name} {1[0].name}")
     def _forward(self, messages):
         """
@@ -2112,6 +2503,9 @@ ORDER BY global_time""", (meta.database_id, member_database_id)))
         if all(result for _, result in results):
             self._logger.info("Dispersy core ready (database: %s, port:%d)",
                         self._database.file_path, self._endpoint.get_address()[1])
+            if self._verification_pool:
+                self._verification_pool.start()
+            self._signing_service.start()
             self.running = True
 
             if autoload_discovery:
@@ -2190,6 +2584,12 @@ ORDER BY global_time""", (meta.database_id, member_database_id)))
                                 if community.get_classification() == classification])
 
 
+        # stop the verification and signing workers
+        if self._verification_pool:
+            self._verification_pool.stop()
+        self._signing_service.stop()
+        self._timer_wheel.stop()
+
         # stop endpoint
         results[u"endpoint"] = maybeDeferred(self._endpoint.close, timeout)
 
@@ -8,11 +8,12 @@ This module provides an interface to the Dispersy database.
 
 from itertools import groupby
 
+from .bloomfilter import get_key_digest
 from .database import Database
 from .distribution import FullSyncDistribution
 
 
-LATEST_VERSION = 21
+LATEST_VERSION = 23
 
 schema = u"""
 CREATE TABLE member(
@@ -59,10 +60,17 @@ CREATE TABLE sync(
  undone INTEGER DEFAULT 0,
  packet BLOB,
  sequence INTEGER,
+ digest BLOB,                                           -- get_key_digest(packet), used for the sync bloom filters
  UNIQUE(community, member, global_time));
 CREATE INDEX sync_meta_message_undone_global_time_index ON sync(meta_message, undone, global_time);
 CREATE INDEX sync_meta_message_member ON sync(meta_message, member);
 
+CREATE TABLE timeline_snapshot(
+ community INTEGER PRIMARY KEY REFERENCES community(id),
+ sync_id INTEGER,                                       -- the snapshot contains the permission messages up to this id
+ messages INTEGER,                                      -- the number of permission messages up to sync_id
+ snapshot TEXT);                                        -- json encoded Timeline.get_snapshot()
+
 CREATE TABLE option(key TEXT PRIMARY KEY, value BLOB);
 INSERT INTO option(key, value) VALUES('database_version', '""" + str(LATEST_VERSION) + """');
 """
@@ -491,10 +499,38 @@ UPDATE option SET value = '21' WHERE key = 'database_version';""")
                 self._logger.debug("upgrade database %d -> %d (done)", database_version, new_db_version)
 
             new_db_version = 22
+            if database_version < new_db_version:
+                # add the 'digest' column to the sync table, the sync bloom filters can use these small digests
+                # instead of hashing the full packets
+                self._logger.debug("upgrade database %d -> %d", database_version, new_db_version)
+                self._connection.create_function("key_digest", 1, lambda packet: buffer(get_key_digest(str(packet))))
+                self.executescript(u"""
+ALTER TABLE sync ADD COLUMN digest BLOB;
+UPDATE sync SET digest = key_digest(packet);
+UPDATE option SET value = '22' WHERE key = 'database_version';""")
+                self.commit()
+                self._logger.debug("upgrade database %d -> %d (done)", database_version, new_db_version)
+
+            new_db_version = 23
+            if database_version < new_db_version:
+                # add the 'timeline_snapshot' table, communities persist their timeline to avoid replaying all
+                # permission messages when they are loaded
+                self._logger.debug("upgrade database %d -> %d", database_version, new_db_version)
+                self.executescript(u"""
+CREATE TABLE timeline_snapshot(
+ community INTEGER PRIMARY KEY REFERENCES community(id),
+ sync_id INTEGER,
+ messages INTEGER,
+ snapshot TEXT);
+UPDATE option SET value = '23' WHERE key = 'database_version';""")
+                self.commit()
+                self._logger.debug("upgrade database %d -> %d (done)", database_version, new_db_version)
+
+            new_db_version = 24
             if database_version < new_db_version:
                 # there is no version new_db_version yet...
                 # self._logger.debug("upgrade database %d -> %d", database_version, new_db_version)
-                # self.executescript(u"""UPDATE option SET value = '22' WHERE key = 'database_version';""")
+                # self.executescript(u"""UPDATE option SET value = '24' WHERE key = 'database_version';""")
                 # self.commit()
                 # self._logger.debug("upgrade database %d -> %d (done)", database_version, new_db_version)
                 pass
@@ -553,7 +589,7 @@ UPDATE option SET value = '21' WHERE key = 'database_version';""")
                     # message.payload.packet
                     for _ in message.check_callback([message]):
                         pass
-                    allowed, _ = community._timeline.check(message)
+                    allowed, _ = community.timeline.check(message)
                     if allowed:
                         updates.append((packet_id, message.payload.packet.packet_id))
 
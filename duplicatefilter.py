@@ -0,0 +1,218 @@
+"""
+This module provides the in-memory duplicate filter that drops known packets before they are verified.
+
+During a steady-state sync most incoming packets are packets that we already have.  Each of those is decoded, its
+signature verified, and finally dropped by Dispersy._is_duplicate_sync_message after selecting the stored packet from
+the database.  The DuplicateFilter keeps the (member, global_time) pairs of the stored FullSyncDistribution packets,
+together with the packet digests, in memory.  An incoming packet is parsed just far enough to obtain its meta message,
+member, and global time.  When the same packet is already stored it is dropped without verifying its signature.
+
+Only binary identical packets are dropped.  A packet with the same member and global time but a different signature
+is handled by Dispersy._is_duplicate_sync_message.  Undone packets are not part of the filter, someone who sends us an
+undone packet will receive the undo message in return.
+
+The filter is updated by Dispersy._store, undo, redo and pruning.  Any other modification to the sync table must call
+DuplicateFilter.invalidate, the filter will be reloaded from the database the next time it is used.  While the filter
+is not loaded it does not drop any packets.
+"""
+
+import logging
+
+from twisted.internet.defer import succeed
+
+from .bloomfilter import get_key_digest
+from .distribution import FullSyncDistribution
+
+
+class DuplicateFilter(object):
+
+    def __init__(self, community):
+        """
+        Create an (unloaded) duplicate filter for COMMUNITY.
+
+        @param community: The community that the filtered packets belong to.
+        @type community: Community
+        """
+        from .community import Community
+        assert isinstance(community, Community), type(community)
+        super(DuplicateFilter, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self._community = community
+
+        self._loaded = False
+        # the Deferred of the running load_async call
+        self._loading = None
+        # (method, args) pairs of the modifications made while load_async is running, None when nothing is loading or
+        # when the filter was invalidated while loading
+        self._pending = None
+        # meta_id: {(member_id, global_time): digest}, only for the FullSyncDistribution meta messages
+        self._entries = {}
+        # meta_id: lowest global time in _entries[meta_id], allows prune to skip the scan
+        self._lowest_global_time = {}
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    def count(self):
+        """
+        Returns the number of packets in the filter.
+        @rtype: int
+        """
+        return sum(len(entries) for entries in self._entries.itervalues())
+
+    def get_filtered_meta_ids(self):
+        """
+        Returns the database ids of the meta messages that are part of the filter.
+        @rtype: [int]
+        """
+        return [meta.database_id
+                for meta in self._community.get_meta_messages()
+                if isinstance(meta.distribution, FullSyncDistribution)]
+
+    def load_async(self):
+        """
+        Load the filter using the asynchronous database executor.
+
+        Modifications that are made while the query is running are applied to the loaded rows once the query has
+        finished.  Only when the filter is invalidated while the query is running is the result discarded, in which
+        case load_async must be called again.
+
+        @return: a Deferred that fires once the query has finished.
+        """
+        if self._loaded:
+            return succeed(None)
+
+        if self._loading is None:
+            meta_ids = self.get_filtered_meta_ids()
+            if not meta_ids:
+                self._load_rows(meta_ids, [])
+                return succeed(None)
+
+            self._pending = []
+            self._loading = self._community.dispersy.database.execute_async(
+                u"SELECT meta_message, member, global_time, digest FROM sync WHERE meta_message IN (%s) AND undone = 0" %
+                u", ".join(u"?" for _ in meta_ids), tuple(meta_ids))
+            self._loading.addCallbacks(self._on_load_async, self._on_load_async_error, callbackArgs=(meta_ids,))
+
+        return self._loading
+
+    def _on_load_async(self, rows, meta_ids):
+        pending, self._loading, self._pending = self._pending, None, None
+        if self._loaded:
+            return
+
+        if pending is None:
+            self._logger.debug("%s duplicate filter invalidated while loading, discarding %d rows",
+                               self._community.cid.encode("HEX"), len(rows))
+            return
+
+        self._load_rows(meta_ids, rows)
+        # the rows may or may not include these modifications, applying them again is harmless
+        for method, args in pending:
+            method(*args)
+        if pending:
+            self._logger.debug("%s applied %d modifications made while loading",
+                               self._community.cid.encode("HEX"), len(pending))
+
+    def _on_load_async_error(self, failure):
+        self._loading = None
+        self._pending = None
+        self._logger.error("%s unable to load the duplicate filter: %s", self._community.cid.encode("HEX"),
+                           failure.getErrorMessage())
+
+    def _load_rows(self, meta_ids, rows):
+        self._entries = dict((meta_id, {}) for meta_id in meta_ids)
+        for meta_id, member_id, global_time, digest in rows:
+            self._entries[meta_id][(member_id, global_time)] = str(digest)
+        self._lowest_global_time = dict((meta_id, min(key[1] for key in entries) if entries else float("inf"))
+                                        for meta_id, entries in self._entries.iteritems())
+
+        self._loaded = True
+        self._logger.debug("%s loaded %d packets", self._community.cid.encode("HEX"), self.count())
+
+    def invalidate(self):
+        """
+        Forget everything, the filter is reloaded from the database the next time it is used.
+        """
+        self._pending = None
+        if self._loaded:
+            self._loaded = False
+            self._entries = {}
+            self._lowest_global_time = {}
+
+    def is_duplicate(self, meta_id, member_id, global_time, packet):
+        """
+        Returns True when PACKET, created by MEMBER_ID at GLOBAL_TIME, is already stored.
+
+        Returns False when the packet is not stored, when a different packet with the same member and global time is
+        stored, or when the filter is not loaded yet.  In the last case loading is started.
+        """
+        if not self._loaded:
+            self.load_async()
+            return False
+
+        entries = self._entries.get(meta_id)
+        if entries:
+            digest = entries.get((member_id, global_time))
+            return digest is not None and digest == get_key_digest(packet)
+        return False
+
+    def store(self, messages):
+        """
+        Add the messages from MESSAGES that have just been stored in the database.
+        """
+        if not (self._loaded or self._pending is not None):
+            return
+
+        self._modify(self._store, [(message.database_id, message.authentication.member.database_id,
+                                    message.distribution.global_time, get_key_digest(message.packet))
+                                   for message in messages])
+
+    def _modify(self, method, *args):
+        """
+        Call METHOD(*ARGS) when the filter is loaded, or postpone the call until load_async has finished.
+        """
+        if self._loaded:
+            method(*args)
+        elif self._pending is not None:
+            self._pending.append((method, args))
+
+    def _store(self, items):
+        for meta_id, member_id, global_time, digest in items:
+            entries = self._entries.get(meta_id)
+            if entries is not None:
+                entries[(member_id, global_time)] = digest
+                if global_time < self._lowest_global_time[meta_id]:
+                    self._lowest_global_time[meta_id] = global_time
+
+    def redo(self, messages):
+        """
+        Add MESSAGES again after their undone flag has been removed in the database.
+        """
+        self.store(messages)
+
+    def undo(self, member_id, global_time):
+        """
+        Remove the packet created by MEMBER_ID at GLOBAL_TIME because it has been undone.
+        """
+        self._modify(self._undo, member_id, global_time)
+
+    def _undo(self, member_id, global_time):
+        key = (member_id, global_time)
+        for entries in self._entries.itervalues():
+            entries.pop(key, None)
+
+    def prune(self, meta_id, global_time):
+        """
+        Remove all META_ID packets with a global time lower or equal to GLOBAL_TIME.
+        """
+        self._modify(self._prune, meta_id, global_time)
+
+    def _prune(self, meta_id, global_time):
+        entries = self._entries.get(meta_id)
+        if entries and self._lowest_global_time[meta_id] <= global_time:
+            for key in [key for key in entries if key[1] <= global_time]:
+                del entries[key]
+            self._lowest_global_time[meta_id] = min(key[1] for key in entries) if entries else float("inf")
@@ -4,11 +4,19 @@ import socket
 import sys
 import threading
 from abc import ABCMeta, abstractmethod
-from itertools import product
+from collections import deque
 from select import select
 from time import time
 
+try:
+    from select import epoll, EPOLLIN, EPOLLOUT
+except ImportError:
+    # epoll is only available on Linux
+    epoll = None
+
 from twisted.internet import reactor
+from twisted.internet.error import CannotListenError
+from twisted.internet.protocol import DatagramProtocol
 
 from .candidate import Candidate
 
@@ -21,6 +29,11 @@ else:
 TUNNEL_PREFIX = "ffffffff".decode("HEX")
 TUNNEL_PREFIX_LENGHT = 4
 
+# the maximum number of packets that EpollEndpoint receives per wakeup
+EPOLL_BATCH_SIZE = 256
+# the maximum number of received packets that are waiting to be processed on the reactor thread
+EPOLL_MAX_HANDOFF_QUEUE = 25000
+
 
 class Endpoint(object):
     __metaclass__ = ABCMeta
@@ -99,6 +112,10 @@ class NullEndpoint(Endpoint):
 
 class StandaloneEndpoint(Endpoint):
 
+    # a subclass that overrides send_packet to intercept every outgoing packet must set this to True, send then
+    # passes each packet to send_packet instead of sending the packets directly
+    _intercepts_send_packet = False
+
     def __init__(self, port, ip="0.0.0.0"):
         super(StandaloneEndpoint, self).__init__()
 
@@ -107,7 +124,8 @@ class StandaloneEndpoint(Endpoint):
         self._running = False
         self._add_task = lambda task, delay = 0.0, id = "": None
         self._sendqueue_lock = threading.RLock()
-        self._sendqueue = []
+        # deque containing (queued_at, sock_addr, data) tuples
+        self._sendqueue = deque()
 
         # _THREAD and _THREAD are set during open(...)
         self._thread = None
@@ -229,8 +247,11 @@ class StandaloneEndpoint(Endpoint):
                 for sock_addr, data in normal_packets:
                     self.log_packet(sock_addr, data, outbound=False)
 
-            # The endpoint runs on it's own thread, so we can't do a callLater here
-            reactor.callFromThread(self.dispersythread_data_came_in, normal_packets, time(), cache)
+            self._handoff(normal_packets, cache)
+
+    def _handoff(self, packets, cache):
+        # The endpoint runs on it's own thread, so we can't do a callLater here
+        reactor.callFromThread(self.dispersythread_data_came_in, packets, time(), cache)
 
     def dispersythread_data_came_in(self, packets, timestamp, cache=True):
         assert self._dispersy, "Should not be called before open(...)"
@@ -257,18 +278,32 @@ class StandaloneEndpoint(Endpoint):
         assert all(isinstance(packet, str) for packet in packets), [type(packet) for packet in packets]
         assert all(len(packet) > 0 for packet in packets), [len(packet) for packet in packets]
 
-        prefix = prefix or ''
-        packets = [prefix + packet for packet in packets]
+        # each packet is framed once, regardless of the number of candidates
+        packets = [prefix + packet for packet in packets] if prefix else list(packets)
 
         if any(len(packet) > 2 ** 16 - 60 for packet in packets):
             raise RuntimeError("UDP does not support %d byte packets" % max(len(packet) for packet in packets))
 
-        send_packet = False
-        for candidate, packet in product(candidates, packets):
-            if self.send_packet(candidate, packet):
-                send_packet = True
+        if not (candidates and packets):
+            return False
+
+        if self._intercepts_send_packet:
+            for candidate in candidates:
+                for packet in packets:
+                    self.send_packet(candidate, packet)
+            return True
 
-        return send_packet
+        tunnel_packets = None
+        if any(candidate.tunnel for candidate in candidates):
+            tunnel_packets = [TUNNEL_PREFIX + packet for packet in packets]
+
+        self._dispersy.statistics.total_up += sum(len(packet) for packet in packets) * len(candidates)
+        self._dispersy.statistics.total_send += len(packets) * len(candidates)
+
+        for candidate in candidates:
+            self._send_to(candidate.sock_addr, tunnel_packets if candidate.tunnel else packets, packets)
+
+        return True
 
     def send_packet(self, candidate, packet, prefix=None):
         assert self._dispersy, "Should not be called before open(...)"
@@ -276,7 +311,8 @@ class StandaloneEndpoint(Endpoint):
         assert isinstance(packet, str), type(packet)
         assert len(packet) > 0
 
-        packet = (prefix or '') + packet
+        if prefix:
+            packet = prefix + packet
 
         if len(packet) > 2 ** 16 - 60:
             raise RuntimeError("UDP does not support %d byte packets" % len(packet))
@@ -284,42 +320,61 @@ class StandaloneEndpoint(Endpoint):
         self._dispersy.statistics.total_up += len(packet)
         self._dispersy.statistics.total_send += 1
 
-        data = TUNNEL_PREFIX + packet if candidate.tunnel else packet
+        self._send_to(candidate.sock_addr, [TUNNEL_PREFIX + packet] if candidate.tunnel else [packet], [packet])
+        return True
 
-        try:
-            self._socket.sendto(data, candidate.sock_addr)
+    def _send_to(self, sock_addr, datas, packets):
+        """
+        Send DATAS to SOCK_ADDR.  Once the socket blocks, the remaining DATAS are appended to the sendqueue.
 
-            if self._logger.isEnabledFor(logging.DEBUG):
-                self.log_packet(candidate.sock_addr, packet)
+        PACKETS contains the same packets as DATAS, without the tunnel prefix, and is only used for logging.
+        """
+        sendto = self._socket.sendto
+        index = 0
 
-        except socket.error:
-            with self._sendqueue_lock:
-                did_have_senqueue = bool(self._sendqueue)
-                self._sendqueue.append((time(), candidate.sock_addr, data))
+        with self._sendqueue_lock:
+            # packets are only send directly when the sendqueue is empty, this keeps the packets in order
+            did_have_sendqueue = bool(self._sendqueue)
+            if not did_have_sendqueue:
+                try:
+                    for data in datas:
+                        sendto(data, sock_addr)
+                        index += 1
 
-            # If we did not have a sendqueue, then we need to call process_sendqueue in order send these messages
-            if not did_have_senqueue:
-                self._process_sendqueue()
+                except socket.error:
+                    # like the sendqueue, the remaining packets are retried until they expire
+                    pass
 
-        return True
+                if self._logger.isEnabledFor(logging.DEBUG):
+                    for packet in packets[:index]:
+                        self.log_packet(sock_addr, packet)
+
+            if index < len(datas):
+                now = time()
+                self._sendqueue.extend((now, sock_addr, data) for data in datas[index:])
+                self._dispersy.statistics.sendqueue_queued += len(datas) - index
+
+                # If we did not have a sendqueue, then we need to call process_sendqueue in order send these messages
+                if not did_have_sendqueue:
+                    self._process_sendqueue()
 
     def _process_sendqueue(self):
         assert self._dispersy, "Should not be called before start(...)"
         with self._sendqueue_lock:
-            if self._sendqueue:
-                index = 0
-                NUM_PACKETS = min(max(50, len(self._sendqueue) / 10), len(self._sendqueue))
+            sendqueue = self._sendqueue
+            if sendqueue:
+                statistics = self._dispersy.statistics
+                NUM_PACKETS = min(max(50, len(sendqueue) / 10), len(sendqueue))
                 self._logger.debug("%d left in sendqueue, trying to send %d packets",
-                                   len(self._sendqueue), NUM_PACKETS)
+                                   len(sendqueue), NUM_PACKETS)
 
                 allowed_timestamp = time() - 300
 
-                for i in xrange(NUM_PACKETS):
-                    queued_at, sock_addr, data = self._sendqueue[i]
+                for _ in xrange(NUM_PACKETS):
+                    queued_at, sock_addr, data = sendqueue[0]
                     if queued_at > allowed_timestamp:
                         try:
                             self._socket.sendto(data, sock_addr)
-                            index += 1
 
                             if self._logger.isEnabledFor(logging.DEBUG):
                                 self.log_packet(sock_addr, data)
@@ -327,20 +382,244 @@ class StandaloneEndpoint(Endpoint):
                         except socket.error as e:
                             if e[0] != SOCKET_BLOCK_ERRORCODE:
                                 self._logger.warning("could not send %d to %s (%d in sendqueue)",
-                                                     len(data), sock_addr, len(self._sendqueue))
-                                self._dispersy.statistics.dict_inc(u"endpoint_send", u"socket-error")
+                                                     len(data), sock_addr, len(sendqueue))
+                                statistics.dict_inc(u"endpoint_send", u"socket-error")
+                                statistics.sendqueue_errors += 1
+                            # the packet is retried until it expires
                             break
                     else:
-                        self._dispersy.statistics.dict_inc(u"endpoint_send", u"packet-expired")
-                        index += 1
+                        statistics.dict_inc(u"endpoint_send", u"packet-expired")
+                        statistics.sendqueue_expired += 1
+
+                    sendqueue.popleft()
 
-                self._sendqueue = self._sendqueue[index:]
-                if self._sendqueue:
+                if sendqueue:
                     # And schedule a new attempt
                     self._add_task(self._process_sendqueue, 0.1, "process_sendqueue")
-                    self._logger.debug("%d left in sendqueue", len(self._sendqueue))
+                    self._logger.debug("%d left in sendqueue", len(sendqueue))
+
+                statistics.cur_sendqueue = len(sendqueue)
+
+
+class EpollEndpoint(StandaloneEndpoint):
+
+    """
+    A StandaloneEndpoint for high packet rates.
+
+    The socket is polled using epoll and up to BATCH_SIZE packets are received per wakeup, using recvfrom_into and a
+    preallocated buffer.  The received packets are put in a bounded handoff queue that is processed on the reactor
+    thread.  Only one reactor.callFromThread call is pending at any time, regardless of the number of batches.  When
+    the queue contains MAX_HANDOFF_QUEUE packets newly received packets are dropped, see handoff_statistics.
+
+    Requires select.epoll, i.e. Linux.
+    """
+
+    def __init__(self, port, ip="0.0.0.0", batch_size=EPOLL_BATCH_SIZE, max_handoff_queue=EPOLL_MAX_HANDOFF_QUEUE):
+        assert epoll, "EpollEndpoint requires select.epoll"
+        assert isinstance(batch_size, int), type(batch_size)
+        assert batch_size > 0, batch_size
+        assert isinstance(max_handoff_queue, int), type(max_handoff_queue)
+        assert max_handoff_queue > 0, max_handoff_queue
+        super(EpollEndpoint, self).__init__(port, ip)
+
+        self._batch_size = batch_size
+        self._max_handoff_queue = max_handoff_queue
+
+        # deque containing (timestamp, packets, cache) tuples, guarded by _HANDOFF_LOCK
+        self._handoff_lock = threading.Lock()
+        self._handoff_queue = deque()
+        self._handoff_queue_size = 0
+        self._handoff_scheduled = False
+
+        # backpressure statistics
+        self._handoff_count = 0
+        self._handoff_packets = 0
+        self._handoff_dropped = 0
+        self._handoff_latency = 0.0
+        self._handoff_latency_max = 0.0
+
+    @property
+    def handoff_statistics(self):
+        """
+        Statistics about the handoff of received packets to the reactor thread.
+
+        - queued: the number of packets currently waiting for the reactor
+        - handoffs: the number of times the reactor processed the queue
+        - packets: the number of packets processed by the reactor
+        - dropped: the number of packets dropped because the queue was full
+        - latency_average and latency_max: seconds between receiving a batch and its processing on the reactor
+
+        @rtype: dict
+        """
+        return {"queued": self._handoff_queue_size,
+                "handoffs": self._handoff_count,
+                "packets": self._handoff_packets,
+                "dropped": self._handoff_dropped,
+                "latency_average": self._handoff_latency / self._handoff_count if self._handoff_count else 0.0,
+                "latency_max": self._handoff_latency_max}
+
+    def _loop(self):
+        assert self._dispersy, "Should not be called before open(...)"
+        fileno = self._socket.fileno()
+        recvfrom_into = self._socket.recvfrom_into
+        buffer_ = bytearray(65535)
+        view = memoryview(buffer_)
+
+        poller = epoll()
+        poller.register(fileno, EPOLLIN)
+        polling_write = False
+
+        prev_sendqueue = 0
+        try:
+            while self._running:
+                # see StandaloneEndpoint._loop, we limit the frequency of trying to write
+                want_write = bool(self._sendqueue) and (time() - prev_sendqueue) > 0.1
+                if want_write != polling_write:
+                    poller.modify(fileno, EPOLLIN | EPOLLOUT if want_write else EPOLLIN)
+                    polling_write = want_write
+
+                for _, events in poller.poll(0.1):
+                    if events & EPOLLOUT:
+                        self._process_sendqueue()
+                        prev_sendqueue = time()
+
+                    if events & EPOLLIN:
+                        self._receive_batch(recvfrom_into, view)
+
+        finally:
+            poller.close()
+
+    def _receive_batch(self, recvfrom_into, view):
+        packets = []
+        try:
+            # recvfrom_into raises EAGAIN once all available datagrams have been received
+            for _ in xrange(self._batch_size):
+                length, sock_addr = recvfrom_into(view)
+                if length:
+                    packets.append((sock_addr, view[:length].tobytes()))
+
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._dispersy.statistics.dict_inc(u"endpoint_recv", u"socket-error-'%s'" % repr(e))
+
+        finally:
+            if packets:
+                self._logger.debug('%d came in, %d bytes in total', len(packets), sum(len(packet) for _, packet in packets))
+                self.data_came_in(packets)
+
+    def _handoff(self, packets, cache):
+        with self._handoff_lock:
+            available = self._max_handoff_queue - self._handoff_queue_size
+            if len(packets) > available:
+                self._handoff_dropped += len(packets) - available
+                packets = packets[:available]
+                if not packets:
+                    return
+
+            self._handoff_queue.append((time(), packets, cache))
+            self._handoff_queue_size += len(packets)
+            schedule, self._handoff_scheduled = not self._handoff_scheduled, True
+
+        if schedule:
+            reactor.callFromThread(self._process_handoff_queue)
+
+    def _process_handoff_queue(self):
+        with self._handoff_lock:
+            batches = self._handoff_queue
+            self._handoff_queue = deque()
+            self._handoff_queue_size = 0
+            self._handoff_scheduled = False
+
+        now = time()
+        self._handoff_count += 1
+        self._handoff_latency += now - batches[0][0]
+        self._handoff_latency_max = max(self._handoff_latency_max, now - batches[0][0])
+
+        for timestamp, packets, cache in batches:
+            self._handoff_packets += len(packets)
+            self.dispersythread_data_came_in(packets, timestamp, cache)
+
+
+class _TwistedEndpointProtocol(DatagramProtocol):
+
+    def __init__(self, endpoint):
+        self._endpoint = endpoint
+
+    def datagramReceived(self, data, sock_addr):
+        self._endpoint.datagram_received(sock_addr, data)
+
+
+class TwistedEndpoint(StandaloneEndpoint):
+
+    """
+    A StandaloneEndpoint that uses reactor.listenUDP instead of a dedicated socket thread.
+
+    Packets are received on the reactor thread.  All packets that the reactor reads from the socket in one iteration
+    are given to Dispersy as a single batch.  The listen_to prefix handlers, tunnel prefix stripping, and sendqueue
+    behave the same as in StandaloneEndpoint, the sendqueue is retried using reactor.callLater.
+    """
 
-                self._dispersy.statistics.cur_sendqueue = len(self._sendqueue)
+    def __init__(self, port, ip="0.0.0.0"):
+        super(TwistedEndpoint, self).__init__(port, ip)
+        # _LISTENING_PORT is set during open(...)
+        self._listening_port = None
+        self._received = []
+        self._process_sendqueue_call = None
+
+    def open(self, dispersy):
+        Endpoint.open(self, dispersy)
+
+        for _ in xrange(10000):
+            try:
+                self._logger.debug("Listening at %d", self._port)
+                self._listening_port = reactor.listenUDP(self._port, _TwistedEndpointProtocol(self), interface=self._ip)
+            except CannotListenError as exception:
+                self._port += 1
+                continue
+            break
+
+        else:
+            raise RuntimeError("TwistedEndpoint is unable to listen on any port up to %d (%s)" % (self._port - 1, exception))
+
+        self._socket = self._listening_port.socket
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 870400)
+        self._port = self._listening_port.getHost().port
+        self._add_task = self._schedule_process_sendqueue
+        self._running = True
+        return True
+
+    def close(self, timeout=10.0):
+        self._running = False
+        if self._process_sendqueue_call and self._process_sendqueue_call.active():
+            self._process_sendqueue_call.cancel()
+        self._process_sendqueue_call = None
+
+        # stopListening closes the socket
+        if self._listening_port:
+            self._listening_port.stopListening()
+            self._listening_port = None
+        self._socket = None
+        return Endpoint.close(self, timeout)
+
+    def datagram_received(self, sock_addr, data):
+        if not self._received:
+            # all packets read in this reactor iteration are processed as one batch
+            reactor.callLater(0, self._process_received)
+        self._received.append((sock_addr, data))
+
+    def _process_received(self):
+        packets, self._received = self._received, []
+        if packets and self._running:
+            self._logger.debug('%d came in, %d bytes in total', len(packets), sum(len(packet) for _, packet in packets))
+            self.data_came_in(packets)
+
+    def _handoff(self, packets, cache):
+        # we are already on the reactor thread
+        self.dispersythread_data_came_in(packets, time(), cache)
+
+    def _schedule_process_sendqueue(self, task, delay=0.0, id=""):
+        if self._running and not (self._process_sendqueue_call and self._process_sendqueue_call.active()):
+            self._process_sendqueue_call = reactor.callLater(delay, task)
 
 
 class ManualEnpoint(StandaloneEndpoint):
@@ -149,9 +149,11 @@ class Member(DummyMember):
         LENGTH is the number of bytes, starting at OFFSET, to be verified.  When this value is 0 it
                is set to len(data) - OFFSET.
 
+        DATA may be a str or a buffer, a buffer is used to verify part of DATA without copying it.
+
         Returns True or False.
         """
-        assert isinstance(data, str), type(data)
+        assert isinstance(data, (str, buffer)), type(data)
         assert isinstance(signature, str), type(signature)
         assert isinstance(offset, (int, long)), type(offset)
         assert isinstance(length, (int, long)), type(length)
@@ -165,7 +167,9 @@ class Member(DummyMember):
             return False
 
         if self._public_key and self._signature_length == len(signature):
-            return self._crypto.is_valid_signature(self._ec, data[offset:offset + length], signature)
+            if offset or length != len(data):
+                data = buffer(data, offset, length)
+            return self._crypto.is_valid_signature(self._ec, data, signature)
 
     def sign(self, data, offset=0, length=0):
         """
@@ -318,7 +318,7 @@ class Message(MetaObject):
 
     class Implementation(Packet):
 
-        def __init__(self, meta, authentication, resolution, distribution, destination, payload, conversion=None, candidate=None, source=u"unknown", packet="", packet_id=0, sign=True):
+        def __init__(self, meta, authentication, resolution, distribution, destination, payload, conversion=None, candidate=None, source=u"unknown", packet="", packet_id=0, sign=True, empty_signature=False):
             from .conversion import Conversion
             assert isinstance(meta, Message), "META has invalid type '%s'" % type(meta)
             assert isinstance(authentication, meta.authentication.Implementation), "AUTHENTICATION has invalid type '%s'" % type(authentication)
@@ -330,6 +330,7 @@ class Message(MetaObject):
             assert candidate is None or isinstance(candidate, Candidate), type(candidate)
             assert isinstance(packet, str), type(packet)
             assert isinstance(packet_id, (int, long)), type(packet_id)
+            assert isinstance(empty_signature, bool), type(empty_signature)
             super(Message.Implementation, self).__init__(meta, packet, packet_id)
             self._authentication = authentication
             self._resolution = resolution
@@ -359,11 +360,11 @@ class Message(MetaObject):
                 self._conversion = meta.community.get_conversion_for_message(self)
 
             if not packet:
-                self._packet = self._conversion.encode_message(self, sign=sign)
+                self._packet = self._conversion.encode_message(self, sign=sign, empty_signature=empty_signature)
 
                 if __debug__:  # attempt to decode the message when running in debug
                     try:
-                        self._conversion.decode_message(LoopbackCandidate(), self._packet, verify=sign, allow_empty_signature=True)
+                        self._conversion.decode_message(LoopbackCandidate(), self._packet, verify=sign and not empty_signature, allow_empty_signature=True)
                     except DropPacket:
                         from binascii import hexlify
                         self._logger.error("Could not decode message created by me, hex '%s'", hexlify(self._packet))
@@ -472,6 +473,7 @@ class Message(MetaObject):
 
     @property
     def database_id(self):
+        assert self._database_id is not None, "%s is not stored yet, call Community.complete_initialization" % self._name
         return self._database_id
 
     @property
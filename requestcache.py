@@ -1,10 +1,10 @@
 from random import random
 import logging
 
-from twisted.internet import reactor
 from twisted.python.threadable import isInIOThread
 
 from .taskmanager import TaskManager
+from .timerwheel import TimerWheel
 
 
 class NumberCache(object):
@@ -130,17 +130,25 @@ class IntroductionRequestCache(RandomNumberCache):
 
 class RequestCache(TaskManager):
 
-    def __init__(self):
+    def __init__(self, timer_wheel=None):
         """
         Creates a new RequestCache instance.
+
+        @param timer_wheel: The wheel that schedules the cache timeouts, usually Dispersy.timer_wheel.  When None the
+                            RequestCache uses a wheel of its own.
+        @type timer_wheel: TimerWheel
         """
+        assert timer_wheel is None or isinstance(timer_wheel, TimerWheel), type(timer_wheel)
         super(RequestCache, self).__init__()
 
         assert isInIOThread(), "RequestCache must be used on the reactor's thread"
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
+        self._timer_wheel = TimerWheel() if timer_wheel is None else timer_wheel
         self._identifiers = dict()
+        # identifier:TimerWheelCall pairs with the pending timeout of every cache
+        self._timeouts = dict()
 
     def add(self, cache):
         """
@@ -163,7 +171,7 @@ class RequestCache(TaskManager):
         else:
             self._logger.debug("add %s", cache)
             self._identifiers[identifier] = cache
-            self.register_task(cache, reactor.callLater(cache.timeout_delay, self._on_timeout, cache))
+            self._timeouts[identifier] = self._timer_wheel.call_later(cache.timeout_delay, self._on_timeout, cache)
             return cache
 
     def has(self, prefix, number):
@@ -195,7 +203,7 @@ class RequestCache(TaskManager):
 
         identifier = self._create_identifier(number, prefix)
         cache = self._identifiers.pop(identifier)
-        self.cancel_pending_task(cache)
+        self._timeouts.pop(identifier).cancel()
         return cache
 
     def _on_timeout(self, cache):
@@ -216,11 +224,12 @@ class RequestCache(TaskManager):
         identifier = self._create_identifier(cache.number, cache.prefix)
         if identifier in self._identifiers:
             del self._identifiers[identifier]
+            del self._timeouts[identifier]
 
-        self.cancel_pending_task(cache)
-
-    def _create_identifier(self, number, prefix):
-        return u"%s:%d" % (prefix, number)
+    @staticmethod
+    def _create_identifier(number, prefix):
+        # a tuple is hashed and compared without formatting a new string for every lookup
+        return (prefix, number)
 
     def clear(self):
         """
@@ -230,5 +239,8 @@ class RequestCache(TaskManager):
         assert isInIOThread(), "RequestCache must be used on the reactor's thread"
 
         self._logger.debug("Clearing %s [%s]", self, len(self._identifiers))
+        for timeout in self._timeouts.itervalues():
+            timeout.cancel()
+        self._timeouts.clear()
         self.cancel_all_pending_tasks()
         self._identifiers.clear()
@@ -0,0 +1,242 @@
+"""
+Signs batches of outgoing messages, optionally on a pool of worker processes or threads.
+
+Creating a message normally signs its packet immediately, on the reactor thread.  Messages that are sent in large
+numbers, i.e. the introduction requests and responses of the candidate walker, are instead created with
+empty_signature=True and given to the SigningService.  The service collects the messages that are given to it within
+the batch window and signs them together, either on the reactor thread or on the workers.  Like the VerificationPool,
+worker processes are only useful when the crypto backend holds the GIL while signing.
+
+The multiprocessing pools of Python 2.7 do not report errors to a callback, hence the results are collected on a
+waiter thread.  When the workers fail the messages are signed on the reactor thread instead.
+
+Only messages that use MemberAuthentication are signed on the workers, all other messages are signed on the reactor
+thread.
+"""
+import logging
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from threading import Event
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python import threadpool
+
+from .authentication import MemberAuthentication
+from .crypto import DispersyCrypto
+
+
+# the maximum number of private keys that each worker keeps in its cache
+MAX_KEY_CACHE_SIZE = 64
+
+# private_key_bin:key pairs, one cache for each worker process (shared between worker threads)
+_key_cache = {}
+
+
+class _Signer(object):
+
+    """
+    The callable that runs on the workers.  Must be picklable.
+    """
+
+    def __init__(self, crypto):
+        self._crypto = crypto
+
+    def __call__(self, task):
+        private_key, data = task
+        try:
+            key = _key_cache.get(private_key)
+            if key is None:
+                if len(_key_cache) >= MAX_KEY_CACHE_SIZE:
+                    _key_cache.clear()
+                key = _key_cache[private_key] = self._crypto.key_from_private_bin(private_key)
+            return self._crypto.create_signature(key, data)
+        except Exception:
+            return None
+
+
+class SigningService(object):
+
+    def __init__(self, crypto, workers=0, processes=True, batch_window=0.0):
+        """
+        Initialise a SigningService instance.
+
+        @param crypto: The crypto used to sign the messages.  Must be picklable when PROCESSES is True.
+        @type crypto: DispersyCrypto
+
+        @param workers: The number of worker processes or threads.  When 0 the messages are signed on the reactor
+                        thread.
+        @type workers: int
+
+        @param processes: When True the messages are signed on worker processes, otherwise on worker threads.
+        @type processes: bool
+
+        @param batch_window: The number of seconds that messages are collected before they are signed.  When 0.0
+                             every call to sign is handled immediately.
+        @type batch_window: float
+        """
+        assert isinstance(crypto, DispersyCrypto), type(crypto)
+        assert isinstance(workers, int), type(workers)
+        assert workers >= 0, workers
+        assert isinstance(processes, bool), type(processes)
+        assert isinstance(batch_window, float), type(batch_window)
+        assert batch_window >= 0.0, batch_window
+        super(SigningService, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._crypto = crypto
+        self._signer = _Signer(crypto)
+        self._workers = workers
+        self._processes = processes
+        self._batch_window = batch_window
+        self._pool = None
+        self._waiter = None
+        self._stopped = Event()
+
+        # mid:private_key_bin pairs for the members whose messages are signed on the workers
+        self._private_keys = {}
+        # (messages, deferred) pairs collected during the current batch window
+        self._batch = []
+        self._delayed_call = None
+        # deferreds of the batches that are being signed on the workers
+        self._pending = set()
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def batch_window(self):
+        return self._batch_window
+
+    @property
+    def is_running(self):
+        return self._pool is not None
+
+    def start(self):
+        assert self._pool is None, "SigningService is already running"
+        if self._workers:
+            self._stopped.clear()
+            self._pool = (Pool if self._processes else ThreadPool)(self._workers)
+            self._waiter = threadpool.ThreadPool(1, 1, name="SigningService")
+            self._waiter.start()
+            self._logger.debug("started %d signing %s", self._workers, "processes" if self._processes else "threads")
+
+    def stop(self):
+        """
+        Stops the workers.  Messages that are not yet signed fail with a RuntimeError.
+        """
+        if self._delayed_call is not None:
+            self._delayed_call.cancel()
+            self._delayed_call = None
+
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            self._stopped.set()
+            pool.terminate()
+            pool.join()
+            self._waiter.stop()
+            self._waiter = None
+
+        pending = set(self._pending)
+        pending.update(deferred for _, deferred in self._batch)
+        self._pending = set()
+        self._batch = []
+        for deferred in pending:
+            deferred.errback(RuntimeError("SigningService stopped"))
+
+    def sign(self, messages):
+        """
+        Signs the packets of MESSAGES, which must have been created with empty_signature=True.  Must be called on
+        the reactor thread.
+
+        @param messages: The messages to sign.
+        @type messages: list containing Message.Implementation instances
+
+        @return: A Deferred that fires, on the reactor thread, with MESSAGES once they are signed.
+        @rtype: Deferred
+        """
+        assert isinstance(messages, list), type(messages)
+        deferred = Deferred()
+        self._batch.append((messages, deferred))
+
+        if not self._batch_window:
+            self._flush()
+        elif self._delayed_call is None:
+            self._delayed_call = reactor.callLater(self._batch_window, self._flush)
+        return deferred
+
+    def _get_private_key(self, member):
+        private_key = self._private_keys.get(member.mid)
+        if private_key is None:
+            private_key = self._private_keys[member.mid] = self._crypto.key_to_bin(member.private_key)
+        return private_key
+
+    @staticmethod
+    def _set_signature(message, data, signature):
+        message.authentication.set_signature(signature)
+        message.regenerate_packet(data + signature)
+
+    def _flush(self):
+        self._delayed_call = None
+        batch, self._batch = self._batch, []
+
+        # (message, data) pairs for the messages that are signed on the workers
+        unsigned = []
+        tasks = []
+        for messages, _ in batch:
+            for message in messages:
+                authentication = message.authentication
+                if isinstance(authentication, MemberAuthentication.Implementation) and authentication.member.private_key:
+                    data = message.packet[:len(message.packet) - authentication.member.signature_length]
+                    if self._pool is None:
+                        self._set_signature(message, data, authentication.member.sign(data))
+                    else:
+                        unsigned.append((message, data))
+                        tasks.append((self._get_private_key(authentication.member), data))
+                else:
+                    # encoding the message again signs it on the reactor thread
+                    message.regenerate_packet()
+
+        if not tasks:
+            for messages, deferred in batch:
+                deferred.callback(messages)
+            return
+
+        deferreds = [deferred for _, deferred in batch]
+        self._pending.update(deferreds)
+
+        def on_signatures(signatures):
+            if not all(deferred in self._pending for deferred in deferreds):
+                # stopped while signing
+                return
+
+            for (message, data), signature in zip(unsigned, signatures):
+                if signature is None:
+                    # the worker failed, sign on the reactor thread instead
+                    signature = message.authentication.member.sign(data)
+                self._set_signature(message, data, signature)
+
+            self._pending.difference_update(deferreds)
+            for messages, deferred in batch:
+                deferred.callback(messages)
+
+        def on_error(failure):
+            if all(deferred in self._pending for deferred in deferreds):
+                self._logger.warning("unable to sign %d messages on the workers: %s", len(tasks), failure.getErrorMessage())
+                on_signatures([None] * len(tasks))
+
+        chunksize = max(1, len(tasks) // (self._workers * 4))
+        async_result = self._pool.map_async(self._signer, tasks, chunksize)
+        deferToThreadPool(reactor, self._waiter, self._wait, async_result).addCallbacks(on_signatures, on_error)
+
+    def _wait(self, async_result):
+        """
+        Returns the results of ASYNC_RESULT, or raises its error.  Runs on the waiter thread.
+        """
+        # a terminated pool never finishes its pending results
+        while not async_result.ready():
+            if self._stopped.is_set():
+                raise RuntimeError("SigningService stopped")
+            async_result.wait(0.1)
+        return async_result.get()
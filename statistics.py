@@ -166,6 +166,35 @@ class DispersyStatistics(Statistics):
 
         # size of the sendqueue
         self.cur_sendqueue = 0
+        # nr of packets that were added to the sendqueue or expired while waiting, and the nr of failed attempts to
+        # send a packet from the sendqueue (other than a full socket buffer, the packet is retried until it expires)
+        self.sendqueue_queued = 0
+        self.sendqueue_expired = 0
+        self.sendqueue_errors = 0
+
+        # nr of packets whose signatures were, or were not, found in the verified signature cache
+        self.verified_signature_cache_hits = 0
+        self.verified_signature_cache_misses = 0
+
+        # nr of get_member calls that were answered from the member cache, answered from the cache of members
+        # whose public key is unknown, or that required a database query
+        self.member_cache_hits = 0
+        self.dummy_member_cache_hits = 0
+        self.member_cache_misses = 0
+        # nr of public keys that were, or were not, found in the parsed public key cache
+        self.public_key_cache_hits = 0
+        self.public_key_cache_misses = 0
+        # fraction of the lookups above that were answered from the caches, computed by update
+        self.member_cache_hit_rate = 0.0
+        self.public_key_cache_hit_rate = 0.0
+
+        # nr of get_community lookups that were answered from the cache of communities in the database, answered from
+        # the cache of unknown community ids, or that required a database query
+        self.community_cache_hits = 0
+        self.unknown_community_cache_hits = 0
+        self.community_cache_misses = 0
+        # nr of database queries avoided by the caches above, computed by update
+        self.community_queries_avoided = 0
 
         # nr of candidates introduced/stumbled upon
         self.total_candidates_discovered = 0
@@ -243,6 +272,13 @@ class DispersyStatistics(Statistics):
         for community in self.communities:
             community.update(database=database)
 
+        member_hits = self.member_cache_hits + self.dummy_member_cache_hits
+        member_lookups = member_hits + self.member_cache_misses
+        self.member_cache_hit_rate = float(member_hits) / member_lookups if member_lookups else 0.0
+        public_key_lookups = self.public_key_cache_hits + self.public_key_cache_misses
+        self.public_key_cache_hit_rate = float(self.public_key_cache_hits) / public_key_lookups if public_key_lookups else 0.0
+        self.community_queries_avoided = self.community_cache_hits + self.unknown_community_cache_hits
+
         # list with {count=int, duration=float, average=float, entry=str} dictionaries.  each entry
         # represents a key from the attach_runtime_statistics decorator
         self.runtime = [(statistic.duration, statistic.get_dict(entry=entry)) for entry, statistic in _runtime_statistics.iteritems() if statistic.duration > 1]
@@ -255,6 +291,22 @@ class DispersyStatistics(Statistics):
         self.total_send = 0
         self.total_received = 0
         self.cur_sendqueue = 0
+        self.sendqueue_queued = 0
+        self.sendqueue_expired = 0
+        self.sendqueue_errors = 0
+        self.verified_signature_cache_hits = 0
+        self.verified_signature_cache_misses = 0
+        self.member_cache_hits = 0
+        self.dummy_member_cache_hits = 0
+        self.member_cache_misses = 0
+        self.public_key_cache_hits = 0
+        self.public_key_cache_misses = 0
+        self.member_cache_hit_rate = 0.0
+        self.public_key_cache_hit_rate = 0.0
+        self.community_cache_hits = 0
+        self.unknown_community_cache_hits = 0
+        self.community_cache_misses = 0
+        self.community_queries_avoided = 0
         self.start = self.timestamp = time()
 
         # walk statistics
@@ -307,6 +359,15 @@ class CommunityStatistics(Statistics):
         self.sync_bloom_send = 0
         self.sync_bloom_skip = 0
 
+        # delay-type:count pairs for the packets and messages that are currently delayed
+        self.delayed = dict()
+
+        # nr of bloom filter requests that were, or were not, answered from the sync response cache, and the fraction
+        # that was answered from the cache, set by update
+        self.sync_response_cache_hits = 0
+        self.sync_response_cache_misses = 0
+        self.sync_response_cache_hit_rate = 0.0
+
         self.dispersy_acceptable_global_time_range = self._community.dispersy_acceptable_global_time_range
 
         self.dispersy_enable_candidate_walker = self._community.dispersy_enable_candidate_walker
@@ -354,6 +415,14 @@ class CommunityStatistics(Statistics):
         else:
             self.database = dict()
 
+        self.delayed = self._community.delay_registry.get_counts()
+
+        sync_response_cache = self._community.sync_response_cache
+        if sync_response_cache:
+            self.sync_response_cache_hits = sync_response_cache.hits
+            self.sync_response_cache_misses = sync_response_cache.misses
+            self.sync_response_cache_hit_rate = sync_response_cache.hit_rate
+
     def reset(self):
         self.total_candidates_discovered = 0
         self.msg_statistics.reset()
@@ -0,0 +1,386 @@
+"""
+This module provides the in-memory sync index that is used to build the sync bloom filters.
+
+Every outgoing dispersy-introduction-request may contain a bloom filter describing the packets that we have within a
+certain global time range.  Building such a bloom filter by selecting the packets from the database and hashing them
+all again becomes very expensive for communities with many syncable packets.  The SyncIndex keeps the packet ids of the
+syncable packets in memory, sorted by global time, and caches bloom filters for fixed size global time buckets.  A new
+bloom filter is then build by merging the cached bucket filters, only the packets in the partially covered buckets at
+the edges of the requested range are hashed.
+
+When the community uses dispersy_sync_bloom_filter_digest, which is the default, the bloom filters contain the packet
+digests, which the index keeps in memory as well.  Otherwise the packets that must be hashed are selected from the
+database by their id, the packets themselves are never kept in memory.
+
+The index is updated by Dispersy._store, undo, redo and pruning.  Any other modification to the sync table must call
+SyncIndex.invalidate, the index will be reloaded from the database the next time it is used.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, defaultdict
+import logging
+
+from twisted.internet.defer import succeed
+
+from .bloomfilter import BloomFilter, get_key_digest
+from .distribution import SyncDistribution
+
+
+# the number of global time values that are covered by one cached bucket filter
+SYNC_INDEX_BUCKET_SIZE = 64
+# the maximum number of bucket filters that are cached (each is dispersy_sync_bloom_filter_bits large)
+SYNC_INDEX_MAX_BUCKET_FILTERS = 512
+
+
+class SyncIndex(object):
+
+    def __init__(self, community, bucket_size=SYNC_INDEX_BUCKET_SIZE, max_bucket_filters=SYNC_INDEX_MAX_BUCKET_FILTERS):
+        """
+        Create an (unloaded) sync index for COMMUNITY.
+
+        @param community: The community that the indexed packets belong to.
+        @type community: Community
+
+        @param bucket_size: The number of global time values covered by one cached bucket filter.
+        @type bucket_size: int
+
+        @param max_bucket_filters: The maximum number of bucket filters to cache.
+        @type max_bucket_filters: int
+        """
+        from .community import Community
+        assert isinstance(community, Community), type(community)
+        assert isinstance(bucket_size, int), type(bucket_size)
+        assert bucket_size > 0, bucket_size
+        assert isinstance(max_bucket_filters, int), type(max_bucket_filters)
+        assert max_bucket_filters >= 0, max_bucket_filters
+        super(SyncIndex, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self._community = community
+        self._bucket_size = bucket_size
+        self._max_bucket_filters = max_bucket_filters
+        # when True the packet digests are added to the bloom filters instead of the packets
+        self._digest = community.dispersy_sync_bloom_filter_digest
+
+        self._loaded = False
+        # the Deferred of the running load_async call
+        self._loading = None
+        # the modifications made while load_async is running, as (method, arguments) tuples that are applied to the
+        # loaded rows.  None when not loading or when the index was invalidated during the load
+        self._pending = None
+        # the meta message database ids of the syncable messages (set when loaded)
+        self._meta_ids = frozenset()
+        # sorted list containing (global_time, member_id) keys
+        self._keys = []
+        # (global_time, member_id) key: (packet_id, meta_id, digest), where digest is None unless self._digest
+        self._entries = {}
+        # packet_id: (global_time, member_id) key
+        self._keys_by_packet_id = {}
+
+        # (bucket, size, functions, prefix): BloomFilter, ordered from least to most recently used
+        self._bucket_filters = OrderedDict()
+        # bucket: set([(bucket, size, functions, prefix), ...])
+        self._bucket_filter_keys = defaultdict(set)
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    def count(self):
+        """
+        Returns the number of indexed packets.
+        @rtype: int
+        """
+        self._load()
+        return len(self._keys)
+
+    def get_syncable_meta_ids(self):
+        """
+        Returns the database ids of the meta messages that are part of the sync bloom filters.
+        @rtype: [int]
+        """
+        return [meta.database_id
+                for meta in self._community.get_meta_messages()
+                if isinstance(meta.distribution, SyncDistribution) and meta.distribution.priority > 32]
+
+    def _get_load_query(self, meta_ids):
+        return (u"SELECT id, member, global_time, meta_message, %s FROM sync WHERE meta_message IN (%s) AND undone = 0" %
+                (u"digest" if self._digest else u"NULL", u", ".join(u"?" for _ in meta_ids)), tuple(meta_ids))
+
+    def _load(self):
+        if self._loaded:
+            return
+
+        meta_ids = frozenset(self.get_syncable_meta_ids())
+        if meta_ids:
+            sql, sql_arguments = self._get_load_query(meta_ids)
+            self._load_rows(meta_ids, self._community.dispersy.database.execute(sql, sql_arguments))
+        else:
+            self._load_rows(meta_ids, [])
+
+    def load_async(self):
+        """
+        Load the index using the asynchronous database executor.
+
+        Modifications that are made while the query is running are applied to the loaded rows once the query has
+        finished.  Only when the index is invalidated while the query is running is the result discarded, in which
+        case load_async must be called again.
+
+        @return: a Deferred that fires once the query has finished.
+        """
+        if self._loaded:
+            return succeed(None)
+
+        if self._loading is None:
+            meta_ids = frozenset(self.get_syncable_meta_ids())
+            if not meta_ids:
+                self._load_rows(meta_ids, [])
+                return succeed(None)
+
+            sql, sql_arguments = self._get_load_query(meta_ids)
+            self._pending = []
+            self._loading = self._community.dispersy.database.execute_async(sql, sql_arguments)
+            self._loading.addCallbacks(self._on_load_async, self._on_load_async_error, callbackArgs=(meta_ids,))
+
+        return self._loading
+
+    def _on_load_async(self, rows, meta_ids):
+        pending, self._loading, self._pending = self._pending, None, None
+        if self._loaded:
+            return
+
+        if pending is None:
+            self._logger.debug("%s sync index invalidated while loading, discarding %d rows",
+                               self._community.cid.encode("HEX"), len(rows))
+            return
+
+        self._load_rows(meta_ids, rows)
+        # the rows may or may not include these modifications, applying them again is harmless
+        for method, args in pending:
+            method(*args)
+        if pending:
+            self._logger.debug("%s applied %d modifications made while loading",
+                               self._community.cid.encode("HEX"), len(pending))
+
+    def _on_load_async_error(self, failure):
+        self._loading = None
+        self._pending = None
+        self._logger.error("%s unable to load the sync index: %s", self._community.cid.encode("HEX"), failure.getErrorMessage())
+
+    def _load_rows(self, meta_ids, rows):
+        self._meta_ids = meta_ids
+        self._keys = []
+        self._entries = {}
+        self._keys_by_packet_id = {}
+        self._clear_bucket_filters()
+
+        for packet_id, member_id, global_time, meta_id, digest in rows:
+            key = (global_time, member_id)
+            self._keys.append(key)
+            self._entries[key] = (packet_id, meta_id, str(digest) if self._digest else None)
+            self._keys_by_packet_id[packet_id] = key
+        self._keys.sort()
+
+        self._loaded = True
+        self._logger.debug("%s loaded %d syncable packets", self._community.cid.encode("HEX"), len(self._keys))
+
+    def invalidate(self):
+        """
+        Forget everything, the index is reloaded from the database the next time it is used.
+        """
+        self._pending = None
+        if self._loaded:
+            self._loaded = False
+            self._keys = []
+            self._entries = {}
+            self._keys_by_packet_id = {}
+            self._clear_bucket_filters()
+
+    def store(self, messages):
+        """
+        Add the syncable messages from MESSAGES that have just been stored in the database.
+
+        Each message must have a valid packet_id.
+        """
+        for message in messages:
+            self._modify(self._add, message.packet_id, message.authentication.member.database_id,
+                         message.distribution.global_time, message.database_id, message.packet)
+
+    def redo(self, messages):
+        """
+        Add MESSAGES again after their undone flag has been removed in the database.
+        """
+        self.store(messages)
+
+    def _modify(self, method, *args):
+        """
+        Call METHOD(*ARGS) when the index is loaded, or postpone the call until load_async has finished.
+        """
+        if self._loaded:
+            method(*args)
+        elif self._pending is not None:
+            self._pending.append((method, args))
+
+    def _add(self, packet_id, member_id, global_time, meta_id, packet):
+        if meta_id not in self._meta_ids:
+            return
+
+        key = (global_time, member_id)
+        if key in self._entries:
+            self._remove(key)
+
+        insort(self._keys, key)
+        bloom_key = get_key_digest(packet) if self._digest else packet
+        self._entries[key] = (packet_id, meta_id, bloom_key if self._digest else None)
+        self._keys_by_packet_id[packet_id] = key
+
+        # the packet can simply be added to the cached bucket filters
+        for filter_key in self._bucket_filter_keys.get(global_time // self._bucket_size, ()):
+            self._bucket_filters[filter_key].add(bloom_key)
+
+    def _remove(self, key):
+        packet_id = self._entries.pop(key)[0]
+        del self._keys_by_packet_id[packet_id]
+        del self._keys[bisect_left(self._keys, key)]
+
+        # bloom filters do not support removal, hence we drop the bucket filters for this global time
+        self._drop_bucket_filters(key[0] // self._bucket_size)
+
+    def remove_packet_ids(self, packet_ids):
+        """
+        Remove the packets with PACKET_IDS, i.e. because they were deleted or undone.
+        """
+        self._modify(self._remove_packet_ids, list(packet_ids))
+
+    def _remove_packet_ids(self, packet_ids):
+        for packet_id in packet_ids:
+            key = self._keys_by_packet_id.get(packet_id)
+            if key:
+                self._remove(key)
+
+    def undo(self, member_id, global_time):
+        """
+        Remove the packet created by MEMBER_ID at GLOBAL_TIME because it has been undone.
+        """
+        self._modify(self._undo, member_id, global_time)
+
+    def _undo(self, member_id, global_time):
+        key = (global_time, member_id)
+        if key in self._entries:
+            self._remove(key)
+
+    def prune(self, meta_id, global_time):
+        """
+        Remove all META_ID packets with a global time lower or equal to GLOBAL_TIME.
+        """
+        self._modify(self._prune, meta_id, global_time)
+
+    def _prune(self, meta_id, global_time):
+        if meta_id not in self._meta_ids:
+            return
+
+        keys = self._keys
+        for key in keys[:bisect_right(keys, (global_time, float("inf")))]:
+            if self._entries[key][1] == meta_id:
+                self._remove(key)
+
+    def select(self, global_time, limit, higher=True):
+        """
+        Returns at most LIMIT (global_time, packet_id) tuples with a global time higher than GLOBAL_TIME (ascending)
+        or lower than GLOBAL_TIME (descending).
+
+        This is equivalent to 'SELECT global_time, id FROM sync WHERE meta_message IN (...) AND undone = 0 AND
+        global_time > ? ORDER BY global_time ASC LIMIT ?' (or the < and DESC variant when HIGHER is False).
+        @rtype: [(int, int)]
+        """
+        self._load()
+        keys = self._keys
+        entries = self._entries
+        if higher:
+            start = bisect_right(keys, (global_time, float("inf")))
+            selected = keys[start:start + limit]
+        else:
+            end = bisect_left(keys, (global_time,))
+            selected = keys[max(0, end - limit):end]
+            selected.reverse()
+        return [(key[0], entries[key][0]) for key in selected]
+
+    def _get_bloom_keys(self, keys):
+        """
+        Returns the bloom filter keys, i.e. the packets or their digests, of the indexed packets with KEYS.
+        """
+        entries = self._entries
+        if self._digest:
+            return [entries[key][2] for key in keys]
+
+        packet_ids = [entries[key][0] for key in keys]
+        if not packet_ids:
+            return []
+        return [str(packet) for packet, in self._community.dispersy.database.execute_in(
+            u"SELECT packet FROM sync WHERE id IN (%s)", (), packet_ids)]
+
+    def iter_bloom_keys(self, modulo=1, offset=0):
+        """
+        Yields the bloom filter keys, i.e. the packets or their digests, of all indexed packets where
+        (global_time + OFFSET) %% MODULO == 0.
+        """
+        self._load()
+        for bloom_key in self._get_bloom_keys([key for key in self._keys if (key[0] + offset) % modulo == 0]):
+            yield bloom_key
+
+    def fill_bloom_filter(self, bloom_filter, time_low, time_high):
+        """
+        Add all indexed packets, or their digests, with TIME_LOW <= global time <= TIME_HIGH to BLOOM_FILTER.
+
+        Buckets that are completely covered by the range are merged from the cached bucket filters, the remaining
+        packets are hashed.
+        """
+        assert isinstance(bloom_filter, BloomFilter), type(bloom_filter)
+        self._load()
+        keys = self._keys
+        bucket_size = self._bucket_size
+
+        start = bisect_left(keys, (time_low,))
+        end = bisect_right(keys, (time_high, float("inf")))
+
+        # only buckets that fall completely within [time_low, time_high] can be merged
+        first_full_bucket = -(-time_low // bucket_size)
+        last_full_bucket = (time_high + 1) // bucket_size - 1
+
+        index = start
+        while index < end:
+            bucket = keys[index][0] // bucket_size
+            bucket_end = bisect_left(keys, ((bucket + 1) * bucket_size,), index, end)
+            if first_full_bucket <= bucket <= last_full_bucket and self._max_bucket_filters:
+                bloom_filter.merge(self._get_bucket_filter(bloom_filter, bucket, index, bucket_end))
+            else:
+                bloom_filter.add_keys(self._get_bloom_keys(keys[index:bucket_end]))
+            index = bucket_end
+
+    def _get_bucket_filter(self, bloom_filter, bucket, start, end):
+        filter_key = (bucket, bloom_filter.size, bloom_filter.functions, bloom_filter.prefix)
+        bucket_filter = self._bucket_filters.pop(filter_key, None)
+
+        if bucket_filter is None:
+            bucket_filter = BloomFilter("\x00" * (bloom_filter.size / 8), bloom_filter.functions, prefix=bloom_filter.prefix)
+            bucket_filter.add_keys(self._get_bloom_keys(self._keys[start:end]))
+            self._bucket_filter_keys[bucket].add(filter_key)
+
+            if len(self._bucket_filters) >= self._max_bucket_filters:
+                old_key, _ = self._bucket_filters.popitem(False)
+                old_keys = self._bucket_filter_keys[old_key[0]]
+                old_keys.discard(old_key)
+                if not old_keys:
+                    del self._bucket_filter_keys[old_key[0]]
+
+        # (re)insert to mark as most recently used
+        self._bucket_filters[filter_key] = bucket_filter
+        return bucket_filter
+
+    def _drop_bucket_filters(self, bucket):
+        for filter_key in self._bucket_filter_keys.pop(bucket, ()):
+            del self._bucket_filters[filter_key]
+
+    def _clear_bucket_filters(self):
+        self._bucket_filters.clear()
+        self._bucket_filter_keys.clear()
@@ -0,0 +1,145 @@
+"""
+This module provides the cache of recent responses to the bloom filter in a dispersy-introduction-request.
+
+A peer reuses the bloom filter of its sync requests many times, hence the same (time_low, time_high, modulo, offset,
+bloom filter) request is often received repeatedly, from one or more peers.  Without a cache every such request selects
+the packets in the requested range from the database and checks them against the bloom filter again.  The
+SyncResponseCache remembers the packets that were sent in response to a request for a few seconds.
+
+The cached responses are only valid while the packets in the requested range do not change.  Every modification to the
+sync table must call SyncResponseCache.invalidate, through Community.on_sync_table_changed, either with the global times
+of the packets that changed or without arguments to remove all cached responses.  A response that was selected while a
+packet in its range changed is not cached.
+"""
+
+from collections import OrderedDict, deque
+from time import time
+
+
+# the maximum number of responses that are cached
+SYNC_RESPONSE_CACHE_SIZE = 64
+# the number of seconds that a response remains cached
+SYNC_RESPONSE_CACHE_TIMEOUT = 5.0
+# the number of recent invalidations that are remembered to decide whether a response may still be cached
+SYNC_RESPONSE_CACHE_INVALIDATIONS = 64
+
+
+class SyncResponseCache(object):
+
+    def __init__(self, size=SYNC_RESPONSE_CACHE_SIZE, timeout=SYNC_RESPONSE_CACHE_TIMEOUT):
+        """
+        Create an empty cache.
+
+        @param size: The maximum number of responses to cache.
+        @type size: int
+
+        @param timeout: The number of seconds after which a cached response expires.
+        @type timeout: float
+        """
+        assert isinstance(size, int), type(size)
+        assert size > 0, size
+        assert isinstance(timeout, float), type(timeout)
+        super(SyncResponseCache, self).__init__()
+        self._size = size
+        self._timeout = timeout
+
+        # key:(expires, packets) pairs, in least recently added order
+        self._responses = OrderedDict()
+        # incremented whenever the cache is invalidated
+        self._generation = 0
+        # (generation, global_times) pairs of the most recent invalidations, global_times is None when everything was
+        # invalidated
+        self._invalidations = deque(maxlen=SYNC_RESPONSE_CACHE_INVALIDATIONS)
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self):
+        """
+        A number that changes whenever the cache is invalidated.
+
+        It must be obtained before selecting a response and given to put, such that a response that was selected
+        while a packet in its range changed is not cached.
+        """
+        return self._generation
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of the lookups that were answered from the cache.
+        @rtype: float
+        """
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    @staticmethod
+    def get_key(bloom_filter, time_low, time_high, offset, modulo):
+        """
+        Returns the key for the response to a bloom filter request.
+
+        TIME_HIGH is the time_high of the request, where 0 means that the range ends at the current global time.  Such
+        a response remains valid while the global time increases, since packets above the global time can only be
+        added by storing them, which invalidates the response.
+        """
+        return (bloom_filter.bytes, bloom_filter.functions, bloom_filter.prefix, time_low, time_high, offset, modulo)
+
+    @staticmethod
+    def _in_range(key, global_times):
+        """
+        Returns True when the response for KEY may contain a packet with one of GLOBAL_TIMES.
+        """
+        time_low, time_high, offset, modulo = key[3:]
+        return any(time_low <= global_time and (global_time <= time_high or not time_high) and
+                   (global_time + offset) % modulo == 0
+                   for global_time in global_times)
+
+    def get(self, key, now=None):
+        """
+        Returns the list with cached packets for KEY, or None when KEY is not cached or expired.
+        """
+        response = self._responses.get(key)
+        if response is not None:
+            expires, packets = response
+            if expires > (time() if now is None else now):
+                self.hits += 1
+                return packets
+            del self._responses[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, packets, generation, now=None):
+        """
+        Caches PACKETS as the response for KEY, unless a packet in its range changed after GENERATION was obtained.
+        """
+        assert isinstance(packets, list), type(packets)
+        if generation != self._generation:
+            invalidations = [global_times for invalidation, global_times in self._invalidations if invalidation > generation]
+            if len(invalidations) < self._generation - generation:
+                # we no longer know which packets changed
+                return
+            if any(global_times is None or self._in_range(key, global_times) for global_times in invalidations):
+                return
+
+        # all entries use the same timeout, hence the least recently added entry expires first
+        self._responses.pop(key, None)
+        self._responses[key] = ((time() if now is None else now) + self._timeout, packets)
+        if len(self._responses) > self._size:
+            self._responses.popitem(False)
+
+    def invalidate(self, global_times=None):
+        """
+        Removes the cached responses that may contain a packet with one of GLOBAL_TIMES, or all cached responses when
+        GLOBAL_TIMES is None.  Must be called whenever the sync table changes.
+        """
+        self._generation += 1
+        if global_times is None:
+            self._invalidations.append((self._generation, None))
+            self._responses.clear()
+
+        else:
+            global_times = frozenset(global_times)
+            self._invalidations.append((self._generation, global_times))
+            for key in [key for key in self._responses if self._in_range(key, global_times)]:
+                del self._responses[key]
@@ -6,6 +6,8 @@ from twisted.internet.base import DelayedCall
 from twisted.internet.defer import Deferred
 from twisted.internet.task import LoopingCall
 
+from .timerwheel import TimerWheelCall
+
 
 CLEANUP_FREQUENCY = 100
 
@@ -15,6 +17,8 @@ class TaskManager(object):
     """
     Provides a set of tools to mantain a list of twisted "tasks" (Deferred, LoopingCall, DelayedCall) that are to be
     executed during the lifetime of an arbitrary object, usually getting killed with it.
+
+    Timers obtained from TimerWheel.call_later are accepted wherever a DelayedCall is.
     """
     _reactor = reactor
 
@@ -35,7 +39,8 @@ class TaskManager(object):
         Register a task so it can be canceled at shutdown time or by name.
         """
         assert not self.is_pending_task_active(name), name
-        assert isinstance(task, (Deferred, DelayedCall, LoopingCall)), (task, type(task) == type(Deferred))
+        assert isinstance(task, (Deferred, DelayedCall, TimerWheelCall, LoopingCall)), \
+            (task, type(task) == type(Deferred))
 
         if delay is not None:
             if isinstance(task, Deferred):
@@ -72,7 +77,7 @@ class TaskManager(object):
         Cancels all the registered tasks.
         This usually should be called when stopping or destroying the object so no tasks are left floating around.
         """
-        assert all([isinstance(task, (Deferred, DelayedCall, LoopingCall, tuple))
+        assert all([isinstance(task, (Deferred, DelayedCall, TimerWheelCall, LoopingCall, tuple))
                     for task in self._pending_tasks.itervalues()]), self._pending_tasks
 
         for name in self._pending_tasks.keys():
@@ -95,7 +100,7 @@ class TaskManager(object):
                 # Have in mind that any deferred in the pending tasks list should have been constructed with a
                 # canceller function.
                 return not task.called, getattr(task, 'cancel', None)
-            elif isinstance(task, DelayedCall):
+            elif isinstance(task, (DelayedCall, TimerWheelCall)):
                 return task.active(), task.cancel
             elif isinstance(task, LoopingCall):
                 return task.running, task.stop
@@ -116,7 +121,7 @@ class TaskManager(object):
         if self._cleanup_counter:
             self._cleanup_counter -= 1
         else:
-            self._cleaup_counter = CLEANUP_FREQUENCY
+            self._cleanup_counter = CLEANUP_FREQUENCY
             for name in self._pending_tasks.keys():
                 if not self.is_pending_task_active(name):
                     self._pending_tasks.pop(name)
@@ -41,6 +41,27 @@ class TestBatch(DispersyTestFunc):
         # all of the messages must be stored in the database, as batch_window expired
         other.assert_count(messages[0], 10)
 
+    def test_store_packet_ids(self):
+        """
+        A batch is stored with a single executemany, the packet ids of the messages must match their rows.
+        """
+        node, = self.create_nodes(1)
+
+        node.store([node.create_full_sync_text("first batch #%d" % global_time, global_time)
+                    for global_time in xrange(10, 15)])
+        messages = [node.create_full_sync_text("second batch #%d" % global_time, global_time)
+                    for global_time in xrange(20, 30)]
+        node.store(messages)
+
+        def fetch_rows():
+            return [(packet_id, str(packet)) for packet_id, packet
+                    in node._dispersy.database.execute(u"SELECT id, packet FROM sync WHERE member = ? AND global_time >= 20 ORDER BY global_time",
+                                                      (node.my_member.database_id,))]
+
+        packet_ids = [message.packet_id for message in messages]
+        self.assertEqual(packet_ids, range(packet_ids[0], packet_ids[0] + len(messages)))
+        self.assertEqual(node.call(fetch_rows), [(message.packet_id, message.packet) for message in messages])
+
     def test_one_big_batch(self, length=1000):
         """
         Test that one big batch of messages is processed correctly.
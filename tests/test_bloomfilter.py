@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from ..bloomfilter import BloomFilter
+from ..bloomfilter import BloomFilter, BytearrayBloomFilter
 
 
 class TestBloomFilter(TestCase):
@@ -116,3 +116,57 @@ class TestBloomFilter(TestCase):
             self.assertTrue(all(str(i) in bloom for i in xrange(n_capacity)))
             false_positives = sum(str(i) in bloom for i in xrange(n_capacity, n_capacity + 10000))
             self.assertAlmostEqual(1.0 * false_positives / 10000, f_error_rate, delta=0.05)
+
+    def test_bytearray_backend(self):
+        """
+        Testing BytearrayBloomFilter against BloomFilter, both must result in the same bytes.
+        """
+        for m_size, prefix in ((128 * 8, ""), (8440, "p"), (2 ** 15 + 8, "q")):
+            bloom = BloomFilter(m_size, 0.01, prefix)
+            bytearray_bloom = BytearrayBloomFilter(m_size, 0.01, prefix)
+            bloom.add_keys(str(i) for i in xrange(500))
+            bytearray_bloom.add_keys(str(i) for i in xrange(250))
+            for i in xrange(250, 500):
+                bytearray_bloom.add(str(i))
+
+            self.assertEqual(bytearray_bloom.functions, bloom.functions)
+            self.assertEqual(bytearray_bloom.bytes, bloom.bytes)
+            self.assertEqual(bytearray_bloom.bits_checked, bloom.bits_checked)
+
+            keys = [(str(i),) for i in xrange(1000)]
+            self.assertEqual(list(bytearray_bloom.not_filter(iter(keys))), list(bloom.not_filter(iter(keys))))
+            self.assertEqual([key in bytearray_bloom for key, in keys], [key in bloom for key, in keys])
+
+            # load from, and merge with, the bytes of the long based bloom filter
+            clone = BytearrayBloomFilter(bloom.bytes, bloom.functions, prefix)
+            self.assertEqual(clone.bytes, bloom.bytes)
+            clone = BytearrayBloomFilter(bloom.bytes, bloom.functions, prefix=prefix)
+            self.assertEqual(clone.bytes, bloom.bytes)
+            self.assertEqual(BytearrayBloomFilter(0.01, 500, prefix=prefix).bytes, BloomFilter(0.01, 500, prefix).bytes)
+            bytearray_bloom.clear()
+            self.assertEqual(bytearray_bloom.bits_checked, 0)
+            bytearray_bloom.merge(bloom)
+            self.assertEqual(bytearray_bloom.bytes, bloom.bytes)
+
+    def test_merge_backends(self):
+        """
+        Testing that BloomFilter and BytearrayBloomFilter can be merged with each other.
+        """
+        for m_size, prefix in ((128 * 8, ""), (8440, "p")):
+            bloom = BloomFilter(m_size, 0.01, prefix)
+            bytearray_bloom = BytearrayBloomFilter(m_size, 0.01, prefix)
+            bloom.add_keys(str(i) for i in xrange(250))
+            bytearray_bloom.add_keys(str(i) for i in xrange(250, 500))
+
+            expected = BloomFilter(m_size, 0.01, prefix)
+            expected.add_keys(str(i) for i in xrange(500))
+
+            merged = BloomFilter(m_size, 0.01, prefix)
+            merged.merge(bloom)
+            merged.merge(bytearray_bloom)
+            self.assertEqual(merged.bytes, expected.bytes)
+
+            merged = BytearrayBloomFilter(m_size, 0.01, prefix)
+            merged.merge(bytearray_bloom)
+            merged.merge(bloom)
+            self.assertEqual(merged.bytes, expected.bytes)
@@ -10,7 +10,9 @@
 from itertools import combinations, islice
 from time import time
 
-from ..candidate import CANDIDATE_ELIGIBLE_DELAY
+from ..candidate import (CANDIDATE_ELIGIBLE_DELAY, CANDIDATE_STUMBLE_LIFETIME, CANDIDATE_INTRO_LIFETIME,
+                         WalkCandidate)
+from ..candidatestore import CandidateStore
 from ..tracker.community import TrackerCommunity
 from ..util import blocking_call_on_reactor_thread
 from .debugcommunity.community import DebugCommunity
@@ -649,3 +651,44 @@ class TestCandidates(DispersyTestFunc):
             got.append(candidate.wan_address)
 
         self.assertEquals(expected, got)
+
+    @blocking_call_on_reactor_thread
+    def test_candidate_store(self):
+        """
+        The CandidateStore must follow the category of each candidate, both when its timestamps change and when its
+        category expires.
+        """
+        store = CandidateStore()
+        candidates = [WalkCandidate(("127.0.0.1", i), False, ("127.0.0.1", i), ("127.0.0.1", i), u"unknown")
+                      for i in xrange(1, 4)]
+        for candidate in candidates:
+            store[candidate.sock_addr] = candidate
+
+        now = time()
+        candidates[0].associate(self._dispersy.get_new_member(u"very-low"))
+        candidates[0].stumble(now)
+        candidates[1].intro(now)
+        self.assertEqual(store.get_candidates([u"stumble"], now), candidates[:1])
+        self.assertEqual(store.get_candidates([None], now), candidates[2:])
+        self.assertEqual(store.get_walk_candidates(now), [None, candidates[0], candidates[1], None])
+
+        # walking to a candidate makes it ineligible for CANDIDATE_ELIGIBLE_DELAY seconds
+        candidates[0].walk(now)
+        self.assertEqual(store.get_walk_candidates(now), [None, None, candidates[1], None])
+
+        self.assertEqual(store.get_eligible_candidates(now, now), candidates[1:2])
+        self.assertEqual(store.get_eligible_candidates(now, now + CANDIDATE_ELIGIBLE_DELAY), candidates[:2])
+
+        now += max(CANDIDATE_ELIGIBLE_DELAY, CANDIDATE_INTRO_LIFETIME)
+        self.assertEqual(store.get_walk_candidates(now), [None, candidates[0], None, None])
+        self.assertEqual(store.get_candidates([None], now), candidates[1:])
+
+        # removed candidates are no longer part of any category
+        del store[candidates[2].sock_addr]
+        candidates[2].intro(now)
+        self.assertEqual(store.get_candidates([None], now), candidates[1:2])
+        self.assertEqual(store.get_candidates([u"intro"], now), [])
+
+        now += CANDIDATE_STUMBLE_LIFETIME
+        self.assertEqual(store.get_candidates([u"stumble"], now), [])
+        self.assertEqual(store.get_candidates([None], now), candidates[:2])
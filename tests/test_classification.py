@@ -171,3 +171,30 @@ class TestClassification(DispersyTestFunc):
 
     def test_enable_disable_autoload(self):
         self.test_enable_autoload(False)
+
+    @call_on_reactor_thread
+    def test_unknown_community_cache(self):
+        """
+        Unknown community ids are cached until a classification is defined.
+        """
+        class ClassTestUnknown(DebugCommunity):
+            pass
+
+        master = self._dispersy.get_new_member(u"high")
+        statistics = self._dispersy.statistics
+        misses = statistics.community_cache_misses
+        unknown_hits = statistics.unknown_community_cache_hits
+
+        # only the first lookup queries the database
+        for _ in xrange(2):
+            self.assertRaises(CommunityNotFoundException, self._dispersy.get_community, master.mid)
+        self.assertEqual(statistics.community_cache_misses, misses + 1)
+        self.assertEqual(statistics.unknown_community_cache_hits, unknown_hits + 1)
+
+        # defining a classification invalidates the unknown community ids
+        self._dispersy.database.execute(u"INSERT INTO community (master, member, classification, auto_load) VALUES (?, ?, ?, 1)",
+                                        (master.database_id, self._mm.my_member.database_id, ClassTestUnknown.get_classification()))
+        self._dispersy.define_auto_load(ClassTestUnknown, self._mm.my_member)
+        community = self._dispersy.get_community(master.mid)
+        self.assertIsInstance(community, ClassTestUnknown)
+        self.assertEqual(statistics.community_cache_misses, misses + 2)
@@ -0,0 +1,184 @@
+import os
+import shutil
+from tempfile import mkdtemp
+from threading import Event
+
+from twisted.internet import reactor
+from twisted.internet.defer import gatherResults, inlineCallbacks, returnValue
+
+from ..database import ThreadDatabaseExecutor
+from ..dispersydatabase import DispersyDatabase, LATEST_VERSION
+from ..util import blockingCallFromThread
+from .dispersytestclass import DispersyTestFunc
+
+
+class TestDatabase(DispersyTestFunc):
+
+    def setUp(self):
+        self.dispersy_objects = []
+
+    @inlineCallbacks
+    def _execute_async(self, executor):
+        database = DispersyDatabase(u":memory:", executor)
+        database.open()
+        try:
+            rows = yield database.execute_async(u"SELECT value FROM option WHERE key = ?", (u"database_version",))
+
+            yield database.executemany_async(u"INSERT INTO option (key, value) VALUES (?, ?)",
+                                             [(u"test-%d" % i, i) for i in xrange(10)])
+            count = yield database.execute_async(u"SELECT COUNT(*) FROM option WHERE key LIKE 'test-%'",
+                                                 fetch=lambda cursor: cursor.next()[0])
+
+            # the synchronous calls must see the same data
+            sync_count, = database.execute(u"SELECT COUNT(*) FROM option WHERE key LIKE 'test-%'").next()
+
+        finally:
+            database.close()
+
+        returnValue((rows, count, sync_count))
+
+    def test_execute_async(self):
+        """
+        The default executor runs the queries on the calling thread.
+        """
+        rows, count, sync_count = blockingCallFromThread(reactor, self._execute_async, None)
+        self.assertEqual([(unicode(row[0]),) for row in rows], [(unicode(LATEST_VERSION),)])
+        self.assertEqual(count, 10)
+        self.assertEqual(sync_count, 10)
+
+    def test_execute_async_thread(self):
+        """
+        The ThreadDatabaseExecutor runs the queries on a worker thread.
+        """
+        rows, count, sync_count = blockingCallFromThread(reactor, self._execute_async, ThreadDatabaseExecutor())
+        self.assertEqual([(unicode(row[0]),) for row in rows], [(unicode(LATEST_VERSION),)])
+        self.assertEqual(count, 10)
+        self.assertEqual(sync_count, 10)
+
+    @inlineCallbacks
+    def _execute_async_read_only(self, file_path):
+        database = DispersyDatabase(file_path, read_connections=2)
+        database.open()
+        try:
+            database.executemany(u"INSERT INTO option (key, value) VALUES (?, ?)",
+                                 [(u"test-%d" % i, i) for i in xrange(10)])
+            database.commit()
+
+            counts = yield gatherResults([database.execute_async(u"SELECT COUNT(*) FROM option WHERE key LIKE 'test-%'",
+                                                                 fetch=lambda cursor: cursor.next()[0],
+                                                                 read_only=True)
+                                          for _ in xrange(4)])
+        finally:
+            database.close()
+
+        returnValue(counts)
+
+    def test_execute_async_read_only(self):
+        """
+        The read-only queries run on the read connections and see the committed data.
+        """
+        directory = mkdtemp(suffix="_dispersy_test_database")
+        try:
+            counts = blockingCallFromThread(reactor, self._execute_async_read_only,
+                                            unicode(os.path.join(directory, "dispersy.db")))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.assertEqual(counts, [10, 10, 10, 10])
+
+    @inlineCallbacks
+    def _execute_async_executor_connection(self, file_path):
+        database = DispersyDatabase(file_path, ThreadDatabaseExecutor())
+        database.open()
+        try:
+            # not committed yet
+            database.executemany(u"INSERT INTO option (key, value) VALUES (?, ?)",
+                                 [(u"test-%d" % i, i) for i in xrange(10)])
+
+            started = Event()
+            released = Event()
+
+            def fetch(cursor):
+                started.set()
+                # returns False when the synchronous call below did not finish in time
+                return cursor.next()[0], released.wait(5.0)
+
+            deferred = database.execute_async(u"SELECT COUNT(*) FROM option WHERE key LIKE 'test-%'", fetch=fetch)
+            started.wait(5.0)
+            # the synchronous calls must not wait for the running query
+            sync_count, = database.execute(u"SELECT COUNT(*) FROM option WHERE key LIKE 'test-%'").next()
+            released.set()
+            count, not_blocked = yield deferred
+
+        finally:
+            database.close()
+
+        returnValue((count, sync_count, not_blocked))
+
+    def test_execute_async_executor_connection(self):
+        """
+        The ThreadDatabaseExecutor runs the queries on its own connection, the synchronous calls are not blocked by a
+        running query and the query sees the changes that were made before it was started.
+        """
+        directory = mkdtemp(suffix="_dispersy_test_database")
+        try:
+            count, sync_count, not_blocked = blockingCallFromThread(reactor, self._execute_async_executor_connection,
+                                                                    unicode(os.path.join(directory, "dispersy.db")))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.assertEqual(count, 10)
+        self.assertEqual(sync_count, 10)
+        self.assertTrue(not_blocked)
+
+    def test_execute_in_pairs(self):
+        """
+        execute_in_pairs must select all pairs, also when they do not fit in a single statement.
+        """
+        database = DispersyDatabase(u":memory:")
+        database.open()
+        try:
+            database.execute(u"CREATE TABLE pairs (first INTEGER, second INTEGER)")
+            database.executemany(u"INSERT INTO pairs (first, second) VALUES (?, ?)",
+                                 [(first, second) for first in xrange(100) for second in xrange(20)])
+
+            pairs = set((first, second) for first in xrange(100) for second in xrange(20) if (first + second) % 2 == 0)
+            rows = database.execute_in_pairs(u"SELECT first, second FROM pairs WHERE first IN (%s) AND second IN (%s)",
+                                             (), pairs)
+        finally:
+            database.close()
+
+        self.assertEqual(set(row for row in rows if row in pairs), pairs)
+
+    def test_execute_in_async(self):
+        """
+        execute_in_async must select all values, also when they do not fit in a single statement.
+        """
+        database = DispersyDatabase(u":memory:")
+        database.open()
+        try:
+            database.execute(u"CREATE TABLE values_ (value INTEGER)")
+            database.executemany(u"INSERT INTO values_ (value) VALUES (?)", [(value,) for value in xrange(3000)])
+
+            results = []
+            database.execute_in_async(u"SELECT value FROM values_ WHERE value > ? AND value IN (%s)", (0,),
+                                      xrange(0, 3000, 2),
+                                      fetch=lambda cursor: [value for value, in cursor]).addCallback(results.append)
+        finally:
+            database.close()
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(sorted(results[0]), range(2, 3000, 2))
+
+    def test_executemany_lastrowid(self):
+        """
+        executemany_lastrowid returns the rowid of the last inserted row.
+        """
+        database = DispersyDatabase(u":memory:")
+        database.open()
+        try:
+            database.execute(u"CREATE TABLE rows (id INTEGER PRIMARY KEY AUTOINCREMENT, value INTEGER)")
+            self.assertEqual(database.executemany_lastrowid(u"INSERT INTO rows (value) VALUES (?)",
+                                                            [(value,) for value in xrange(10)]), 10)
+            self.assertEqual(database.executemany_lastrowid(u"INSERT INTO rows (value) VALUES (?)",
+                                                            [(value,) for value in xrange(5)]), 15)
+        finally:
+            database.close()
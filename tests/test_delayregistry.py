@@ -0,0 +1,46 @@
+from ..delayregistry import DelayRegistry, DELAY_TIMEOUT
+from ..message import DelayPacketByMissingMember, DelayPacketByMissingMessage
+from .dispersytestclass import DispersyTestFunc
+
+
+class TestDelayRegistry(DispersyTestFunc):
+
+    def test_resume(self):
+        """
+        Delays are resumed by received messages that match their keys, wildcards match anything.
+        """
+        member = self._mm.my_member
+        registry = DelayRegistry()
+        missing_message = DelayPacketByMissingMessage(self._community, member, 10)
+        other_missing_message = DelayPacketByMissingMessage(self._community, member, 10)
+        missing_member = DelayPacketByMissingMember(self._community, member.mid)
+
+        # only the first delay for a key requires a request
+        self.assertTrue(registry.add((None, member.mid, 10, None), missing_message))
+        self.assertFalse(registry.add((None, member.mid, 10, None), other_missing_message))
+        self.assertTrue(registry.add((u"dispersy-identity", member.mid, None, None), missing_member))
+        self.assertEqual(len(registry), 3)
+        self.assertEqual(registry.get_counts(), {u"DelayPacketByMissingMessage": 2, u"DelayPacketByMissingMember": 1})
+
+        self.assertEqual(registry.resume((u"full-sync-text", member.mid, 11, 1)), [])
+        self.assertEqual(registry.resume((u"full-sync-text", member.mid, 10, 1)),
+                         [missing_message, other_missing_message])
+        self.assertEqual(registry.resume((u"dispersy-identity", member.mid, 5, None)), [missing_member])
+        self.assertEqual(len(registry), 0)
+        self.assertEqual(registry.get_counts(), {})
+
+    def test_expire(self):
+        """
+        Delays expire once their timeout has passed, unless they were resumed.
+        """
+        member = self._mm.my_member
+        registry = DelayRegistry()
+        resumed = DelayPacketByMissingMessage(self._community, member, 10)
+        expired = DelayPacketByMissingMessage(self._community, member, 11)
+        registry.add((None, member.mid, 10, None), resumed)
+        registry.add((None, member.mid, 11, None), expired)
+        self.assertEqual(registry.resume((u"full-sync-text", member.mid, 10, None)), [resumed])
+
+        self.assertEqual(registry.expire(expired.timestamp), [])
+        self.assertEqual(registry.expire(expired.timestamp + DELAY_TIMEOUT + 1.0), [expired])
+        self.assertEqual(len(registry), 0)
@@ -0,0 +1,94 @@
+from .dispersytestclass import DispersyTestFunc
+from .test_syncindex import DelayedDatabaseExecutor
+
+
+class TestDuplicateFilter(DispersyTestFunc):
+
+    def _is_duplicate(self, node, message, packet=None):
+        duplicate_filter = node._community.duplicate_filter
+        return node.call(duplicate_filter.is_duplicate, message.database_id, message.authentication.member.database_id,
+                         message.distribution.global_time, packet or message.packet)
+
+    def test_store_and_undo(self):
+        """
+        Stored messages are added to the filter, undone messages are removed from it.
+        """
+        node, = self.create_nodes(1)
+        messages = [node.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(10)]
+        node.give_messages(messages[:5], node)
+
+        # the filter is loaded when it is first used, i.e. all five messages are loaded from the database
+        self._is_duplicate(node, messages[0])
+        self.assertTrue(node._community.duplicate_filter.is_loaded)
+        self.assertTrue(all(self._is_duplicate(node, message) for message in messages[:5]))
+        self.assertFalse(any(self._is_duplicate(node, message) for message in messages[5:]))
+
+        node.give_messages(messages[5:], node)
+        self.assertTrue(all(self._is_duplicate(node, message) for message in messages))
+
+        # a packet with a different signature is not a duplicate
+        packet = messages[0].packet
+        self.assertFalse(self._is_duplicate(node, messages[0], packet[:-1] + chr((ord(packet[-1]) + 1) % 256)))
+
+        undoes = [node.create_undo_own(message, i + 100, i + 1) for i, message in enumerate(messages[:3])]
+        node.give_messages(undoes, node)
+        node.assert_is_undone(messages=messages[:3])
+        self.assertFalse(any(self._is_duplicate(node, message) for message in messages[:3]))
+        self.assertTrue(all(self._is_duplicate(node, message) for message in messages[3:]))
+
+    def test_drop_before_verification(self):
+        """
+        NODE sends the same message to OTHER twice.
+        OTHER should drop the second packet without verifying its signature
+        """
+        node, other = self.create_nodes(2)
+        other.send_identity(node)
+
+        message = node.create_full_sync_text("Should verify once", 10)
+        packet = node.encode_message(message)
+
+        other.give_packet(packet, node)
+        statistics = other._dispersy.statistics
+        lookups = statistics.verified_signature_cache_hits + statistics.verified_signature_cache_misses
+
+        other.give_packet(packet, node)
+        self.assertEqual(statistics.verified_signature_cache_hits + statistics.verified_signature_cache_misses, lookups)
+        self.assertEqual(len(other.fetch_messages([u"full-sync-text", ])), 1)
+
+    def test_load_async_modifications(self):
+        """
+        Messages that are stored or undone while the filter is loading are applied to the loaded rows.
+        """
+        node, = self.create_nodes(1)
+        messages = [node.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(10)]
+        node.give_messages(messages[:5], node)
+
+        duplicate_filter = node._community.duplicate_filter
+        database = node._dispersy.database
+        executor = DelayedDatabaseExecutor()
+
+        def start_load():
+            duplicate_filter.invalidate()
+            database._executor, original_executor = executor, database._executor
+            try:
+                duplicate_filter.load_async()
+            finally:
+                database._executor = original_executor
+            self.assertFalse(duplicate_filter.is_loaded)
+
+        # the loaded rows only contain MESSAGES[:5]
+        node.call(start_load)
+        node.give_messages(messages[5:], node)
+        node.give_message(node.create_undo_own(messages[0], 100, 1), node)
+        node.assert_is_undone(messages=messages[:1])
+
+        node.call(executor.fire)
+        self.assertTrue(duplicate_filter.is_loaded)
+        self.assertFalse(self._is_duplicate(node, messages[0]))
+        self.assertTrue(all(self._is_duplicate(node, message) for message in messages[1:]))
+
+        # invalidating the filter while loading discards the loaded rows
+        node.call(start_load)
+        node.call(duplicate_filter.invalidate)
+        node.call(executor.fire)
+        self.assertFalse(duplicate_filter.is_loaded)
@@ -0,0 +1,122 @@
+import socket
+from threading import Event
+
+from twisted.internet import reactor
+
+from ..candidate import Candidate
+from ..endpoint import EpollEndpoint, StandaloneEndpoint, TwistedEndpoint, epoll
+from ..util import blockingCallFromThread
+from .dispersytestclass import DispersyTestFunc
+
+
+class InterceptingEndpoint(StandaloneEndpoint):
+
+    _intercepts_send_packet = True
+
+    def __init__(self, *args, **kargs):
+        super(InterceptingEndpoint, self).__init__(*args, **kargs)
+        self.intercepted = []
+
+    def send_packet(self, candidate, packet, prefix=None):
+        self.intercepted.append((candidate, packet))
+        return True
+
+
+class TestEndpoint(DispersyTestFunc):
+
+    def _round_trip(self, endpoint_class, **kargs):
+        """
+        SENDER sends packets to RECEIVER, both ENDPOINT_CLASS instances using the loopback interface.  The packets are
+        received by the listen_to handler of RECEIVER.
+        """
+        receiver = endpoint_class(0, "127.0.0.1", **kargs)
+        sender = endpoint_class(0, "127.0.0.1", **kargs)
+        received = []
+        done = Event()
+        packets = ["test-packet %d" % i for i in xrange(10)]
+
+        def handler(sock_addr, data):
+            received.append((sock_addr, data))
+            if len(received) == len(packets):
+                done.set()
+
+        def open_endpoints():
+            receiver.open(self._dispersy)
+            sender.open(self._dispersy)
+            receiver.listen_to("test-", handler)
+
+        def send():
+            candidate = Candidate(receiver.get_address(), False)
+            return sender.send([candidate], packets[:5]) and all(sender.send_packet(candidate, packet)
+                                                                 for packet in packets[5:])
+
+        blockingCallFromThread(reactor, open_endpoints)
+        sender_address = sender.get_address()
+        try:
+            self.assertTrue(blockingCallFromThread(reactor, send))
+            done.wait(5.0)
+        finally:
+            blockingCallFromThread(reactor, receiver.close)
+            blockingCallFromThread(reactor, sender.close)
+
+        self.assertEqual([data for _, data in received], [packet[len("test-"):] for packet in packets])
+        self.assertTrue(all(sock_addr == sender_address for sock_addr, _ in received))
+
+    def test_epoll_round_trip(self):
+        """
+        Packets sent by an EpollEndpoint are received by another EpollEndpoint.
+        """
+        if not epoll:
+            self.skipTest("select.epoll is not available")
+        self._round_trip(EpollEndpoint, batch_size=4)
+
+    def test_twisted_round_trip(self):
+        """
+        Packets sent by a TwistedEndpoint are received by another TwistedEndpoint.
+        """
+        self._round_trip(TwistedEndpoint)
+
+    def test_epoll_empty_datagram(self):
+        """
+        An empty datagram does not end the batch, the packets that follow it are received in the same batch.
+        """
+        if not epoll:
+            self.skipTest("select.epoll is not available")
+        endpoint = EpollEndpoint(0, "127.0.0.1")
+        endpoint._dispersy = self._dispersy
+        endpoint._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        endpoint._socket.bind(("127.0.0.1", 0))
+        endpoint._socket.setblocking(0)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        received = []
+        endpoint.listen_to("test-", lambda sock_addr, data: received.append(data))
+
+        try:
+            for packet in ("test-a", "", "test-b"):
+                sender.sendto(packet, endpoint._socket.getsockname())
+            endpoint._receive_batch(endpoint._socket.recvfrom_into, memoryview(bytearray(65535)))
+        finally:
+            sender.close()
+            endpoint._socket.close()
+
+        self.assertEqual(received, ["a", "b"])
+
+    def test_twisted_open_failure(self):
+        """
+        A TwistedEndpoint that can not listen on any port raises a RuntimeError.
+        """
+        # 192.0.2.1 is reserved for documentation, hence it is not the address of a local interface
+        endpoint = TwistedEndpoint(0, "192.0.2.1")
+        self.assertRaises(RuntimeError, blockingCallFromThread, reactor, endpoint.open, self._dispersy)
+
+    def test_send_packet_hook(self):
+        """
+        Every packet given to send goes through send_packet when a subclass intercepts it.
+        """
+        endpoint = InterceptingEndpoint(0, "127.0.0.1")
+        endpoint._dispersy = self._dispersy
+        candidates = [Candidate(("127.0.0.1", port), False) for port in (1, 2)]
+        packets = ["packet 1", "packet 2"]
+
+        self.assertTrue(endpoint.send(candidates, packets))
+        self.assertEqual(endpoint.intercepted, [(candidate, packet) for candidate in candidates for packet in packets])
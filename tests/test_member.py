@@ -1,4 +1,7 @@
+from hashlib import sha1
+
 from .dispersytestclass import DispersyTestFunc
+from ..member import DummyMember, Member
 from ..util import call_on_reactor_thread
 
 
@@ -68,6 +71,10 @@ class TestMember(DispersyTestFunc):
         self.assertFalse(member.verify("0123456789", self._dispersy.crypto.create_signature(ec, "12345678"), offset=1, length=666))
         self.assertFalse(member.verify("0123456789E", self._dispersy.crypto.create_signature(ec, "12345678"), offset=1, length=666))
 
+        # sign "0123456789"[1:9] and verify it using a buffer
+        self.assertTrue(member.verify(buffer("0123456789", 1, 8), self._dispersy.crypto.create_signature(ec, "12345678")))
+        self.assertTrue(member.verify(buffer("0123456789"), self._dispersy.crypto.create_signature(ec, "12345678"), offset=1, length=8))
+        self.assertFalse(member.verify(buffer("0123456789", 1), self._dispersy.crypto.create_signature(ec, "12345678")))
 
     def test_sign(self):
         self._test_sign(u"medium")
@@ -132,3 +139,45 @@ class TestMember(DispersyTestFunc):
         self.assertFalse(self._dispersy.crypto.is_valid_signature(ec, "12345678", member.sign("0123456789E", offset=1, length=9)))
         with self.assertRaises(ValueError): self._dispersy.crypto.is_valid_signature(ec, "12345678", member.sign("0123456789", offset=1, length=666))
         with self.assertRaises(ValueError): self._dispersy.crypto.is_valid_signature(ec, "12345678", member.sign("0123456789E", offset=1, length=666))
+
+    @call_on_reactor_thread
+    def test_member_cache(self):
+        """
+        Members are evicted in least recently used order.
+        """
+        self._dispersy._member_cache_size = 2
+        self._dispersy._member_cache_by_hash.clear()
+        first = self._dispersy.get_new_member(u"very-low")
+        key = self._dispersy.crypto.generate_key(u"very-low")
+        second = self._dispersy.get_member(public_key=self._dispersy.crypto.key_to_bin(key.pub()))
+
+        # using FIRST makes SECOND the least recently used member
+        self.assertIs(self._dispersy.get_member(mid=first.mid), first)
+        self._dispersy.get_new_member(u"very-low")
+        self.assertIn(first.mid, self._dispersy._member_cache_by_hash)
+        self.assertNotIn(second.mid, self._dispersy._member_cache_by_hash)
+
+        # SECOND is loaded from the database, its public key is not parsed again
+        hits = self._dispersy.statistics.public_key_cache_hits
+        self.assertEqual(self._dispersy.get_member(mid=second.mid), second)
+        self.assertEqual(self._dispersy.statistics.public_key_cache_hits, hits + 1)
+
+    @call_on_reactor_thread
+    def test_dummy_member_cache(self):
+        """
+        A member whose public key is unknown is cached until its public key is given.
+        """
+        key = self._dispersy.crypto.generate_key(u"very-low")
+        public_key = self._dispersy.crypto.key_to_bin(key.pub())
+        mid = sha1(public_key).digest()
+
+        dummy = self._dispersy.get_member(mid=mid)
+        self.assertIs(type(dummy), DummyMember)
+        hits = self._dispersy.statistics.dummy_member_cache_hits
+        self.assertIs(self._dispersy.get_member(mid=mid), dummy)
+        self.assertEqual(self._dispersy.statistics.dummy_member_cache_hits, hits + 1)
+
+        member = self._dispersy.get_member(public_key=public_key)
+        self.assertIsInstance(member, Member)
+        self.assertEqual(member.database_id, dummy.database_id)
+        self.assertIs(self._dispersy.get_member(mid=mid), member)
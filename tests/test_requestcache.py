@@ -1,4 +1,7 @@
+from twisted.internet.task import Clock
+
 from ..requestcache import RequestCache, NumberCache, RandomNumberCache
+from ..timerwheel import TimerWheel
 from ..util import blocking_call_on_reactor_thread
 from .dispersytestclass import DispersyTestFunc
 
@@ -94,3 +97,30 @@ class TestRequestCache(DispersyTestFunc):
 
         # request_cache is not bound to any Community so we need to clean up ourselves
         request_cache.clear()
+
+    @blocking_call_on_reactor_thread
+    def test_timeout(self):
+        """
+        Caches time out once, unless they are popped before.
+        """
+        class TimeoutCache(NumberCache):
+
+            def __init__(self, request_cache, number):
+                super(TimeoutCache, self).__init__(request_cache, u"test", number)
+                self.timeouts = 0
+
+            def on_timeout(self):
+                self.timeouts += 1
+
+        clock = Clock()
+        request_cache = RequestCache(TimerWheel(clock=clock))
+        expired = request_cache.add(TimeoutCache(request_cache, 1))
+        popped = request_cache.add(TimeoutCache(request_cache, 2))
+        self.assertEqual(request_cache.pop(u"test", 2), popped)
+
+        clock.advance(expired.timeout_delay - 0.5)
+        self.assertTrue(request_cache.has(u"test", 1))
+        clock.advance(1.0)
+        self.assertFalse(request_cache.has(u"test", 1))
+        clock.advance(expired.timeout_delay)
+        self.assertEqual((expired.timeouts, popped.timeouts), (1, 0))
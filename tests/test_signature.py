@@ -47,3 +47,27 @@ class TestSignature(DispersyTestFunc):
         other.give_packet(invalid_packet, node)
 
         self.assertEqual(other.fetch_messages([u"full-sync-text", ]), [])
+
+    def test_verified_signature_cache(self):
+        """
+        OTHER converts the same packet twice, and an invalid packet twice.
+        OTHER should verify the valid packet once and never cache the invalid one
+        """
+        node, other = self.create_nodes(2)
+        other.send_identity(node)
+
+        message = node.create_full_sync_text('Should verify once')
+        packet = node.encode_message(message)
+        invalid_packet = packet[:-node.my_member.signature_length] + 'I' * node.my_member.signature_length
+
+        statistics = other._dispersy.statistics
+        hits = statistics.verified_signature_cache_hits
+
+        convert = lambda packet: other.call(other._dispersy.convert_packet_to_message, packet, other._community)
+        self.assertIsNotNone(convert(packet))
+        self.assertIsNotNone(convert(packet))
+        self.assertEqual(statistics.verified_signature_cache_hits, hits + 1)
+
+        self.assertIsNone(convert(invalid_packet))
+        self.assertIsNone(convert(invalid_packet))
+        self.assertEqual(statistics.verified_signature_cache_hits, hits + 1)
@@ -0,0 +1,102 @@
+from twisted.internet import reactor
+
+from ..conversion import Conversion
+from ..signingservice import SigningService
+from ..util import blockingCallFromThread
+from .dispersytestclass import DispersyTestFunc
+
+
+class TestSigningService(DispersyTestFunc):
+
+    def _sign(self, workers, processes=True, batch_window=0.0, signer=None):
+        """
+        Signs ten unsigned full-sync-text messages and returns them.
+        """
+        meta = self._community.get_meta_message(u"full-sync-text")
+        member = self._mm.my_member
+
+        def sign():
+            messages = [meta.impl(authentication=(member,),
+                                  distribution=(10 + i,),
+                                  payload=("Message %d" % i,),
+                                  empty_signature=True)
+                        for i in xrange(10)]
+            for message in messages:
+                self.assertTrue(message.packet.endswith(message.authentication.empty_signature))
+            return service.sign(messages)
+
+        service = SigningService(self._dispersy.crypto, workers, processes, batch_window)
+        if signer:
+            service._signer = signer
+        service.start()
+        try:
+            messages = blockingCallFromThread(reactor, sign)
+        finally:
+            service.stop()
+
+        for message in messages:
+            self.assertTrue(message.authentication.is_signed())
+            self.assertTrue(member.verify(message.packet[:-member.signature_length],
+                                          message.packet[-member.signature_length:]))
+        return messages
+
+    def test_sign_reactor_thread(self):
+        """
+        Without workers the messages are signed on the reactor thread.
+        """
+        self.assertEqual(len(self._sign(0)), 10)
+
+    def test_sign_batch_window(self):
+        """
+        Messages are signed once the batch window has passed.
+        """
+        self.assertEqual(len(self._sign(0, batch_window=0.01)), 10)
+
+    def test_sign_threads(self):
+        """
+        The worker threads must sign all messages.
+        """
+        self.assertEqual(len(self._sign(2, False)), 10)
+
+    def test_sign_processes(self):
+        """
+        The worker processes must sign all messages.
+        """
+        self.assertEqual(len(self._sign(2, True)), 10)
+
+    def test_sign_failure(self):
+        """
+        When the workers fail the messages are signed on the reactor thread.
+        """
+        def signer(task):
+            raise RuntimeError("signer failure")
+        self.assertEqual(len(self._sign(2, False, signer=signer)), 10)
+
+    def test_sign_flag(self):
+        """
+        Messages are signed when they are created, unless empty_signature is True.
+        """
+        meta = self._community.get_meta_message(u"full-sync-text")
+        member = self._mm.my_member
+
+        def create(**kargs):
+            return meta.impl(authentication=(member,), distribution=(10,), payload=("Message",), **kargs)
+
+        self.assertTrue(blockingCallFromThread(reactor, create, sign=False).authentication.is_signed())
+        self.assertFalse(blockingCallFromThread(reactor, create, empty_signature=True).authentication.is_signed())
+
+    def test_default_encode_unsigned_message(self):
+        """
+        The default Conversion.encode_unsigned_message, used by conversions that do not provide their own, must
+        return the same string as the binary conversion.
+        """
+        meta = self._community.get_meta_message(u"full-sync-text")
+        member = self._mm.my_member
+
+        def encode():
+            message = meta.impl(authentication=(member,), distribution=(10,), payload=("Message",))
+            conversion = self._community.get_conversion_for_message(message)
+            return Conversion.encode_unsigned_message(conversion, message), conversion.encode_unsigned_message(message)
+
+        default, binary = blockingCallFromThread(reactor, encode)
+        self.assertEqual(default, binary)
@@ -1,6 +1,21 @@
+from ..bloomfilter import get_key_digest
+from ..community import SYNC_RESPONSE_CHUNK_SIZE
+from .debugcommunity.community import DebugCommunity
 from .dispersytestclass import DispersyTestFunc
 
 
+class ChunkDebugCommunity(DebugCommunity):
+
+    def __init__(self, *args, **kargs):
+        super(ChunkDebugCommunity, self).__init__(*args, **kargs)
+        # the chunks of packets that were given to _send_sync_response
+        self.sync_response_chunks = []
+
+    def _send_sync_response(self, packets, message):
+        self.sync_response_chunks.append(list(packets))
+        super(ChunkDebugCommunity, self)._send_sync_response(packets, message)
+
+
 class TestSync(DispersyTestFunc):
 
     def _create_nodes_messages(self, messagetype="create_full_sync_text"):
@@ -51,6 +66,29 @@ class TestSync(DispersyTestFunc):
                 self.assertEqual(sorted(global_times), sorted(response_times))
 
 
+    def test_digest_bloom_filter(self):
+        """
+        By default the bloom filters contain packet digests, the packets that NODE has in its bloom filter may not be
+        sent back.
+        """
+        node, other = self.create_nodes(2)
+        other.send_identity(node)
+
+        messages = [other.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(30)]
+        other.store(messages)
+
+        # NODE already has the even messages
+        bloom_keys = [get_key_digest(message.packet) for message in messages[::2]]
+        global_times = [message.distribution.global_time for message in messages[1::2]]
+
+        sync = (1, 0, 1, 0, bloom_keys)
+        other.give_message(node.create_introduction_request(other.my_candidate, node.lan_address, node.wan_address, False, u"unknown", sync, 42), node)
+
+        responses = node.receive_messages(names=[u"full-sync-text"], return_after=len(global_times))
+        response_times = [message.distribution.global_time for _, message in responses]
+
+        self.assertEqual(sorted(global_times), sorted(response_times))
+
     def test_in_order(self):
         node, other, messages = self._create_nodes_messages('create_in_order_text')
         global_times = [message.distribution.global_time for message in messages]
@@ -345,3 +383,30 @@ class TestSync(DispersyTestFunc):
         create_double_signed_message(nodeC, nodeA, "Allow=True (2CA)", old_global_time)
 
         check_database_contents()
+
+    def test_chunked_sync_response(self):
+        """
+        OTHER sends the sync response in chunks of SYNC_RESPONSE_CHUNK_SIZE packets and stops once
+        dispersy_sync_response_limit bytes have been sent.
+        """
+        node, other = self.create_nodes(2, community_class=ChunkDebugCommunity)
+        other.send_identity(node)
+
+        messages = [other.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(100)]
+        other.store(messages)
+
+        sync = (1, 0, 1, 0, [])
+        other.give_message(node.create_introduction_request(other.my_candidate, node.lan_address, node.wan_address, False, u"unknown", sync, 42), node)
+
+        responses = node.receive_messages(names=[u"full-sync-text"])
+        chunks = other._community.sync_response_chunks
+        packets = [packet for chunk in chunks for packet in chunk]
+        self.assertEqual(sorted(message.packet for _, message in responses), sorted(packets))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) == SYNC_RESPONSE_CHUNK_SIZE for chunk in chunks[:-1]))
+        self.assertLessEqual(len(chunks[-1]), SYNC_RESPONSE_CHUNK_SIZE)
+        # the limit is exceeded by at most the last packet
+        limit = other._community.dispersy_sync_response_limit
+        self.assertLess(sum(len(packet) for packet in packets[:-1]), limit)
+        self.assertGreaterEqual(sum(len(packet) for packet in packets), limit)
@@ -0,0 +1,229 @@
+from twisted.internet.defer import Deferred
+
+from ..bloomfilter import BloomFilter, get_key_digest
+from ..database import DatabaseExecutor
+from ..requestcache import IntroductionRequestCache
+from .debugcommunity.community import DebugCommunity
+from .dispersytestclass import DispersyTestFunc
+
+
+class SyncIndexPacketDebugCommunity(DebugCommunity):
+
+    # the bloom filters contain the packets, the index selects them from the database
+    @property
+    def dispersy_sync_bloom_filter_digest(self):
+        return False
+
+    @property
+    def dispersy_sync_index_enable(self):
+        return True
+
+
+class PacketDebugCommunity(DebugCommunity):
+
+    @property
+    def dispersy_sync_bloom_filter_digest(self):
+        return False
+
+
+class ModuloPacketDebugCommunity(PacketDebugCommunity):
+
+    @property
+    def dispersy_sync_bloom_filter_strategy(self):
+        return self._dispersy_claim_sync_bloom_filter_modulo
+
+
+class DelayedDatabaseExecutor(DatabaseExecutor):
+
+    """
+    Runs the asynchronous database calls immediately but only fires the Deferreds when fire is called.
+    """
+
+    def __init__(self):
+        super(DelayedDatabaseExecutor, self).__init__()
+        self._delayed = []
+
+    def run(self, func, *args, **kargs):
+        deferred = Deferred()
+        self._delayed.append((deferred, func(*args, **kargs)))
+        return deferred
+
+    def fire(self):
+        delayed, self._delayed = self._delayed, []
+        for deferred, result in delayed:
+            deferred.callback(result)
+
+
+class TestSyncIndex(DispersyTestFunc):
+
+    def _select_from_database(self, node, global_time, limit, higher):
+        community = node._community
+        syncable_messages = u", ".join(unicode(meta_id) for meta_id in community.sync_index.get_syncable_meta_ids())
+        if higher:
+            rows = node._dispersy.database.execute(u"SELECT global_time, id FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time > ? ORDER BY global_time ASC LIMIT ?" % syncable_messages,
+                                                   (global_time, limit))
+        else:
+            rows = node._dispersy.database.execute(u"SELECT global_time, id FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time < ? ORDER BY global_time DESC LIMIT ?" % syncable_messages,
+                                                   (global_time, limit))
+        return list(rows)
+
+    def test_select(self):
+        """
+        NODE stores several messages, the index must select the same packets as the database.
+        """
+        node, = self.create_nodes(1)
+        messages = [node.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(50)]
+        node.give_messages(messages, node)
+
+        for global_time in (0, 10, 25, 59, 60, 100):
+            for limit in (1, 10, 100):
+                for higher in (True, False):
+                    self.assertEqual(node.call(node._community.sync_index.select, global_time, limit, higher),
+                                     node.call(self._select_from_database, node, global_time, limit, higher))
+
+    def test_fill_bloom_filter(self):
+        """
+        The bloom filter filled from the index (using cached buckets) must be identical to a bloom filter that is
+        filled by adding each packet.
+        """
+        self._check_fill_bloom_filter(SyncIndexPacketDebugCommunity, lambda packet: packet)
+
+    def test_fill_bloom_filter_digest(self):
+        """
+        The bloom filter filled from the digests in the index must be identical to a bloom filter that is filled by
+        adding each packet digest.
+        """
+        self._check_fill_bloom_filter(DebugCommunity, get_key_digest)
+
+    def _check_fill_bloom_filter(self, community_class, get_bloom_key):
+        node, = self.create_nodes(1, community_class=community_class)
+        messages = [node.create_full_sync_text("Message %d" % i, i * 7 + 1) for i in xrange(100)]
+        node.give_messages(messages, node)
+
+        def select_packets(time_low, time_high):
+            # besides MESSAGES the database contains the dispersy-authorize message of the master member
+            syncable_messages = u", ".join(unicode(meta_id) for meta_id in node._community.sync_index.get_syncable_meta_ids())
+            return [str(packet) for packet, in node._dispersy.database.execute(
+                u"SELECT packet FROM sync WHERE meta_message IN (%s) AND undone = 0 AND global_time BETWEEN ? AND ?" % syncable_messages,
+                (time_low, time_high))]
+
+        def fill(time_low, time_high):
+            bloom = BloomFilter(node._community.dispersy_sync_bloom_filter_bits, 0.01, prefix="a")
+            node._community.sync_index.fill_bloom_filter(bloom, time_low, time_high)
+            return bloom
+
+        for time_low, time_high in ((1, 700), (50, 300), (64, 127), (1, 1), (200, 199)):
+            expected = BloomFilter(node._community.dispersy_sync_bloom_filter_bits, 0.01, prefix="a")
+            expected.add_keys(get_bloom_key(packet) for packet in node.call(select_packets, time_low, time_high))
+
+            # the second fill uses the cached bucket filters
+            self.assertEqual(node.call(fill, time_low, time_high).bytes, expected.bytes)
+            self.assertEqual(node.call(fill, time_low, time_high).bytes, expected.bytes)
+
+    def test_store_and_undo(self):
+        """
+        Stored messages are added to the index, undone messages are removed from it.
+        """
+        node, = self.create_nodes(1)
+        messages = [node.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(10)]
+        node.give_messages(messages[:5], node)
+
+        # load the index and fill the bucket filters
+        self.assertEqual(node.call(node._community.sync_index.select, 0, 100, True),
+                         node.call(self._select_from_database, node, 0, 100, True))
+        node.call(node._community.sync_index.fill_bloom_filter, BloomFilter(512, 0.01), 1, 1000)
+
+        node.give_messages(messages[5:], node)
+        self.assertEqual(node.call(node._community.sync_index.select, 9, 100, True),
+                         node.call(self._select_from_database, node, 9, 100, True))
+
+        undoes = [node.create_undo_own(message, i + 100, i + 1) for i, message in enumerate(messages[:3])]
+        node.give_messages(undoes, node)
+        node.assert_is_undone(messages=messages[:3])
+        self.assertEqual(node.call(node._community.sync_index.select, 0, 100, True),
+                         node.call(self._select_from_database, node, 0, 100, True))
+
+    def test_enabled_by_default(self):
+        """
+        The index is enabled by default, since by default the bloom filters contain the packet digests.
+        """
+        self.assertTrue(self._community.dispersy_sync_bloom_filter_digest)
+        self.assertIsNotNone(self._community.sync_index)
+        node, = self.create_nodes(1, community_class=PacketDebugCommunity)
+        self.assertIsNone(node._community.sync_index)
+
+    def test_load_async_modifications(self):
+        """
+        Messages that are stored or undone while the index is loaded asynchronously must be applied to the loaded
+        index, unless the index is invalidated during the load.
+        """
+        node, = self.create_nodes(1)
+        messages = [node.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(10)]
+        node.give_messages(messages[:5], node)
+        sync_index = node._community.sync_index
+        database = node._dispersy.database
+        executor = DelayedDatabaseExecutor()
+
+        def start_load():
+            sync_index.invalidate()
+            database._executor, original_executor = executor, database._executor
+            try:
+                sync_index.load_async()
+            finally:
+                database._executor = original_executor
+            self.assertFalse(sync_index.is_loaded)
+
+        # the loaded rows only contain MESSAGES[:5]
+        node.call(start_load)
+        node.give_messages(messages[5:], node)
+        node.give_message(node.create_undo_own(messages[0], 100, 1), node)
+        node.assert_is_undone(messages=messages[:1])
+
+        node.call(executor.fire)
+        self.assertTrue(sync_index.is_loaded)
+        self.assertEqual(node.call(sync_index.select, 0, 100, True),
+                         node.call(self._select_from_database, node, 0, 100, True))
+
+        # invalidating the index while loading discards the loaded rows
+        node.call(start_load)
+        node.call(sync_index.invalidate)
+        node.call(executor.fire)
+        self.assertFalse(sync_index.is_loaded)
+
+    def test_claim_without_index(self):
+        """
+        Without an index the bloom filter is claimed using the database executor.  The claim returns None until the
+        queries have finished, the next claim returns the bloom filter.
+        """
+        self._check_claim_without_index(PacketDebugCommunity)
+
+    def test_claim_modulo_without_index(self):
+        """
+        Like test_claim_without_index, using the modulo strategy.
+        """
+        self._check_claim_without_index(ModuloPacketDebugCommunity)
+
+    def _check_claim_without_index(self, community_class):
+        node, = self.create_nodes(1, community_class=community_class)
+        messages = [node.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(10)]
+        node.give_messages(messages, node)
+
+        community = node._community
+        database = node._dispersy.database
+        executor = DelayedDatabaseExecutor()
+
+        def claim():
+            database._executor, original_executor = executor, database._executor
+            try:
+                return community.dispersy_claim_sync_bloom_filter(IntroductionRequestCache(community, None))
+            finally:
+                database._executor = original_executor
+
+        self.assertIsNone(node.call(claim))
+        # the queries of the previous claim are still running
+        self.assertIsNone(node.call(claim))
+
+        node.call(executor.fire)
+        time_low, time_high, modulo, offset, bloom_filter = node.call(claim)
+        self.assertEqual((modulo, offset), (1, 0))
+        self.assertEqual(list(bloom_filter.not_filter((message.packet,) for message in messages)), [])
@@ -0,0 +1,72 @@
+from ..bloomfilter import BloomFilter
+from ..syncresponsecache import SyncResponseCache, SYNC_RESPONSE_CACHE_INVALIDATIONS, SYNC_RESPONSE_CACHE_TIMEOUT
+from .dispersytestclass import DispersyTestFunc
+
+
+class TestSyncResponseCache(DispersyTestFunc):
+
+    def test_get_put(self):
+        """
+        A response is returned for the same request until it expires.
+        """
+        cache = SyncResponseCache()
+        bloom_filter = BloomFilter(512 * 8, 0.001, prefix="x")
+        bloom_filter.add("packet")
+        key = cache.get_key(bloom_filter, 1, 100, 0, 1)
+
+        self.assertIsNone(cache.get(key, 0.0))
+        cache.put(key, ["packet"], cache.generation, 0.0)
+        self.assertEqual(cache.get(key, 1.0), ["packet"])
+        self.assertIsNone(cache.get(cache.get_key(bloom_filter, 1, 101, 0, 1), 1.0))
+        self.assertIsNone(cache.get(key, SYNC_RESPONSE_CACHE_TIMEOUT + 1.0))
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(cache.hit_rate, 0.25)
+
+    def test_invalidate(self):
+        """
+        Invalidating removes the cached responses and prevents responses selected before from being cached.
+        """
+        cache = SyncResponseCache()
+        key = cache.get_key(BloomFilter(512 * 8, 0.001, prefix="x"), 1, 100, 0, 1)
+        cache.put(key, ["packet"], cache.generation, 0.0)
+
+        generation = cache.generation
+        cache.invalidate()
+        self.assertIsNone(cache.get(key, 1.0))
+
+        cache.put(key, ["packet"], generation, 1.0)
+        self.assertIsNone(cache.get(key, 1.0))
+        cache.put(key, ["packet"], cache.generation, 1.0)
+        self.assertEqual(cache.get(key, 1.0), ["packet"])
+
+    def test_invalidate_global_times(self):
+        """
+        Invalidating global times only removes the responses whose range contains one of them, and only prevents
+        those responses from being cached.
+        """
+        cache = SyncResponseCache()
+        bloom_filter = BloomFilter(512 * 8, 0.001, prefix="x")
+        bounded = cache.get_key(bloom_filter, 1, 100, 0, 1)
+        open_ended = cache.get_key(bloom_filter, 101, 0, 0, 1)
+        even = cache.get_key(bloom_filter, 1, 0, 0, 2)
+        odd = cache.get_key(bloom_filter, 1, 0, 1, 2)
+        for key in (bounded, open_ended, even, odd):
+            cache.put(key, ["packet"], cache.generation, 0.0)
+
+        generation = cache.generation
+        cache.invalidate([150])
+        self.assertEqual(cache.get(bounded, 1.0), ["packet"])
+        self.assertIsNone(cache.get(open_ended, 1.0))
+        self.assertIsNone(cache.get(even, 1.0))
+        self.assertEqual(cache.get(odd, 1.0), ["packet"])
+
+        cache.put(bounded, ["other"], generation, 1.0)
+        cache.put(open_ended, ["packet"], generation, 1.0)
+        self.assertEqual(cache.get(bounded, 1.0), ["other"])
+        self.assertIsNone(cache.get(open_ended, 1.0))
+
+        # the global times of older invalidations are forgotten
+        for global_time in xrange(SYNC_RESPONSE_CACHE_INVALIDATIONS):
+            cache.invalidate([global_time + 1000])
+        cache.put(bounded, ["packet"], generation, 1.0)
+        self.assertEqual(cache.get(bounded, 1.0), ["other"])
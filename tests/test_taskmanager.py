@@ -1,4 +1,5 @@
 from ..taskmanager import TaskManager
+from ..timerwheel import TimerWheel
 from .dispersytestclass import DispersyTestFunc
 from nose.tools import assert_raises
 from twisted.internet import reactor
@@ -74,6 +75,23 @@ class TaskManagerTestFunc(DispersyTestFunc):
         self.tm._reactor.advance(10)
         self.assertEquals(2, self.counter)
 
+    def test_timer_wheel_call(self):
+        wheel = TimerWheel(clock=self.tm._reactor)
+        self.tm.register_task("test", wheel.call_later(1.0, self.count))
+        self.assertTrue(self.tm.is_pending_task_active("test"))
+        self.tm._reactor.advance(1.0 + wheel.resolution)
+        self.assertEquals(1, self.counter)
+        self.assertFalse(self.tm.is_pending_task_active("test"))
+
+    def test_timer_wheel_call_and_cancel(self):
+        wheel = TimerWheel(clock=self.tm._reactor)
+        self.tm.register_task("test", wheel.call_later(1.0, self.count))
+        self.tm.cancel_pending_task("test")
+        self.assertFalse(self.tm.is_pending_task_active("test"))
+        self.tm._reactor.advance(10)
+        self.assertEquals(0, self.counter)
+        self.assertEquals(0, len(wheel))
+
     def test_delayed_deferred(self):
         self.assertFalse(self.tm.is_pending_task_active("test"))
         d = Deferred()
@@ -1,3 +1,9 @@
+from twisted.internet import reactor
+
+from ..message import Message
+from ..resolution import LinearResolution
+from ..timeline import Timeline
+from ..util import blockingCallFromThread
 from .dispersytestclass import DispersyTestFunc
 
 
@@ -91,3 +97,112 @@ class TestTimeline(DispersyTestFunc):
         permission_triplet = (self._mm.my_member.mid, u"protected-full-sync-text", u"permit")
         authorize_permission_triplets = [(triplet[0].mid, triplet[1].name, triplet[2]) for triplet in authorize.payload.permission_triplets]
         self.assertIn(permission_triplet, authorize_permission_triplets)
+
+    def test_permission_index(self):
+        """
+        Grants and revokes that are added out of order must be answered by the most recent change at or before the
+        checked global time.
+        """
+        node, = self.create_nodes(1)
+        meta = self._community.get_meta_message(u"protected-full-sync-text")
+        master = self._community.master_member
+        triplets = [(node.my_member, meta, u"permit")]
+
+        def check(timeline, global_time, permission=u"permit"):
+            return timeline._check(node.my_member, global_time, LinearResolution(), [(meta, permission)])[0]
+
+        timeline = Timeline(self._community)
+        self.assertTrue(timeline.authorize(master, 30, triplets, self._mm.create_authorize(triplets, 30))[0])
+        self.assertTrue(timeline.authorize(master, 10, triplets, self._mm.create_authorize(triplets, 10))[0])
+        self.assertTrue(timeline.revoke(master, 20, triplets, self._mm.create_revoke(triplets, 20))[0])
+
+        self.assertEqual([check(timeline, global_time) for global_time in (5, 10, 15, 20, 25, 30, 35)],
+                         [False, True, True, False, False, True, True])
+        self.assertFalse(check(timeline, 35, u"authorize"))
+
+    def _reload_community(self, lazy=False):
+        """
+        Unloads the community of the central node and loads it again.
+        """
+        def reload():
+            community = self._community
+            community.unload_community()
+            self._dispersy._lazy_community_initialization = lazy
+            return community.__class__.init_community(self._dispersy, community.master_member, community.my_member)
+        return blockingCallFromThread(reactor, reload)
+
+    def test_snapshot(self):
+        """
+        The timeline is restored from the snapshot when the community is loaded again, the proofs are loaded from the
+        database when they are needed.
+        """
+        node, = self.create_nodes(1)
+        meta = self._community.get_meta_message(u"protected-full-sync-text")
+        triplets = [(node.my_member, meta, u"permit")]
+        authorize = self._mm.create_authorize(triplets)
+        self._mm.give_message(authorize, self._mm)
+        self._mm.assert_is_stored(authorize)
+
+        community = self._reload_community()
+
+        def check():
+            member = self._dispersy.get_member(public_key=node.my_member.public_key)
+            sync_id, = self._dispersy.database.execute(u"SELECT sync_id FROM timeline_snapshot WHERE community = ?",
+                                                       (community.database_id,)).next()
+            self.assertEqual(sync_id, max(packet_id for packet_id, in self._dispersy.database.execute(
+                u"SELECT id FROM sync WHERE meta_message = ?",
+                (community.get_meta_message(u"dispersy-authorize").database_id,))))
+
+            # the proof is only a packet id until it is needed
+            _, values = community.timeline._permission_index[(member, u"permit", meta.name)]
+            self.assertTrue(all(isinstance(proof, (int, long)) for proof in values[-1][1]))
+
+            allowed, proofs = community.timeline._check(member, community.global_time, LinearResolution(),
+                                                        [(community.get_meta_message(meta.name), u"permit")])
+            self.assertTrue(allowed)
+            self.assertTrue(all(isinstance(proof, Message.Implementation) for proof in proofs))
+            self.assertIn(authorize.packet, [proof.packet for proof in proofs])
+        blockingCallFromThread(reactor, check)
+
+    def test_snapshot_missing_proof(self):
+        """
+        A check fails when none of its proofs can be loaded from the database, and the snapshot is discarded.
+        """
+        node, = self.create_nodes(1)
+        meta = self._community.get_meta_message(u"protected-full-sync-text")
+        self._mm.give_message(self._mm.create_authorize([(node.my_member, meta, u"permit")]), self._mm)
+
+        community = self._reload_community()
+
+        def check():
+            member = self._dispersy.get_member(public_key=node.my_member.public_key)
+            _, values = community.timeline._permission_index[(member, u"permit", meta.name)]
+            max_id, = self._dispersy.database.execute(u"SELECT MAX(id) FROM sync").next()
+            values[-1][1][:] = [max_id + 1]
+
+            allowed, _ = community.timeline._check(member, community.global_time, LinearResolution(),
+                                                   [(community.get_meta_message(meta.name), u"permit")])
+            self.assertFalse(allowed)
+            self.assertEqual(list(self._dispersy.database.execute(
+                u"SELECT sync_id FROM timeline_snapshot WHERE community = ?", (community.database_id,))), [])
+            self.assertIsNone(community._timeline_snapshot_id)
+        blockingCallFromThread(reactor, check)
+
+    def test_lazy_initialization(self):
+        """
+        A lazily initialized community replays its timeline when it is first used.
+        """
+        node, = self.create_nodes(1)
+        meta = self._community.get_meta_message(u"protected-full-sync-text")
+        triplets = [(node.my_member, meta, u"permit")]
+        self._mm.give_message(self._mm.create_authorize(triplets), self._mm)
+
+        community = self._reload_community(lazy=True)
+
+        def check():
+            member = self._dispersy.get_member(public_key=node.my_member.public_key)
+            self.assertIsNone(community._timeline)
+            self.assertTrue(community.timeline._check(member, community.global_time, LinearResolution(),
+                                                      [(community.get_meta_message(meta.name), u"permit")])[0])
+            self.assertIsNotNone(community.get_meta_message(u"dispersy-identity")._database_id)
+        blockingCallFromThread(reactor, check)
@@ -0,0 +1,66 @@
+from twisted.internet.task import Clock
+
+from ..timerwheel import TimerWheel
+from .dispersytestclass import DispersyTestFunc
+
+
+class TestTimerWheel(DispersyTestFunc):
+
+    def setUp(self):
+        super(TestTimerWheel, self).setUp()
+        self.clock = Clock()
+        self.wheel = TimerWheel(slots=8, resolution=0.1, clock=self.clock)
+        self.fired = []
+
+    def test_call_later(self):
+        """
+        Timers fire at the first tick at or after their deadline, in order.
+        """
+        self.wheel.call_later(0.25, self.fired.append, 2)
+        self.wheel.call_later(0.05, self.fired.append, 1)
+        self.assertEqual(len(self.wheel), 2)
+
+        self.clock.advance(0.2)
+        self.assertEqual(self.fired, [1])
+        self.clock.advance(0.15)
+        self.assertEqual(self.fired, [1, 2])
+        self.assertEqual(len(self.wheel), 0)
+        self.assertFalse(self.clock.getDelayedCalls())
+
+    def test_cancel(self):
+        """
+        Cancelled timers do not fire and the wheel stops ticking once no timers are pending.
+        """
+        call = self.wheel.call_later(0.5, self.fired.append, 1)
+        self.assertTrue(call.active())
+        call.cancel()
+        self.assertFalse(call.active())
+        self.assertFalse(self.clock.getDelayedCalls())
+
+        self.clock.advance(1.0)
+        self.assertEqual(self.fired, [])
+
+    def test_multiple_revolutions(self):
+        """
+        Timers further away than a single revolution fire at their own tick, also when ticks are skipped.
+        """
+        self.wheel.call_later(0.3, self.fired.append, 1)
+        self.wheel.call_later(2.3, self.fired.append, 2)
+
+        self.clock.advance(0.4)
+        self.assertEqual(self.fired, [1])
+        self.clock.advance(1.0)
+        self.assertEqual(self.fired, [1])
+        # skip many ticks at once, as a blocked reactor would
+        self.clock.pump([5.0])
+        self.assertEqual(self.fired, [1, 2])
+
+    def test_stop(self):
+        """
+        Stopping the wheel cancels all pending timers.
+        """
+        call = self.wheel.call_later(0.5, self.fired.append, 1)
+        self.wheel.stop()
+        self.assertFalse(call.active())
+        self.clock.advance(1.0)
+        self.assertEqual(self.fired, [])
@@ -0,0 +1,103 @@
+from twisted.internet import reactor
+
+from ..candidate import Candidate
+from ..util import blockingCallFromThread
+from ..verificationpool import VerificationPool
+from .dispersytestclass import DispersyTestFunc
+
+
+class TestVerificationPool(DispersyTestFunc):
+
+    def _verify(self, processes):
+        member = self._mm.my_member
+        checks = [(member.public_key, "data %d" % i, member.sign("data %d" % i)) for i in xrange(10)]
+        # invalid signature, data that does not match the signature, and an invalid public key
+        checks.append((member.public_key, "data", "\x00" * member.signature_length))
+        checks.append((member.public_key, "other data", checks[0][2]))
+        checks.append(("invalid public key", "data 0", checks[0][2]))
+
+        pool = VerificationPool(self._dispersy.crypto, 2, processes)
+        pool.start()
+        try:
+            return blockingCallFromThread(reactor, pool.verify, checks)
+        finally:
+            pool.stop()
+
+    def test_verify_threads(self):
+        """
+        The worker threads must accept the valid signatures and reject all others.
+        """
+        self.assertEqual(self._verify(False), [True] * 10 + [False] * 3)
+
+    def test_verify_processes(self):
+        """
+        The worker processes must accept the valid signatures and reject all others.
+        """
+        self.assertEqual(self._verify(True), [True] * 10 + [False] * 3)
+
+    def test_signature_checks(self):
+        """
+        The signature checks of a message must verify against its packet.
+        """
+        node, = self.create_nodes(1)
+        message = node.create_full_sync_text("Message", 10)
+
+        checks = message.authentication.get_signature_checks(message.packet)
+        self.assertEqual(len(checks), 1)
+        member, data, signature = checks[0]
+        self.assertEqual(member, node.my_member)
+        self.assertTrue(member.verify(data, signature))
+
+    def _give_batch(self, verifier=None):
+        """
+        NODE receives a batch from OTHER containing valid messages and one message with an invalid signature, the
+        signatures are verified on a VerificationPool with worker threads.
+        """
+        node, other = self.create_nodes(2)
+        other.send_identity(node)
+        messages = [other.create_full_sync_text("Message %d" % i, i + 10) for i in xrange(10)]
+        invalid = other.create_full_sync_text("Invalid", 100)
+        packets = [message.packet for message in messages] + [invalid.packet[:-1] + chr((ord(invalid.packet[-1]) + 1) % 256)]
+
+        pool = VerificationPool(self._dispersy.crypto, 2, False)
+        pool.start()
+        if verifier:
+            pool._verifier = verifier
+        member = self._mm.my_member
+        flush_checks = [(member.public_key, "data", member.sign("data"))]
+
+        def give_batch():
+            community = node._community
+            conversion = community.get_conversion_for_packet(packets[0])
+            meta = conversion.decode_meta_message(packets[0])
+            candidate = community.get_candidate(other.lan_address) or Candidate(other.lan_address, False)
+            node._dispersy._verification_pool = pool
+            community._on_batch_cache(meta, [(candidate, packet, conversion, u"unknown") for packet in packets])
+
+        def flush():
+            # the results are delivered in order, all earlier batches have been handled once these checks are done
+            return pool.verify(flush_checks).addErrback(lambda _: None)
+
+        try:
+            node.call(give_batch)
+            blockingCallFromThread(reactor, flush)
+        finally:
+            node._dispersy._verification_pool = None
+            pool.stop()
+
+        node.assert_is_stored(messages=messages)
+        node.assert_not_stored(invalid)
+
+    def test_on_batch_cache(self):
+        """
+        The messages with valid signatures are stored, the message with an invalid signature is dropped.
+        """
+        self._give_batch()
+
+    def test_on_batch_cache_failure(self):
+        """
+        When the pool fails the signatures are verified on the reactor thread instead.
+        """
+        def verifier(check):
+            raise RuntimeError("verifier failure")
+        self._give_batch(verifier)
@@ -3,6 +3,7 @@ The Timeline is an important part of Dispersy.  The Timeline can be
 queried as to who had what actions at some point in time.
 """
 
+from bisect import bisect_left, bisect_right
 from itertools import count, groupby
 import logging
 
@@ -30,8 +31,23 @@ class Timeline(object):
         # [(global_time, {u"resolution^message-name":(resolution-policy, [Message.Implementation])})]
         self._policies = []
 
+        # _permission_index is a compiled version of _members that allows _check to bisect the global times where a
+        # permission changed instead of walking the timeline of the member
+        # (Member, permission, message-name) / ([global_time], [(True/False, [Message.Implementation])])
+        self._permission_index = {}
+
+        # _policy_index is a compiled version of _policies
+        # message-name / ([global_time], [(resolution-policy, [Message.Implementation])])
+        self._policy_index = {}
+
     if __debug__:
         def printer(self):
+            def proof_to_string(proof):
+                # proofs restored from a snapshot are only loaded when needed
+                if isinstance(proof, (int, long)):
+                    return "packet %d" % proof
+                return "%d@%d" % (proof.authentication.member.database_id, proof.distribution.global_time)
+
             for global_time, dic in self._policies:
                 self._logger.debug("policy @%d", global_time)
                 for key, (policy, proofs) in dic.iteritems():
@@ -43,19 +59,17 @@ class Timeline(object):
                     self._logger.debug("member %d @%d", member.database_id, global_time)
                     for key, (allowed, proofs) in sorted(dic.iteritems()):
                         if allowed:
-                            assert all(proof.name == u"dispersy-authorize" for proof in proofs)
+                            assert all(isinstance(proof, (int, long)) or proof.name == u"dispersy-authorize"
+                                       for proof in proofs)
                             self._logger.debug("member %d %50s  granted by %s",
-                                               member.database_id, key,
-                                               ", ".join("%d@%d" % (proof.authentication.member.database_id,
-                                                                    proof.distribution.global_time)
-                                                         for proof in proofs))
+                                               member.database_id, key, ", ".join(proof_to_string(proof)
+                                                                                  for proof in proofs))
                         else:
-                            assert all(proof.name == u"dispersy-revoke" for proof in proofs)
+                            assert all(isinstance(proof, (int, long)) or proof.name == u"dispersy-revoke"
+                                       for proof in proofs)
                             self._logger.debug("member %d %50s  revoked by %s",
-                                               member.database_id, key,
-                                               ", ".join("%d@%d" % (proof.authentication.member.database_id,
-                                                                    proof.distribution.global_time)
-                                                         for proof in proofs))
+                                               member.database_id, key, ", ".join(proof_to_string(proof)
+                                                                                  for proof in proofs))
 
     def check(self, message, permission=u"permit"):
         """
@@ -205,47 +219,41 @@ class Timeline(object):
 
                 # allowed LinearResolution is stored in Timeline
                 elif isinstance(resolution, (LinearResolution, LinearResolution.Implementation)):
-                    key = permission + "^" + message.name
-
-                    if member in self._members:
-                        iterator = reversed(self._members[member])
-                        try:
-                            # go backwards while time > global_time
-                            while True:
-                                time, permissions = iterator.next()
-                                if time <= global_time:
-                                    break
-
-                            # check permissions and continue backwards in time
-                            while True:
-                                if key in permissions:
-                                    assert isinstance(permissions[key], tuple)
-                                    assert len(permissions[key]) == 2
-                                    assert isinstance(permissions[key][0], bool)
-                                    assert isinstance(permissions[key][1], list)
-                                    assert len(permissions[key][1]) > 0
-                                    assert all(isinstance(x, Message.Implementation) for x in permissions[key][1])
-                                    allowed, proofs = permissions[key]
-
-                                    if allowed:
-                                        self._logger.debug("ACCEPT time:%d user:%d -> %s (authorized)",
-                                                           global_time, member.database_id, key)
-                                        all_proofs.extend(proofs)
-                                        break
-                                    else:
-                                        self._logger.warning("DENIED time:%d user:%d -> %s (revoked)",
-                                                             global_time, member.database_id, key)
-                                        return (False, [proofs])
-
-                                time, permissions = iterator.next()
-
-                        except StopIteration:
-                            self._logger.warning("FAIL time:%d user:%d -> %s (not authorized)",
-                                                 global_time, member.database_id, key)
+                    changes = self._permission_index.get((member, permission, message.name))
+
+                    if changes:
+                        # the most recent change at or before global_time decides
+                        times, values = changes
+                        index = bisect_right(times, global_time)
+                        if index == 0:
+                            self._logger.warning("FAIL time:%d user:%d -> %s^%s (not authorized)",
+                                                 global_time, member.database_id, permission, message.name)
+                            return (False, all_proofs)
+
+                        if not self._load_proofs(values[index - 1][1]):
+                            self._logger.warning("FAIL time:%d user:%d -> %s^%s (proof unavailable)",
+                                                 global_time, member.database_id, permission, message.name)
                             return (False, all_proofs)
+                        assert isinstance(values[index - 1], tuple)
+                        assert len(values[index - 1]) == 2
+                        assert isinstance(values[index - 1][0], bool)
+                        assert isinstance(values[index - 1][1], list)
+                        assert len(values[index - 1][1]) > 0
+                        assert all(isinstance(x, Message.Implementation) for x in values[index - 1][1])
+                        allowed, proofs = values[index - 1]
+
+                        if allowed:
+                            self._logger.debug("ACCEPT time:%d user:%d -> %s^%s (authorized)",
+                                               global_time, member.database_id, permission, message.name)
+                            all_proofs.extend(proofs)
+                        else:
+                            self._logger.warning("DENIED time:%d user:%d -> %s^%s (revoked)",
+                                                 global_time, member.database_id, permission, message.name)
+                            return (False, [proofs])
+
                     else:
-                        self._logger.warning("FAIL time:%d user:%d -> %s (no authorization)",
-                                             global_time, member.database_id, key)
+                        self._logger.warning("FAIL time:%d user:%d -> %s^%s (no authorization)",
+                                             global_time, member.database_id, permission, message.name)
                         return (False, all_proofs)
 
                     # accept with proof
@@ -315,6 +323,7 @@ class Timeline(object):
                             self._logger.debug("AUTHORISE time:%d user:%d -> %s (extending)",
                                                global_time, member.database_id, key)
                             permissions[key] = (True, [proof])
+                            self._index_permission(member, permission, message.name, global_time, permissions[key])
                         break
 
                     # insert when time > global_time
@@ -323,6 +332,7 @@ class Timeline(object):
                         self._logger.debug("AUTHORISE time:%d user:%d -> %s (inserting)",
                                            global_time, member.database_id, key)
                         self._members[member].insert(index, (global_time, {key: (True, [proof])}))
+                        self._index_permission(member, permission, message.name, global_time, self._members[member][index][1][key])
                         break
 
                     # otherwise: go forward while time < global_time
@@ -332,6 +342,7 @@ class Timeline(object):
                     self._logger.debug("AUTHORISE time:%d user:%d -> %s (appending)",
                                        global_time, member.database_id, key)
                     self._members[member].append((global_time, {key: (True, [proof])}))
+                    self._index_permission(member, permission, message.name, global_time, self._members[member][-1][1][key])
 
             else:
                 raise NotImplementedError(message.resolution)
@@ -397,6 +408,7 @@ class Timeline(object):
                             self._logger.debug("REVOKE time:%d user:%d -> %s (extending)",
                                                global_time, member.database_id, key)
                             permissions[key] = (False, [proof])
+                            self._index_permission(member, permission, message.name, global_time, permissions[key])
                         break
 
                     # insert when time > global_time
@@ -405,6 +417,7 @@ class Timeline(object):
                         self._logger.debug("REVOKE time:%d user:%d -> %s (inserting)",
                                            global_time, member.database_id, key)
                         self._members[member].insert(index, (global_time, {key: (False, [proof])}))
+                        self._index_permission(member, permission, message.name, global_time, self._members[member][index][1][key])
                         break
 
                     # otherwise: go forward while time < global_time
@@ -414,12 +427,31 @@ class Timeline(object):
                     self._logger.debug("REVOKE time:%d user:%d -> %s (appending)",
                                        global_time, member.database_id, key)
                     self._members[member].append((global_time, {key: (False, [proof])}))
+                    self._index_permission(member, permission, message.name, global_time, self._members[member][-1][1][key])
 
             else:
                 raise NotImplementedError(message.resolution)
 
         return (True, revoke_proofs)
 
+    def _index_permission(self, member, permission, name, global_time, value):
+        """
+        Add VALUE, the (allowed, proofs) tuple that MEMBER received for PERMISSION^NAME at GLOBAL_TIME, to the
+        permission index.
+
+        There can be only one value for each global time, _members raises NotImplementedError on conflicts.
+        """
+        changes = self._permission_index.get((member, permission, name))
+        if changes is None:
+            self._permission_index[(member, permission, name)] = ([global_time], [value])
+
+        else:
+            times, values = changes
+            index = bisect_left(times, global_time)
+            assert index == len(times) or times[index] != global_time, "permission already indexed at this global time"
+            times.insert(index, global_time)
+            values.insert(index, value)
+
     def get_resolution_policy(self, message, global_time):
         """
         Returns the resolution policy and associated proof that is used for MESSAGE at time
@@ -429,12 +461,16 @@ class Timeline(object):
         assert isinstance(message, Message)
         assert isinstance(global_time, (int, long))
 
-        key = u"resolution^" + message.name
-        for policy_time, policies in reversed(self._policies):
-            if policy_time < global_time and key in policies:
+        changes = self._policy_index.get(message.name)
+        if changes:
+            # the most recent change before global_time decides
+            times, values = changes
+            index = bisect_left(times, global_time)
+            if index:
                 self._logger.debug("using %s for time %d (configured at %s)",
-                                   policies[key][0].__class__.__name__, global_time, policy_time)
-                return policies[key]
+                                   values[index - 1][0].__class__.__name__, global_time, times[index - 1])
+                self._load_proofs(values[index - 1][1])
+                return values[index - 1]
 
         self._logger.debug("using %s for time %d (default)", message.resolution.default.__class__.__name__, global_time)
         return message.resolution.default, []
@@ -455,4 +491,103 @@ class Timeline(object):
             self._policies.sort()
 
         # TODO it is possible that different members set different policies at the same time
-        policies[u"resolution^" + message.name] = (policy, [proof])
+        value = policies[u"resolution^" + message.name] = (policy, [proof])
+        self._index_policy(message.name, global_time, value)
+
+    def _index_policy(self, name, global_time, value):
+        """
+        Add VALUE, the (resolution-policy, proofs) tuple that applies to NAME from GLOBAL_TIME onward, to the policy
+        index.
+        """
+        times, values = self._policy_index.setdefault(name, ([], []))
+        index = bisect_left(times, global_time)
+        if index < len(times) and times[index] == global_time:
+            values[index] = value
+        else:
+            times.insert(index, global_time)
+            values.insert(index, value)
+
+    def get_snapshot(self):
+        """
+        Returns the permissions and policies in this timeline as nested lists of numbers and unicode strings, where
+        members are referenced by their database_id and proofs by their packet_id.
+
+        Returns None when one of the proofs is not stored in the database.
+        """
+        def to_packet_ids(proofs):
+            return [proof if isinstance(proof, (int, long)) else proof.packet_id for proof in proofs]
+
+        members = []
+        for member, lst in self._members.iteritems():
+            changes = []
+            for global_time, permissions in lst:
+                for key, (allowed, proofs) in sorted(permissions.iteritems()):
+                    changes.append([global_time, key, allowed, to_packet_ids(proofs)])
+            members.append([member.database_id, changes])
+
+        policies = []
+        for global_time, dic in self._policies:
+            for key, (policy, proofs) in sorted(dic.iteritems()):
+                name = key.split(u"^", 1)[1]
+                index = self._community.get_meta_message(name).resolution.policies.index(policy)
+                policies.append([global_time, name, index, to_packet_ids(proofs)])
+
+        if not all(all(packet_ids) for _, changes in members for _, _, _, packet_ids in changes) or \
+                not all(all(packet_ids) for _, _, _, packet_ids in policies):
+            return None
+        return {u"members": members, u"policies": policies}
+
+    def load_snapshot(self, snapshot):
+        """
+        Restores the permissions and policies from SNAPSHOT, as returned by get_snapshot, into this empty timeline.
+
+        The proofs are loaded from the database when they are first needed.  Raises ValueError when a member is
+        unknown and MetaNotFoundException when a message name is unknown.
+        """
+        assert isinstance(snapshot, dict), type(snapshot)
+        assert not self._members and not self._policies, "the timeline must be empty"
+        get_member = self._community.dispersy.get_member_from_database_id
+
+        for member_id, changes in snapshot[u"members"]:
+            member = get_member(member_id)
+            if member is None:
+                raise ValueError("unknown member %d" % member_id)
+
+            lst = self._members[member] = []
+            for global_time, key, allowed, packet_ids in changes:
+                if not lst or lst[-1][0] != global_time:
+                    lst.append((global_time, {}))
+                value = lst[-1][1][key] = (allowed, packet_ids)
+                permission, name = key.split(u"^", 1)
+                self._index_permission(member, permission, name, global_time, value)
+
+        for global_time, name, index, packet_ids in snapshot[u"policies"]:
+            meta = self._community.get_meta_message(name)
+            if not self._policies or self._policies[-1][0] != global_time:
+                self._policies.append((global_time, {}))
+            value = self._policies[-1][1][u"resolution^" + name] = (meta.resolution.policies[index], packet_ids)
+            self._index_policy(name, global_time, value)
+
+    def _load_proofs(self, proofs):
+        """
+        Replaces, in place, the packet ids in PROOFS that were restored from a snapshot with the stored messages.
+
+        Proofs that can not be loaded are removed from PROOFS and the persisted snapshot is discarded, such that the
+        timeline is replayed from the database the next time the community is loaded.  Returns True when PROOFS is not
+        empty afterwards.
+        """
+        if any(isinstance(proof, (int, long)) for proof in proofs):
+            loaded = []
+            for proof in proofs:
+                if isinstance(proof, (int, long)):
+                    packet_id = proof
+                    proof = self._community.dispersy.load_message_by_packetid(self._community, packet_id)
+                    if proof is None:
+                        self._logger.error("unable to load proof %d from the database", packet_id)
+                        continue
+                loaded.append(proof)
+
+            if len(loaded) < len(proofs):
+                self._community.discard_timeline_snapshot()
+            proofs[:] = loaded
+        return len(proofs) > 0
@@ -0,0 +1,179 @@
+"""
+This module provides a hashed timer wheel for the many short lived timeouts of a Dispersy instance.
+
+Every introduction request, signature request, and ping adds a cache to the RequestCache that times out after a few
+seconds.  Scheduling a DelayedCall for each of them grows the reactor's delayed call heap to thousands of entries, while
+almost all of them are cancelled long before they expire.  The TimerWheel keeps its timers in a fixed number of slots
+instead, where each slot holds the timers that expire at the same tick modulo the number of slots.  Adding and
+cancelling a timer is O(1), and the reactor only needs a single DelayedCall for the next tick while any timer is
+pending.
+
+Timers fire on the first tick at or after their deadline, i.e. at most one resolution late and never early.  Timers
+must be added and cancelled on the reactor thread.
+"""
+
+import logging
+from math import ceil
+
+from twisted.internet import reactor
+
+
+# the number of slots in the wheel
+TIMER_WHEEL_SLOTS = 512
+# the number of seconds between two ticks
+TIMER_WHEEL_RESOLUTION = 0.1
+
+
+class TimerWheelCall(object):
+
+    """
+    A timer that was added to a TimerWheel.  Provides the active and cancel methods of a DelayedCall.
+    """
+
+    __slots__ = ["_wheel", "tick", "func", "args", "kwargs"]
+
+    def __init__(self, wheel, tick, func, args, kwargs):
+        self._wheel = wheel
+        self.tick = tick
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def active(self):
+        """
+        Returns True until the timer has fired or was cancelled.
+        """
+        return self._wheel is not None
+
+    def cancel(self):
+        """
+        Prevents the timer from firing.  Does nothing when the timer has already fired or was cancelled.
+        """
+        if self._wheel is not None:
+            self._wheel._cancel(self)
+
+    def __str__(self):
+        return "<%s %s at tick %d>" % (self.__class__.__name__, getattr(self.func, "__name__", self.func), self.tick)
+
+
+class TimerWheel(object):
+
+    def __init__(self, slots=TIMER_WHEEL_SLOTS, resolution=TIMER_WHEEL_RESOLUTION, clock=reactor):
+        """
+        Create an empty wheel.
+
+        @param slots: The number of slots in the wheel.
+        @type slots: int
+
+        @param resolution: The number of seconds between two ticks.
+        @type resolution: float
+
+        @param clock: The reactor, or any other IReactorTime provider, used to schedule the ticks.
+        """
+        assert isinstance(slots, int), type(slots)
+        assert slots > 0, slots
+        assert isinstance(resolution, float), type(resolution)
+        assert resolution > 0.0, resolution
+        super(TimerWheel, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._resolution = resolution
+        self._clock = clock
+
+        # every slot contains the timers whose tick modulo len(self._slots) is the slot index
+        self._slots = [set() for _ in xrange(slots)]
+        # the time of tick zero
+        self._origin = clock.seconds()
+        # the most recent tick that was processed
+        self._tick = 0
+        # the number of pending timers
+        self._count = 0
+        # the DelayedCall for the next tick, only scheduled while timers are pending
+        self._delayed_call = None
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    def __len__(self):
+        """
+        Returns the number of pending timers.
+        """
+        return self._count
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """
+        Call FUNC(*ARGS, **KWARGS) at the first tick at least DELAY seconds from now.
+
+        @param delay: The number of seconds to wait.
+        @type delay: float
+
+        @return: The timer, which can be cancelled.
+        @rtype: TimerWheelCall
+        """
+        assert isinstance(delay, (int, long, float)), type(delay)
+        assert delay >= 0.0, delay
+        assert callable(func), func
+        tick = max(self._tick + 1, int(ceil((self._clock.seconds() + delay - self._origin) / self._resolution)))
+        call = TimerWheelCall(self, tick, func, args, kwargs)
+        self._slots[tick % len(self._slots)].add(call)
+        self._count += 1
+
+        if self._delayed_call is None:
+            # the wheel was idle, skip the ticks that passed in the meantime
+            self._tick = min(tick - 1, int((self._clock.seconds() - self._origin) / self._resolution))
+            self._schedule()
+        return call
+
+    def _cancel(self, call):
+        self._slots[call.tick % len(self._slots)].discard(call)
+        call._wheel = None
+        self._count -= 1
+        if not self._count and self._delayed_call is not None:
+            self._delayed_call.cancel()
+            self._delayed_call = None
+
+    def _schedule(self):
+        delay = self._origin + (self._tick + 1) * self._resolution - self._clock.seconds()
+        self._delayed_call = self._clock.callLater(max(0.0, delay), self._on_tick)
+
+    def _on_tick(self):
+        self._delayed_call = None
+        # this call was scheduled for the next tick, rounding errors must not make it process no tick at all
+        now = max(self._tick + 1, int((self._clock.seconds() - self._origin) / self._resolution))
+
+        # when the reactor was blocked for longer than a single tick several slots must be processed.  a single
+        # revolution visits every slot, hence every expired timer
+        expired = []
+        for tick in xrange(self._tick + 1, min(now, self._tick + len(self._slots)) + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if slot:
+                calls = [call for call in slot if call.tick <= now]
+                slot.difference_update(calls)
+                expired.extend(calls)
+        self._tick = max(self._tick, now)
+
+        self._count -= len(expired)
+        expired.sort(key=lambda call: call.tick)
+        for call in expired:
+            call._wheel = None
+            try:
+                call.func(*call.args, **call.kwargs)
+            except Exception:
+                self._logger.exception("timer %s failed", call)
+
+        if self._count and self._delayed_call is None:
+            self._schedule()
+
+    def stop(self):
+        """
+        Cancels all pending timers.
+        """
+        if self._delayed_call is not None:
+            self._delayed_call.cancel()
+            self._delayed_call = None
+
+        for slot in self._slots:
+            for call in slot:
+                call._wheel = None
+            slot.clear()
+        self._count = 0
@@ -0,0 +1,94 @@
+"""
+Helpers shared by the Dispersy benchmark scripts.
+
+Each benchmark script defines a function that is called on the reactor thread, with a running Dispersy instance that
+uses a NullEndpoint and a memory database.  For example:
+
+    python -m dispersy.tool.benchmark_store
+"""
+import logging
+import shutil
+from tempfile import mkdtemp
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import maybeDeferred
+
+from ..dispersy import Dispersy
+from ..endpoint import NullEndpoint
+
+
+logging.basicConfig(format="%(asctime)-15s [%(levelname)s] %(message)s", level=logging.WARNING)
+
+logger = logging.getLogger(__name__)
+
+
+def create_dispersy(endpoint=None, database_filename=u":memory:", **kargs):
+    """
+    Returns a started Dispersy instance.  Must be called on the reactor thread.
+
+    KARGS are passed to the Dispersy constructor.
+    """
+    working_directory = unicode(mkdtemp(suffix="_dispersy_benchmark"))
+    dispersy = Dispersy(endpoint or NullEndpoint(), working_directory, database_filename, **kargs)
+    if not dispersy.start(autoload_discovery=False):
+        raise RuntimeError("Unable to start Dispersy")
+    return dispersy
+
+
+def destroy_dispersy(dispersy):
+    """
+    Stops DISPERSY and removes its working directory.
+    """
+    dispersy.stop()
+    shutil.rmtree(dispersy.working_directory, ignore_errors=True)
+
+
+def report(name, count, duration, unit="items"):
+    """
+    Prints the throughput for COUNT items that were processed in DURATION seconds.
+    """
+    print "%-50s %10d %s in %8.3fs  %12.1f %s/sec" % (name, count, unit, duration, count / duration if duration else 0.0, unit)
+
+
+class Timer(object):
+
+    """
+    Context manager that measures the wall clock time spent in its body.
+
+    with Timer() as timer:
+        ...
+    print timer.duration
+    """
+
+    def __init__(self):
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start = time()
+        return self
+
+    def __exit__(self, *_):
+        self.duration = time() - self.start
+
+
+def run_benchmark(func, *args, **kargs):
+    """
+    Runs FUNC(*ARGS, **KARGS) on the reactor thread and stops the reactor once it is done.
+
+    FUNC may return a Deferred, in which case the reactor is stopped once it fires.
+    """
+    def on_error(failure):
+        logger.error("benchmark failed\n%s", failure.getTraceback())
+        reactor.exitCode = 1
+
+    def run():
+        deferred = maybeDeferred(func, *args, **kargs)
+        deferred.addErrback(on_error)
+        deferred.addBoth(lambda _: reactor.stop())
+
+    reactor.exitCode = 0
+    reactor.callWhenRunning(run)
+    reactor.run()
+    exit(reactor.exitCode)
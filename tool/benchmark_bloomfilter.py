@@ -0,0 +1,55 @@
+"""
+Benchmark the BloomFilter and BytearrayBloomFilter add_keys and not_filter throughput.
+
+    python -m dispersy.tool.benchmark_bloomfilter [--keys 1000] [--rounds 100] [--packet-size 500]
+"""
+import argparse
+from random import getrandbits
+
+from ..bloomfilter import BloomFilter, BytearrayBloomFilter
+from ..tests.debugcommunity.community import DebugCommunity
+from .benchmark import Timer, create_dispersy, destroy_dispersy, report, run_benchmark
+
+
+def benchmark(opt):
+    # the default bloom filter size depends on the signature length of the community member
+    dispersy = create_dispersy()
+    try:
+        community = DebugCommunity.create_community(dispersy, dispersy.get_new_member(u"very-low"))
+        bits = community.dispersy_sync_bloom_filter_bits
+        error_rate = community.dispersy_sync_bloom_filter_error_rate
+    finally:
+        destroy_dispersy(dispersy)
+
+    # half of the keys are added, the not_filter checks all keys
+    keys = ["".join(chr(getrandbits(8)) for _ in xrange(opt.packet_size)) for _ in xrange(opt.keys)]
+    added_keys = keys[:len(keys) / 2]
+    tuples = [(key,) for key in keys]
+    print "bloom filter of %d bits, %d keys of %d bytes" % (bits, len(keys), opt.packet_size)
+
+    for cls in (BloomFilter, BytearrayBloomFilter):
+        bloom = cls(bits, error_rate, prefix="a")
+        with Timer() as timer:
+            for _ in xrange(opt.rounds):
+                bloom.clear()
+                bloom.add_keys(added_keys)
+        report("%s.add_keys" % cls.__name__, len(added_keys) * opt.rounds, timer.duration, "keys")
+
+        with Timer() as timer:
+            for _ in xrange(opt.rounds):
+                for _ in bloom.not_filter(iter(tuples)):
+                    pass
+        report("%s.not_filter" % cls.__name__, len(tuples) * opt.rounds, timer.duration, "keys")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=1000, help="number of keys, half of them are added")
+    parser.add_argument("--rounds", type=int, default=100, help="number of times each operation is repeated")
+    parser.add_argument("--packet-size", type=int, default=500, help="size of each key in bytes")
+    opt = parser.parse_args()
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
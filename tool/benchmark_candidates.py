@@ -0,0 +1,85 @@
+"""
+Benchmark the memory used by WalkCandidate instances in a CandidateStore.
+
+    python -m dispersy.tool.benchmark_candidates [--candidates 100000]
+
+The size of a candidate includes its instance, attributes, address tuples, and host strings.  Objects that are shared
+between candidates, such as interned host strings, are counted once.  The memory used by the CandidateStore itself,
+i.e. the dictionaries and indexes that refer to the candidates, is reported separately.
+"""
+import argparse
+import logging
+from sys import getsizeof
+from time import time
+
+from ..candidate import WalkCandidate
+from ..candidatestore import CandidateStore
+from .benchmark import Timer, report
+
+
+def get_size(obj, seen):
+    """
+    Returns the size of OBJ and everything it refers to, excluding the objects in SEEN.
+
+    Loggers, classes, and the CandidateStore that a candidate refers to are not included.
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (logging.Logger, CandidateStore, type)):
+            continue
+        seen.add(id(obj))
+
+        size += getsizeof(obj)
+        if isinstance(obj, (tuple, list, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        else:
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for name in cls.__dict__.get("__slots__", ()):
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return size
+
+
+def benchmark(opt):
+    now = time()
+    store = CandidateStore()
+    with Timer() as timer:
+        for i in xrange(opt.candidates):
+            # a quarter of the candidates are behind a NAT, i.e. their LAN address differs from their WAN address
+            sock_addr = ("%d.%d.%d.%d" % (10 + i % 4, (i >> 16) & 255, (i >> 8) & 255, 1 + i % 254), 1024 + i % 60000)
+            lan_address = ("192.168.%d.%d" % ((i >> 8) & 255, 1 + i % 254), 7759) if i % 4 == 0 else sock_addr
+            candidate = WalkCandidate(sock_addr, False, lan_address, sock_addr, u"unknown")
+            candidate.intro(now)
+            store[sock_addr] = candidate
+    report("create WalkCandidate", opt.candidates, timer.duration, "candidates")
+
+    with Timer() as timer:
+        candidates = store.get_candidates([u"intro"], now)
+    report("categorize WalkCandidate", len(candidates), timer.duration, "candidates")
+
+    seen = set()
+    candidate_size = sum(get_size(candidate, seen) for candidate in store.itervalues())
+    # the store is a dictionary that also contains its indexes as attributes
+    store_size = getsizeof(store) + get_size(vars(store), seen)
+    print "%d candidates use %d bytes, %.1f bytes per candidate" % (
+        opt.candidates, candidate_size, float(candidate_size) / opt.candidates)
+    print "the CandidateStore uses %d bytes, %.1f bytes per candidate" % (
+        store_size, float(store_size) / opt.candidates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--candidates", type=int, default=100000, help="number of candidates")
+    opt = parser.parse_args()
+    benchmark(opt)
+
+
+if __name__ == "__main__":
+    main()
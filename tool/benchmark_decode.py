@@ -0,0 +1,74 @@
+"""
+Benchmark the decoding of introduction-request and full-sync-text packets.
+
+    python -m dispersy.tool.benchmark_decode [--packets 100000] [--verify-packets 1000]
+
+Each packet is decoded with and without verifying its signature.  The verified signature cache is cleared before every
+verification, otherwise only the first decode of a packet would verify its signature.
+"""
+import argparse
+
+from ..bloomfilter import BloomFilter
+from ..candidate import Candidate
+from ..tests.debugcommunity.community import DebugCommunity
+from .benchmark import Timer, create_dispersy, destroy_dispersy, report, run_benchmark
+
+
+def create_packets(community):
+    """
+    Returns (name, packet) pairs with a signed introduction-request and full-sync-text packet.
+    """
+    bloom_filter = BloomFilter(512 * 8, 0.001, prefix="x")
+    for i in xrange(100):
+        bloom_filter.add("packet-%d" % i)
+
+    meta = community.get_meta_message(u"dispersy-introduction-request")
+    request = meta.impl(authentication=(community.my_member,),
+                        distribution=(community.claim_global_time(),),
+                        payload=(("1.2.3.4", 1234), ("192.168.1.1", 7759), ("5.6.7.8", 7759), True, u"unknown",
+                                 (1, 0, 1, 0, bloom_filter), 42))
+
+    meta = community.get_meta_message(u"full-sync-text")
+    text = meta.impl(authentication=(community.my_member,),
+                     distribution=(community.claim_global_time(),),
+                     payload=("x" * 512,))
+
+    return [(u"introduction-request", request.packet), (u"full-sync-text", text.packet)]
+
+
+def benchmark(opt):
+    dispersy = create_dispersy()
+    try:
+        community = DebugCommunity.create_community(dispersy, dispersy.get_new_member(u"very-low"))
+        candidate = Candidate(("1.2.3.4", 1234), False)
+
+        for name, packet in create_packets(community):
+            conversion = community.get_conversion_for_packet(packet)
+
+            with Timer() as timer:
+                for _ in xrange(opt.packets):
+                    conversion.decode_message(candidate, packet, verify=False)
+            report("decode %s (%d bytes)" % (name, len(packet)), opt.packets, timer.duration, "packets")
+
+            with Timer() as timer:
+                for _ in xrange(opt.verify_packets):
+                    dispersy._verified_signature_cache.clear()
+                    conversion.decode_message(candidate, packet)
+            report("decode and verify %s (%d bytes)" % (name, len(packet)), opt.verify_packets, timer.duration,
+                   "packets")
+
+    finally:
+        destroy_dispersy(dispersy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packets", type=int, default=100000, help="number of packets decoded without verification")
+    parser.add_argument("--verify-packets", type=int, default=1000,
+                        help="number of packets decoded with verification")
+    opt = parser.parse_args()
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
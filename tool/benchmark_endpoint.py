@@ -0,0 +1,111 @@
+"""
+Benchmark the StandaloneEndpoint, EpollEndpoint, and TwistedEndpoint receive path over loopback UDP.
+
+    python -m dispersy.tool.benchmark_endpoint [--packets 100000] [--packet-size 500]
+
+A separate thread sends the packets as fast as possible.  The received packets are counted on the reactor thread,
+instead of being processed by Dispersy, together with the latency between receiving a batch and its arrival on the
+reactor thread.
+"""
+import argparse
+import socket
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.task import deferLater
+from twisted.internet.threads import deferToThread
+
+from ..endpoint import StandaloneEndpoint, EpollEndpoint, TwistedEndpoint, epoll
+from .benchmark import create_dispersy, destroy_dispersy, report, run_benchmark
+
+
+class CountingMixin(object):
+
+    def reset_counters(self):
+        self.received = 0
+        self.last_received_at = 0.0
+        self.latency = 0.0
+        self.latency_max = 0.0
+        self.batches = 0
+
+    def dispersythread_data_came_in(self, packets, timestamp, cache=True):
+        now = time()
+        self.received += len(packets)
+        self.last_received_at = now
+        self.batches += 1
+        self.latency += now - timestamp
+        self.latency_max = max(self.latency_max, now - timestamp)
+
+
+class CountingStandaloneEndpoint(CountingMixin, StandaloneEndpoint):
+    pass
+
+
+class CountingEpollEndpoint(CountingMixin, EpollEndpoint):
+    pass
+
+
+class CountingTwistedEndpoint(CountingMixin, TwistedEndpoint):
+    pass
+
+
+def send_packets(address, count, packet_size):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 870400)
+    packet = "x" * packet_size
+    sendto = sock.sendto
+    try:
+        for _ in xrange(count):
+            sendto(packet, address)
+    finally:
+        sock.close()
+
+
+@inlineCallbacks
+def benchmark_endpoint(endpoint, opt):
+    endpoint.reset_counters()
+    dispersy = create_dispersy(endpoint)
+    try:
+        address = ("127.0.0.1", endpoint.get_address()[1])
+        start = time()
+        yield deferToThread(send_packets, address, opt.packets, opt.packet_size)
+
+        # wait until all packets arrived, or until nothing arrived for one second (UDP may drop packets)
+        while endpoint.received < opt.packets and time() - max(endpoint.last_received_at, start) < 1.0:
+            yield deferLater(reactor, 0.01, lambda: None)
+
+    finally:
+        destroy_dispersy(dispersy)
+
+    name = endpoint.__class__.__name__[len("Counting"):]
+    duration = max(endpoint.last_received_at, start) - start
+    report("%s (%d sent)" % (name, opt.packets), endpoint.received, duration, "packets")
+    print "%-50s %10d batches, latency average %.6fs max %.6fs" % (
+        "", endpoint.batches, endpoint.latency / endpoint.batches if endpoint.batches else 0.0, endpoint.latency_max)
+    returnValue(endpoint)
+
+
+@inlineCallbacks
+def benchmark(opt):
+    yield benchmark_endpoint(CountingStandaloneEndpoint(0, "127.0.0.1"), opt)
+
+    if epoll:
+        endpoint = yield benchmark_endpoint(CountingEpollEndpoint(0, "127.0.0.1"), opt)
+        print "%-50s %s" % ("", endpoint.handoff_statistics)
+    else:
+        print "EpollEndpoint is not available on this platform"
+
+    yield benchmark_endpoint(CountingTwistedEndpoint(0, "127.0.0.1"), opt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packets", type=int, default=100000, help="number of packets to send")
+    parser.add_argument("--packet-size", type=int, default=500, help="size of each packet in bytes")
+    opt = parser.parse_args()
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
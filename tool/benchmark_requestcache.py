@@ -0,0 +1,76 @@
+"""
+Benchmark adding and popping request caches while many other caches are outstanding.
+
+    python -m dispersy.tool.benchmark_requestcache [--caches 100000] [--outstanding 10000]
+
+Every introduction request adds a cache to the RequestCache that is usually popped, when the response arrives, long
+before it times out.  The benchmark keeps OUTSTANDING caches pending and adds and pops CACHES more.  For comparison it
+does the same with a DelayedCall for every timeout, as the RequestCache used to.
+"""
+import argparse
+
+from twisted.internet import reactor
+
+from ..requestcache import RequestCache, NumberCache
+from .benchmark import Timer, report, run_benchmark
+
+
+class BenchmarkCache(NumberCache):
+
+    def __init__(self, request_cache, number):
+        super(BenchmarkCache, self).__init__(request_cache, u"benchmark", number)
+
+    def on_timeout(self):
+        pass
+
+
+def benchmark_request_cache(opt):
+    request_cache = RequestCache()
+    try:
+        for number in xrange(opt.outstanding):
+            request_cache.add(BenchmarkCache(request_cache, number))
+
+        with Timer() as timer:
+            for number in xrange(opt.outstanding, opt.outstanding + opt.caches):
+                request_cache.add(BenchmarkCache(request_cache, number))
+                request_cache.pop(u"benchmark", number)
+        report("timer wheel add and pop", opt.caches, timer.duration, "caches")
+
+    finally:
+        request_cache.clear()
+
+
+def benchmark_delayed_calls(opt):
+    def on_timeout():
+        pass
+
+    outstanding = [reactor.callLater(10.0, on_timeout) for _ in xrange(opt.outstanding)]
+    try:
+        with Timer() as timer:
+            identifiers = {}
+            for number in xrange(opt.outstanding, opt.outstanding + opt.caches):
+                identifier = u"%s:%d" % (u"benchmark", number)
+                identifiers[identifier] = reactor.callLater(10.0, on_timeout)
+                identifiers.pop(u"%s:%d" % (u"benchmark", number)).cancel()
+        report("delayed call add and cancel", opt.caches, timer.duration, "caches")
+
+    finally:
+        for delayed_call in outstanding:
+            delayed_call.cancel()
+
+
+def benchmark(opt):
+    benchmark_request_cache(opt)
+    benchmark_delayed_calls(opt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--caches", type=int, default=100000, help="number of caches that are added and popped")
+    parser.add_argument("--outstanding", type=int, default=10000, help="number of caches that remain pending")
+    opt = parser.parse_args()
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark the number of introduction responses per second that a tracker can sustain.
+
+    python -m dispersy.tool.benchmark_signing [--requests 10000] [--peers 100] [--batch 100] [--workers 2] [--threads]
+
+Incoming introduction requests are given to Community.on_introduction_request in batches, as the endpoint would.  The
+duration includes signing the responses and forwarding them to a NullEndpoint.  The benchmark runs once with the
+responses signed on the reactor thread and once for every number of signing workers.
+"""
+import argparse
+
+from twisted.internet.defer import Deferred, inlineCallbacks
+
+from ..candidate import Candidate
+from ..tests.debugcommunity.community import DebugCommunity
+from .benchmark import Timer, create_dispersy, destroy_dispersy, report, run_benchmark
+
+
+def create_requests(community, peers, count):
+    """
+    Returns COUNT introduction requests, created by PEERS, as received from distinct addresses.
+    """
+    meta = community.get_meta_message(u"dispersy-introduction-request")
+    requests = []
+    for i in xrange(count):
+        sock_addr = ("10.%d.%d.%d" % ((i >> 16) & 255, (i >> 8) & 255, 1 + i % 254), 1024 + i % 60000)
+        requests.append(meta.impl(authentication=(peers[i % len(peers)],),
+                                  distribution=(community.global_time,),
+                                  candidate=Candidate(sock_addr, False),
+                                  payload=(("1.2.3.4", 7759), sock_addr, sock_addr, True, u"unknown", None, i % 65536)))
+    return requests
+
+
+@inlineCallbacks
+def benchmark_configuration(opt, workers):
+    dispersy = create_dispersy(signing_workers=workers,
+                               signing_processes=not opt.threads,
+                               signing_batch_window=opt.batch_window if workers else 0.0)
+    try:
+        community = DebugCommunity.create_community(dispersy, dispersy.get_new_member(u"very-low"))
+        peers = [dispersy.get_new_member(u"very-low") for _ in xrange(opt.peers)]
+        requests = create_requests(community, peers, opt.requests)
+
+        # count the forwarded responses, the benchmark is done once all of them are signed and forwarded
+        done = Deferred()
+        forwarded = [0]
+        forward = dispersy._forward
+
+        def count_and_forward(messages):
+            forwarded[0] += sum(1 for message in messages if message.name == u"dispersy-introduction-response")
+            if forwarded[0] >= len(requests) and not done.called:
+                done.callback(None)
+            return forward(messages)
+        dispersy._forward = count_and_forward
+
+        with Timer() as timer:
+            for index in xrange(0, len(requests), opt.batch):
+                community.on_introduction_request(requests[index:index + opt.batch])
+            yield done
+
+        if workers:
+            name = "%d signing %s" % (workers, "threads" if opt.threads else "processes")
+        else:
+            name = "reactor thread"
+        report(name, len(requests), timer.duration, "responses")
+
+    finally:
+        destroy_dispersy(dispersy)
+
+
+@inlineCallbacks
+def benchmark(opt):
+    for workers in [0] + opt.workers:
+        yield benchmark_configuration(opt, workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10000, help="number of incoming introduction requests")
+    parser.add_argument("--peers", type=int, default=100, help="number of members that created the requests")
+    parser.add_argument("--batch", type=int, default=100, help="number of requests given at once")
+    parser.add_argument("--workers", type=int, action="append", help="number of signing workers (repeatable)")
+    parser.add_argument("--threads", action="store_true", help="use worker threads instead of worker processes")
+    parser.add_argument("--batch-window", type=float, default=0.01,
+                        help="number of seconds that responses are collected before they are signed by the workers")
+    opt = parser.parse_args()
+    opt.workers = opt.workers or [1, 2, 4]
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark loading many communities with permission messages at startup.
+
+    python -m dispersy.tool.benchmark_startup [--communities 100] [--permissions 50]
+
+A database with COMMUNITIES communities, each containing PERMISSIONS dispersy-authorize messages, is created first.
+Dispersy is then restarted on this database and all communities are loaded with define_auto_load: once replaying all
+permission messages, once restoring the timeline snapshots, and once with lazy community initialization.  For the lazy
+initialization the time to complete the initialization of all communities is reported separately.
+"""
+import argparse
+import shutil
+from tempfile import mkdtemp
+
+from twisted.internet.defer import inlineCallbacks
+
+from ..dispersy import Dispersy
+from ..endpoint import NullEndpoint
+from ..tests.debugcommunity.community import DebugCommunity
+from .benchmark import Timer, report, run_benchmark
+
+
+class StartupCommunity(DebugCommunity):
+    pass
+
+
+class ReplayStartupCommunity(StartupCommunity):
+
+    @classmethod
+    def get_classification(cls):
+        # load the same communities as StartupCommunity
+        return StartupCommunity.get_classification()
+
+    @property
+    def dispersy_timeline_snapshot_enable(self):
+        return False
+
+
+def start_dispersy(working_directory, **kargs):
+    """
+    Returns a started Dispersy instance that uses the database in WORKING_DIRECTORY.
+    """
+    dispersy = Dispersy(NullEndpoint(), working_directory, u"dispersy.db", **kargs)
+    if not dispersy.start(autoload_discovery=False):
+        raise RuntimeError("Unable to start Dispersy")
+    return dispersy
+
+
+@inlineCallbacks
+def benchmark(opt):
+    working_directory = unicode(mkdtemp(suffix="_dispersy_benchmark"))
+    try:
+        dispersy = start_dispersy(working_directory)
+        my_member = dispersy.get_new_member(u"very-low")
+        private_key = dispersy.crypto.key_to_bin(my_member.private_key)
+        members = [dispersy.get_new_member(u"very-low") for _ in xrange(10)]
+        for _ in xrange(opt.communities):
+            community = StartupCommunity.create_community(dispersy, my_member)
+            meta = community.get_meta_message(u"protected-full-sync-text")
+            for index in xrange(opt.permissions):
+                community.create_authorize([(members[index % len(members)], meta, u"permit")], forward=False)
+        # unloading the communities saves their timeline snapshots
+        yield dispersy.stop()
+
+        for name, community_cls, lazy in [("replay permission messages", ReplayStartupCommunity, False),
+                                          ("restore timeline snapshot", StartupCommunity, False),
+                                          ("lazy initialization", StartupCommunity, True)]:
+            dispersy = start_dispersy(working_directory, lazy_community_initialization=lazy)
+            try:
+                my_member = dispersy.get_member(private_key=private_key)
+                with Timer() as timer:
+                    communities = dispersy.define_auto_load(community_cls, my_member, load=True)
+                report(name, len(communities), timer.duration, "communities")
+
+                if lazy:
+                    with Timer() as timer:
+                        for community in communities:
+                            community.complete_initialization()
+                    report("lazy initialization, first use", len(communities), timer.duration, "communities")
+
+            finally:
+                yield dispersy.stop()
+
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--communities", type=int, default=100, help="number of communities")
+    parser.add_argument("--permissions", type=int, default=50, help="number of dispersy-authorize messages per community")
+    opt = parser.parse_args()
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark Dispersy._store for batches of full-sync and last-sync messages.
+
+    python -m dispersy.tool.benchmark_store [--batch-size 1000 --batch-size 10000] [--members 100]
+"""
+import argparse
+
+from ..tests.debugcommunity.community import DebugCommunity
+from .benchmark import Timer, create_dispersy, destroy_dispersy, report, run_benchmark
+
+
+def create_messages(community, members, meta_name, count, global_time):
+    meta = community.get_meta_message(meta_name)
+    messages = []
+    for i in xrange(count):
+        messages.append(meta.impl(authentication=(members[i % len(members)],),
+                                  distribution=(global_time + i,),
+                                  payload=("benchmark message %d" % i,)))
+    return messages
+
+
+def benchmark(opt):
+    dispersy = create_dispersy()
+    try:
+        community = DebugCommunity.create_community(dispersy, dispersy.get_new_member(u"very-low"))
+        members = [dispersy.get_new_member(u"very-low") for _ in xrange(opt.members)]
+        for member in members:
+            member.add_identity(community)
+
+        global_time = 10
+        for batch_size in opt.batch_size:
+            for meta_name in (u"full-sync-text", u"last-9-test"):
+                messages = create_messages(community, members, meta_name, batch_size, global_time)
+                global_time += batch_size
+
+                with Timer() as timer:
+                    dispersy._store(messages)
+                    dispersy.database.commit()
+                report("_store %s (batch of %d)" % (meta_name, batch_size), batch_size, timer.duration, "messages")
+
+    finally:
+        destroy_dispersy(dispersy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, action="append", help="number of messages per batch (repeatable)")
+    parser.add_argument("--members", type=int, default=100, help="number of members creating the messages")
+    opt = parser.parse_args()
+    opt.batch_size = opt.batch_size or [1000, 10000]
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
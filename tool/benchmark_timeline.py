@@ -0,0 +1,70 @@
+"""
+Benchmark Timeline.check for many members with deep permission histories.
+
+    python -m dispersy.tool.benchmark_timeline [--members 10000] [--depth 20] [--checks 100000]
+
+Each member is alternately authorized and revoked DEPTH times, at increasing global times, after which the permissions
+are checked at random global times.
+"""
+import argparse
+import logging
+from random import randint
+
+from ..resolution import LinearResolution
+from ..tests.debugcommunity.community import DebugCommunity
+from .benchmark import Timer, create_dispersy, destroy_dispersy, report, run_benchmark
+
+
+def benchmark(opt):
+    dispersy = create_dispersy()
+    try:
+        community = DebugCommunity.create_community(dispersy, dispersy.get_new_member(u"very-low"))
+        timeline = community.timeline
+        master = community.master_member
+        meta = community.get_meta_message(u"protected-full-sync-text")
+        members = [dispersy.get_new_member(u"very-low") for _ in xrange(opt.members)]
+
+        # the timeline does not look into the proofs, hence a single authorize and revoke proof is used for everything
+        triplets = [(members[0], meta, u"permit")]
+        proofs = [community.get_meta_message(name).impl(authentication=(community.my_member,),
+                                                        distribution=(1, 1),
+                                                        payload=(triplets,))
+                  for name in (u"dispersy-authorize", u"dispersy-revoke")]
+
+        with Timer() as timer:
+            for depth in xrange(opt.depth):
+                func = timeline.revoke if depth % 2 else timeline.authorize
+                for member in members:
+                    func(master, 10 + depth * 10, [(member, meta, u"permit")], proofs[depth % 2])
+        report("authorize and revoke", len(members) * opt.depth, timer.duration, "changes")
+
+        resolution = LinearResolution()
+        permission_pairs = [(meta, u"permit")]
+        checks = [(members[randint(0, len(members) - 1)], randint(1, 10 + opt.depth * 10)) for _ in xrange(opt.checks)]
+        # every FAIL and DENIED check logs a warning, the benchmark would mostly measure the logging
+        timeline_logger = logging.getLogger(timeline.__class__.__name__)
+        level = timeline_logger.level
+        timeline_logger.setLevel(logging.ERROR)
+        try:
+            with Timer() as timer:
+                for member, global_time in checks:
+                    timeline._check(member, global_time, resolution, permission_pairs)
+        finally:
+            timeline_logger.setLevel(level)
+        report("check", len(checks), timer.duration, "checks")
+
+    finally:
+        destroy_dispersy(dispersy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=10000, help="number of members")
+    parser.add_argument("--depth", type=int, default=20, help="number of permission changes for each member")
+    parser.add_argument("--checks", type=int, default=100000, help="number of checks")
+    opt = parser.parse_args()
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark the VerificationPool for 1, 2, 4, and 8 workers.
+
+    python -m dispersy.tool.benchmark_verification [--signatures 10000] [--members 100] [--threads]
+"""
+import argparse
+
+from twisted.internet.defer import inlineCallbacks
+
+from ..verificationpool import VerificationPool
+from .benchmark import Timer, create_dispersy, destroy_dispersy, report, run_benchmark
+
+
+@inlineCallbacks
+def benchmark(opt):
+    dispersy = create_dispersy()
+    try:
+        members = [dispersy.get_new_member(u"medium") for _ in xrange(opt.members)]
+        checks = []
+        for i in xrange(opt.signatures):
+            member = members[i % len(members)]
+            data = "benchmark message %d" % i
+            checks.append((member.public_key, data, member.sign(data)))
+
+        with Timer() as timer:
+            for public_key, data, signature in checks:
+                dispersy.crypto.is_valid_signature(dispersy.crypto.key_from_public_bin(public_key), data, signature)
+        report("reactor thread", len(checks), timer.duration, "verifications")
+
+        for workers in opt.workers:
+            pool = VerificationPool(dispersy.crypto, workers, not opt.threads)
+            pool.start()
+            try:
+                # warm up the workers and their key caches
+                yield pool.verify(checks[:opt.members])
+
+                with Timer() as timer:
+                    results = yield pool.verify(checks)
+                assert all(results), "all signatures must be valid"
+                report("%d %s" % (workers, "threads" if opt.threads else "processes"), len(checks), timer.duration,
+                       "verifications")
+            finally:
+                pool.stop()
+
+    finally:
+        destroy_dispersy(dispersy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--signatures", type=int, default=10000, help="number of signatures to verify")
+    parser.add_argument("--members", type=int, default=100, help="number of members that created the signatures")
+    parser.add_argument("--workers", type=int, action="append", help="number of workers (repeatable)")
+    parser.add_argument("--threads", action="store_true", help="use worker threads instead of worker processes")
+    opt = parser.parse_args()
+    opt.workers = opt.workers or [1, 2, 4, 8]
+    run_benchmark(benchmark, opt)
+
+
+if __name__ == "__main__":
+    main()
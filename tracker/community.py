@@ -143,7 +143,7 @@ class TrackerCommunity(Community):
                     else:
                         write(" ".join(("dispersy-identity", str(packet).encode("HEX"), "\n")))
 
-                _, proofs = self._timeline.check(message)
+                _, proofs = self.timeline.check(message)
                 messages.extend(proofs)
 
         return TrackerHardKilledCommunity
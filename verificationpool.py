@@ -0,0 +1,160 @@
+"""
+Verifies batches of signatures on a pool of worker processes or threads.
+
+Verifying a signature is the most expensive step while processing incoming packets.  M2Crypto
+holds the GIL while verifying, hence by default the signatures are verified on worker processes.
+Crypto backends that release the GIL (i.e. libnacl) can use worker threads instead, avoiding the
+cost of pickling the data.
+
+The multiprocessing pools of Python 2.7 do not report errors to a callback, hence a single waiter
+thread collects the results.  This also ensures that the results are delivered in the order in
+which the batches were given.
+"""
+import logging
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from threading import Event
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python import threadpool
+
+from .crypto import DispersyCrypto
+
+
+# the maximum number of public keys that each worker keeps in its cache
+MAX_KEY_CACHE_SIZE = 1024
+
+# public_key_bin:key pairs, one cache for each worker process (shared between worker threads)
+_key_cache = {}
+
+
+class _Verifier(object):
+
+    """
+    The callable that runs on the workers.  Must be picklable.
+    """
+
+    def __init__(self, crypto):
+        self._crypto = crypto
+
+    def __call__(self, check):
+        public_key, data, signature = check
+        try:
+            key = _key_cache.get(public_key)
+            if key is None:
+                if len(_key_cache) >= MAX_KEY_CACHE_SIZE:
+                    _key_cache.clear()
+                key = _key_cache[public_key] = self._crypto.key_from_public_bin(public_key)
+            return bool(self._crypto.is_valid_signature(key, data, signature))
+        except Exception:
+            return False
+
+
+class VerificationPool(object):
+
+    def __init__(self, crypto, workers, processes=True):
+        """
+        Initialise a VerificationPool instance.
+
+        @param crypto: The crypto used to verify the signatures.  Must be picklable when PROCESSES is True.
+        @type crypto: DispersyCrypto
+
+        @param workers: The number of worker processes or threads.
+        @type workers: int
+
+        @param processes: When True the signatures are verified on worker processes, otherwise on worker threads.
+        @type processes: bool
+        """
+        assert isinstance(crypto, DispersyCrypto), type(crypto)
+        assert isinstance(workers, int), type(workers)
+        assert workers > 0, workers
+        assert isinstance(processes, bool), type(processes)
+        super(VerificationPool, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._verifier = _Verifier(crypto)
+        self._workers = workers
+        self._processes = processes
+        self._pool = None
+        self._waiter = None
+        self._stopped = Event()
+        self._pending = set()
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def is_running(self):
+        return self._pool is not None
+
+    def start(self):
+        assert self._pool is None, "VerificationPool is already running"
+        self._stopped.clear()
+        self._pool = (Pool if self._processes else ThreadPool)(self._workers)
+        self._waiter = threadpool.ThreadPool(1, 1, name="VerificationPool")
+        self._waiter.start()
+        self._logger.debug("started %d verification %s", self._workers, "processes" if self._processes else "threads")
+
+    def stop(self):
+        """
+        Stops the workers.  Pending verifications fail with a RuntimeError.
+        """
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            self._stopped.set()
+            pool.terminate()
+            pool.join()
+            self._waiter.stop()
+            self._waiter = None
+
+        pending, self._pending = self._pending, set()
+        for deferred in pending:
+            deferred.errback(RuntimeError("VerificationPool stopped"))
+
+    def verify(self, checks):
+        """
+        Verifies CHECKS on the workers.  Must be called on the reactor thread.
+
+        @param checks: The signatures to verify.
+        @type checks: list containing (public_key_bin, data, signature) tuples
+
+        @return: A Deferred that fires, on the reactor thread, with a list containing a bool for each check.
+        @rtype: Deferred
+        """
+        assert isinstance(checks, list), type(checks)
+        assert all(len(check) == 3 for check in checks), checks
+        assert self._pool is not None, "VerificationPool is not running"
+
+        deferred = Deferred()
+        if not checks:
+            deferred.callback([])
+            return deferred
+
+        def on_results(results):
+            if deferred in self._pending:
+                self._pending.remove(deferred)
+                deferred.callback(results)
+
+        def on_error(failure):
+            if deferred in self._pending:
+                self._pending.remove(deferred)
+                deferred.errback(failure)
+
+        self._pending.add(deferred)
+        chunksize = max(1, len(checks) // (self._workers * 4))
+        async_result = self._pool.map_async(self._verifier, checks, chunksize)
+        deferToThreadPool(reactor, self._waiter, self._wait, async_result).addCallbacks(on_results, on_error)
+        return deferred
+
+    def _wait(self, async_result):
+        """
+        Returns the results of ASYNC_RESULT, or raises its error.  Runs on the waiter thread.
+        """
+        # a terminated pool never finishes its pending results
+        while not async_result.ready():
+            if self._stopped.is_set():
+                raise RuntimeError("VerificationPool stopped")
+            async_result.wait(0.1)
+        return async_result.get()